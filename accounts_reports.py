@@ -1,15 +1,26 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTableWidget, QTableWidgetItem,
     QTabWidget, QComboBox, QPushButton, QGroupBox, QHeaderView, QDateEdit,
-    QSizePolicy, QScrollArea, QMessageBox, QInputDialog, QLineEdit, QCompleter, QDialog, QFormLayout, QDoubleSpinBox
+    QSizePolicy, QScrollArea, QMessageBox, QInputDialog, QLineEdit, QDialog, QFormLayout, QDoubleSpinBox, QFileDialog,
+    QTableView
 )
 from PyQt6.QtCore import QDate, Qt
 from PyQt6.QtGui import QTextDocument, QFontDatabase, QPageSize, QPageLayout, QColor
 from PyQt6.QtCore import QMarginsF
 from PyQt6.QtPrintSupport import QPrinter
 from database import Database
-from ui_factory import setup_professional_table, create_professional_table_item
+from period_close import PeriodClose
+from data_export import ExportDialog
+from receivables_aging import ReceivablesAging
+from sales_cube import SalesCube, SalesCubeThread, PivotModel
+from customer_segments import CustomerSegments, CustomerSegmentThread
+from customer_identity import CustomerDirectory, CustomerMergeDialog
+from customer_picker import CustomerPicker
+from document_store import DocumentStore
+from ui_factory import UITheme, setup_professional_table, create_professional_table_item
+import csv
 import os
+import time
 import sys
 import base64
 
@@ -18,6 +29,14 @@ class AccountsReports(QWidget):
     def __init__(self, db):
         super().__init__()
         self.db = db
+        self.period_close = PeriodClose(db)
+        self.receivables_aging = ReceivablesAging(db)
+        self.sales_cube = SalesCube(db)
+        self.cube_thread = None
+        self.segments = CustomerSegments(db)
+        self.segment_thread = None
+        self.customers = CustomerDirectory(db)
+        self.documents = DocumentStore(db)
         self.init_ui()
 
     def init_ui(self):
@@ -57,7 +76,13 @@ class AccountsReports(QWidget):
         # Title
         title = QLabel("Accounts & Financial Reports")
         title.setStyleSheet("font-size: 18pt; font-weight: bold; margin-bottom: 10px; color: #ffffff;")
-        layout.addWidget(title)
+        title_layout = QHBoxLayout()
+        title_layout.addWidget(title)
+        title_layout.addStretch()
+        export_btn = QPushButton("Export Data")
+        export_btn.clicked.connect(lambda: ExportDialog(self.db, self, "Sales Records").exec())
+        title_layout.addWidget(export_btn)
+        layout.addLayout(title_layout)
 
         self.tabs = QTabWidget()
         self.tabs.currentChanged.connect(self.on_tab_changed)
@@ -67,6 +92,9 @@ class AccountsReports(QWidget):
         self.profit_loss_tab()
         self.sales_records_tab()
         self.customer_history_tab()
+        self.receivables_aging_tab()
+        self.period_close_tab()
+        self.sales_pivot_tab()
 
         # Set the scroll area as the main widget
         main_layout = QVBoxLayout(self)
@@ -92,10 +120,7 @@ class AccountsReports(QWidget):
 
         # Customer filter
         filter_layout.addWidget(QLabel("Customer:"))
-        self.ledger_customer_combo = QComboBox()
-        self.ledger_customer_combo.setEditable(True)
-        self.ledger_customer_combo.addItem("All Customers", None)
-        self.load_customers_for_ledger()
+        self.ledger_customer_combo = CustomerPicker(self.db, "All Customers")
         filter_layout.addWidget(self.ledger_customer_combo)
 
         btn = QPushButton("Refresh")
@@ -125,6 +150,10 @@ class AccountsReports(QWidget):
         manual_btn.clicked.connect(self.add_manual_ledger_entry)
         manual_layout.addWidget(manual_btn)
 
+        merge_btn = QPushButton("Merge Duplicate Customers...")
+        merge_btn.clicked.connect(self.merge_duplicate_customers)
+        manual_layout.addWidget(merge_btn)
+
         print_btn = QPushButton("Print Customer Ledger")
         print_btn.clicked.connect(self.print_customer_ledger)
         manual_layout.addWidget(print_btn)
@@ -146,8 +175,14 @@ class AccountsReports(QWidget):
         elif tab_text == "Profit & Loss":
             self.load_profit_loss()
         elif tab_text == "Customer History":
-            # No load needed, as it's on demand
-            pass
+            # History loads on demand; bring segments up to date with new sales meanwhile
+            self.refresh_segments()
+        elif tab_text == "Receivables Aging":
+            self.load_receivables_aging()
+        elif tab_text == "Period Close":
+            self.load_periods()
+        elif tab_text == "Sales Pivot":
+            self.refresh_sales_cube()
 
     def record_payment_for_customer(self, customer_id, current_balance):
         """Record payment for a specific customer"""
@@ -197,6 +232,7 @@ class AccountsReports(QWidget):
 
         QMessageBox.information(self, "Success", f"Payment of Rs. {amount:.2f} recorded for {customer_name}.")
         self.load_combined_ledger()  # Refresh the ledger
+        self.load_receivables_aging()
 
     def add_manual_ledger_entry(self):
         """Add manual ledger entry for customers with existing balances"""
@@ -204,9 +240,18 @@ class AccountsReports(QWidget):
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.load_combined_ledger()  # Refresh after adding
 
+    def merge_duplicate_customers(self):
+        dialog = CustomerMergeDialog(self.db, self)
+        dialog.exec()
+        if dialog.merged:
+            # Merged sales now belong to other customers; the cube reloads them on its next refresh
+            self.sales_cube.reset()
+            self.load_customers()
+            self.load_combined_ledger()
+
     def print_customer_ledger(self):
         """Print ledger for selected customer"""
-        customer_id = self.ledger_customer_combo.currentData()
+        customer_id = self.ledger_customer_combo.customer_id()
         customer_name = self.ledger_customer_combo.currentText()
 
         if customer_id is None:
@@ -281,9 +326,7 @@ class AccountsReports(QWidget):
         # Customer selection
         customer_layout = QHBoxLayout()
         customer_layout.addWidget(QLabel("Select Customer:"))
-        self.history_customer_combo = QComboBox()
-        self.history_customer_combo.setEditable(True)
-        self.load_customers_for_history()
+        self.history_customer_combo = CustomerPicker(self.db, "Select Customer")
         customer_layout.addWidget(self.history_customer_combo)
 
         btn = QPushButton("Load History")
@@ -291,6 +334,11 @@ class AccountsReports(QWidget):
         customer_layout.addWidget(btn)
         layout.addLayout(customer_layout)
 
+        # RFM segment of the selected customer
+        self.history_segment_label = QLabel("")
+        self.history_segment_label.setStyleSheet("font-size: 11pt; color: #ffc107; margin: 5px 0;")
+        layout.addWidget(self.history_segment_label)
+
         # History table
         self.history_table = QTableWidget()
         setup_professional_table(self.history_table, ["Date", "Description", "Debit", "Credit", "Balance"], ['date', 'text', 'numeric', 'numeric', 'numeric'])
@@ -307,6 +355,124 @@ class AccountsReports(QWidget):
 
         self.tabs.addTab(tab, "Customer History")
 
+    def receivables_aging_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        # As-of date and actions
+        filter_group = QGroupBox("Aging As Of")
+        filter_layout = QHBoxLayout(filter_group)
+        filter_layout.addWidget(QLabel("Date:"))
+        self.aging_as_of = QDateEdit()
+        self.aging_as_of.setCalendarPopup(True)
+        self.aging_as_of.setDate(QDate.currentDate())
+        filter_layout.addWidget(self.aging_as_of)
+        btn = QPushButton("Refresh")
+        btn.clicked.connect(self.load_receivables_aging)
+        filter_layout.addWidget(btn)
+        filter_layout.addStretch()
+        export_btn = QPushButton("Export to CSV")
+        export_btn.clicked.connect(self.export_receivables_aging)
+        filter_layout.addWidget(export_btn)
+        layout.addWidget(filter_group)
+
+        # Aging table
+        self.aging_table = QTableWidget()
+        setup_professional_table(self.aging_table, ["Customer", "Phone", "0-30 Days", "31-60 Days", "61-90 Days", "90+ Days", "Total Due", "Action"],
+                                 ['text', 'text', 'numeric', 'numeric', 'numeric', 'numeric', 'numeric', 'action'])
+        self.aging_table.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        layout.addWidget(self.aging_table)
+
+        self.aging_total_label = QLabel("Total Receivable: Rs. 0.00")
+        self.aging_total_label.setStyleSheet("font-size: 14pt; font-weight: bold; color: #dc3545; margin-top: 10px;")
+        layout.addWidget(self.aging_total_label)
+
+        self.aging_rows = []
+        self.tabs.addTab(tab, "Receivables Aging")
+
+    def period_close_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        # Open period and close action
+        close_layout = QHBoxLayout()
+        self.open_period_label = QLabel()
+        self.open_period_label.setStyleSheet("font-size: 12pt; font-weight: bold; color: #ffffff;")
+        close_layout.addWidget(self.open_period_label)
+        close_layout.addStretch()
+        self.close_period_btn = QPushButton("Close Period")
+        self.close_period_btn.clicked.connect(self.close_next_period)
+        close_layout.addWidget(self.close_period_btn)
+        layout.addLayout(close_layout)
+
+        # Closed periods table
+        self.periods_table = QTableWidget()
+        setup_professional_table(self.periods_table, ["Period Start", "Period End", "Closed By", "Closed At", "Customers", "Products", "Expenses To Date", "Payroll To Date"],
+                                 ['date', 'date', 'text', 'date', 'numeric', 'numeric', 'numeric', 'numeric'])
+        self.periods_table.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        layout.addWidget(self.periods_table)
+
+        self.tabs.addTab(tab, "Period Close")
+
+    def sales_pivot_tab(self):
+        tab = QWidget()
+        layout = QVBoxLayout(tab)
+
+        # Pivot layout and filters
+        pivot_group = QGroupBox("Pivot")
+        pivot_layout = QHBoxLayout(pivot_group)
+        dimension_names = [name.title() for name in SalesCube.DIMENSIONS]
+        pivot_layout.addWidget(QLabel("Rows:"))
+        self.pivot_rows = QComboBox()
+        self.pivot_rows.addItems(dimension_names)
+        self.pivot_rows.setCurrentText("Category")
+        pivot_layout.addWidget(self.pivot_rows)
+        pivot_layout.addWidget(QLabel("Columns:"))
+        self.pivot_columns = QComboBox()
+        self.pivot_columns.addItems(["(None)"] + dimension_names)
+        self.pivot_columns.setCurrentText("Month")
+        pivot_layout.addWidget(self.pivot_columns)
+        pivot_layout.addWidget(QLabel("Measure:"))
+        self.pivot_measure = QComboBox()
+        self.pivot_measure.addItems(["Revenue", "Quantity", "Discount", "Lines"])
+        pivot_layout.addWidget(self.pivot_measure)
+        pivot_layout.addWidget(QLabel("Category:"))
+        self.pivot_category = QComboBox()
+        self.pivot_category.addItem("All Categories", None)
+        pivot_layout.addWidget(self.pivot_category)
+        pivot_layout.addWidget(QLabel("From:"))
+        self.pivot_from = self.date_edit(-12)
+        pivot_layout.addWidget(self.pivot_from)
+        pivot_layout.addWidget(QLabel("To:"))
+        self.pivot_to = self.date_edit(0)
+        pivot_layout.addWidget(self.pivot_to)
+        for combo in (self.pivot_rows, self.pivot_columns, self.pivot_measure, self.pivot_category):
+            combo.currentIndexChanged.connect(self.run_pivot)
+        for edit in (self.pivot_from, self.pivot_to):
+            edit.dateChanged.connect(self.run_pivot)
+        pivot_layout.addStretch()
+        export_btn = QPushButton("Export to CSV")
+        export_btn.clicked.connect(self.export_pivot)
+        pivot_layout.addWidget(export_btn)
+        layout.addWidget(pivot_group)
+
+        # Pivot table
+        self.pivot_model = PivotModel(self)
+        self.pivot_table = QTableView()
+        self.pivot_table.setModel(self.pivot_model)
+        self.pivot_table.setSortingEnabled(True)
+        self.pivot_table.setAlternatingRowColors(True)
+        self.pivot_table.verticalHeader().setVisible(False)
+        self.pivot_table.setStyleSheet(UITheme.TABLE_STYLE)
+        self.pivot_table.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.pivot_table.setMinimumHeight(400)
+        layout.addWidget(self.pivot_table)
+
+        self.pivot_status_label = QLabel("Open this tab to load sales.")
+        layout.addWidget(self.pivot_status_label)
+
+        self.tabs.addTab(tab, "Sales Pivot")
+
 
     # ================= HELPERS =================
     def date_edit(self, offset):
@@ -315,70 +481,183 @@ class AccountsReports(QWidget):
         d.setDate(QDate.currentDate().addMonths(offset))
         return d
 
+    # ================= RECEIVABLES AGING =================
+    def load_receivables_aging(self):
+        try:
+            self.aging_rows = self.receivables_aging.compute(self.aging_as_of.date().toString("yyyy-MM-dd"))
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to load receivables aging: {str(e)}")
+            return
+
+        self.aging_table.setRowCount(len(self.aging_rows))
+        totals = [0.0] * 5
+        for r, row in enumerate(self.aging_rows):
+            customer_id, name, phone = row[:3]
+            self.aging_table.setItem(r, 0, create_professional_table_item(name, 'text'))
+            self.aging_table.setItem(r, 1, create_professional_table_item(phone or "", 'text'))
+            for i, amount in enumerate(row[3:]):
+                totals[i] += amount
+                item = create_professional_table_item(amount, 'numeric')
+                # Anything over 90 days needs follow-up first
+                if i == 3 and amount > 0:
+                    item.setBackground(QColor(255, 100, 100))
+                    item.setForeground(QColor(255, 255, 255))
+                self.aging_table.setItem(r, 2 + i, item)
+            action_btn = QPushButton("Record Payment")
+            action_btn.clicked.connect(lambda _, cid=customer_id, bal=row[7]: self.record_payment_for_customer(cid, bal))
+            self.aging_table.setCellWidget(r, 7, action_btn)
+
+        self.aging_total_label.setText(
+            f"Total Receivable: Rs. {totals[4]:,.2f}  |  0-30: Rs. {totals[0]:,.2f}  |  31-60: Rs. {totals[1]:,.2f}  |  "
+            f"61-90: Rs. {totals[2]:,.2f}  |  90+: Rs. {totals[3]:,.2f}"
+        )
+
+    def export_receivables_aging(self):
+        as_of = self.aging_as_of.date().toString("yyyy-MM-dd")
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Receivables Aging", f"receivables_aging_{as_of}.csv", "CSV Files (*.csv)")
+        if not file_path:
+            return
+        try:
+            rows = self.receivables_aging.compute(as_of)
+            self.receivables_aging.export_to_csv(file_path, rows, as_of)
+            QMessageBox.information(self, "Success", f"Receivables aging exported to {file_path}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to export receivables aging: {str(e)}")
+
+    # ================= SALES PIVOT =================
+    def refresh_sales_cube(self):
+        """Load new sales into the cube in the background; the first load reads the whole sales history"""
+        if self.cube_thread and self.cube_thread.isRunning():
+            return
+        if not self.sales_cube.size:
+            self.pivot_status_label.setText("Loading sales...")
+        self.cube_thread = SalesCubeThread(self.sales_cube)
+        self.cube_thread.finished.connect(self.on_sales_cube_refreshed)
+        self.cube_thread.start()
+
+    def on_sales_cube_refreshed(self, success, message):
+        if not success:
+            self.pivot_status_label.setText(message)
+            return
+        selected = self.pivot_category.currentData()
+        self.pivot_category.blockSignals(True)
+        self.pivot_category.clear()
+        self.pivot_category.addItem("All Categories", None)
+        for category_id, name in sorted(self.sales_cube.category_names.items(), key=lambda item: item[1].lower()):
+            self.pivot_category.addItem(name, category_id)
+        self.pivot_category.setCurrentIndex(max(self.pivot_category.findData(selected), 0))
+        self.pivot_category.blockSignals(False)
+        self.run_pivot()
+
+    def run_pivot(self):
+        if not self.sales_cube.size or (self.cube_thread and self.cube_thread.isRunning()):
+            return
+        rows = self.pivot_rows.currentText().lower()
+        columns = self.pivot_columns.currentText().lower() if self.pivot_columns.currentIndex() > 0 else None
+        measure = self.pivot_measure.currentText().lower()
+        category = self.pivot_category.currentData()
+        started = time.perf_counter()
+        try:
+            result = self.sales_cube.pivot(
+                rows, columns, measure,
+                date_from=self.pivot_from.date().toPyDate(), date_to=self.pivot_to.date().toPyDate(),
+                filters={'category': [category]} if category is not None else None)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to run pivot: {str(e)}")
+            return
+        elapsed = (time.perf_counter() - started) * 1000
+        self.pivot_model.set_result(self.pivot_rows.currentText(), result, 2 if measure in ('revenue', 'discount') else 0)
+        self.pivot_table.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+        self.pivot_table.resizeColumnsToContents()
+        self.pivot_status_label.setText(
+            f"{len(result[0])} rows  |  Total: {result[3].sum():,.2f}  |  "
+            f"{self.sales_cube.size:,} line items in memory, answered in {elapsed:.0f} ms"
+        )
+
+    def export_pivot(self):
+        if not self.pivot_model.rowCount():
+            QMessageBox.warning(self, "Error", "Run a pivot before exporting.")
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Sales Pivot", "sales_pivot.csv", "CSV Files (*.csv)")
+        if not file_path:
+            return
+        try:
+            with open(file_path, 'w', newline='', encoding='utf-8') as f:
+                csv.writer(f).writerows(self.pivot_model.to_rows())
+            QMessageBox.information(self, "Success", f"Sales pivot exported to {file_path}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to export sales pivot: {str(e)}")
+
+    # ================= PERIOD CLOSE =================
+    def load_periods(self):
+        periods = self.period_close.get_periods()
+        self.periods_table.setRowCount(len(periods))
+        for r, row in enumerate(periods):
+            for c, value in enumerate(row[1:]):
+                col_type = ['date', 'date', 'text', 'date', 'numeric', 'numeric', 'numeric', 'numeric'][c]
+                self.periods_table.setItem(r, c, create_professional_table_item(value if value is not None else "", col_type))
+
+        open_from = self.period_close.open_from()
+        self.open_period_label.setText(f"Open period from: {open_from}" if open_from else "No periods closed yet")
+        next_period = self.period_close.next_period()
+        if next_period:
+            self.close_period_btn.setText(f"Close {QDate.fromString(next_period[0], 'yyyy-MM-dd').toString('MMMM yyyy')}")
+            self.close_period_btn.setEnabled(next_period[1] < QDate.currentDate().toString("yyyy-MM-dd"))
+        else:
+            self.close_period_btn.setText("Close Period")
+            self.close_period_btn.setEnabled(False)
+
+    def close_next_period(self):
+        next_period = self.period_close.next_period()
+        if not next_period:
+            return
+        reply = QMessageBox.question(
+            self, "Close Period",
+            f"Close the period {next_period[0]} to {next_period[1]}?\n\n"
+            "Balances will be snapshotted and entries dated in this period will be locked.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            closed_by = getattr(self.window(), 'current_user', None)
+            self.period_close.close_period(closed_by)
+            QMessageBox.information(self, "Success", f"Period ending {next_period[1]} closed.")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to close period: {str(e)}")
+        self.load_periods()
+
     # ================= DATABASE =================
     def load_customers(self):
-        conn = self.db.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM Customers ORDER BY name")
-        self.all_customers = cur.fetchall()
-        conn.close()
-        self.customer_combo.clear()
-        customer_names = [name for cid, name in self.all_customers]
-        self.customer_combo.addItems(customer_names)
-        # Set up completer for better search
-        completer = QCompleter(customer_names)
-        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        self.customer_combo.setCompleter(completer)
+        """Re-read every customer picker on the page, e.g. after customers were added or merged"""
+        self.load_customers_for_ledger()
+        self.load_customers_for_history()
 
     def load_customers_for_ledger(self):
-        conn = self.db.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM Customers ORDER BY name")
-        customers = cur.fetchall()
-        conn.close()
-        for cid, name in customers:
-            self.ledger_customer_combo.addItem(name, cid)
-        # Set up completer for better search
-        customer_names = [name for cid, name in customers]
-        completer = QCompleter(customer_names)
-        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
-        self.ledger_customer_combo.setCompleter(completer)
+        self.ledger_customer_combo.refresh()
 
     def load_customers_for_history(self):
-        conn = self.db.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM Customers ORDER BY name")
-        customers = cur.fetchall()
-        conn.close()
-        self.history_customer_combo.clear()
-        self.history_customer_combo.addItem("Select Customer", None)
-        for cid, name in customers:
-            self.history_customer_combo.addItem(name, cid)
-        # Set up completer for better search
-        customer_names = [name for cid, name in customers]
-        completer = QCompleter(customer_names)
-        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
-        self.history_customer_combo.setCompleter(completer)
+        self.history_customer_combo.refresh()
 
     def load_customer_history(self):
-        customer_id = self.history_customer_combo.currentData()
+        customer_id = self.history_customer_combo.customer_id()
         if customer_id is None:
             QMessageBox.warning(self, "Error", "Please select a customer.")
             return
 
+        # Start from the nearest closed period instead of scanning the whole ledger
+        open_from, opening_debit, opening_credit, opening_balance = self.period_close.customer_opening(customer_id)
         conn = self.db.get_connection()
         cur = conn.cursor()
         cur.execute("""
             SELECT date, description, debit, credit, balance
-            FROM CustomerLedger WHERE customer_id=? ORDER BY date
-        """, (customer_id,))
+            FROM CustomerLedger WHERE customer_id=? AND date >= ? ORDER BY date
+        """, (customer_id, open_from or ''))
         rows = cur.fetchall()
         conn.close()
+        if open_from:
+            rows.insert(0, (open_from, "Balance brought forward", opening_debit, opening_credit, opening_balance))
+        self.show_customer_segment(customer_id)
         self.history_table.setRowCount(len(rows))
         for r, row in enumerate(rows):
             self.history_table.setItem(r, 0, create_professional_table_item(row[0], 'date'))
@@ -387,8 +666,35 @@ class AccountsReports(QWidget):
             self.history_table.setItem(r, 3, create_professional_table_item(row[3], 'numeric'))
             self.history_table.setItem(r, 4, create_professional_table_item(row[4], 'numeric'))
 
+    def show_customer_segment(self, customer_id):
+        scores = self.segments.get(customer_id)
+        if not scores:
+            self.history_segment_label.setText("Segment: not scored yet")
+            return
+        last_purchase = scores['last_purchase'].strftime('%Y-%m-%d') if scores['last_purchase'] else "Never"
+        self.history_segment_label.setText(
+            f"Segment: {scores['segment']}  |  R {scores['r_score']}  F {scores['f_score']}  M {scores['m_score']}  |  "
+            f"Orders: {scores['orders']}  |  Net Spend: Rs. {scores['net_spend']:,.2f}  |  "
+            f"Lifetime Value: Rs. {scores['ltv']:,.2f}  |  Last Purchase: {last_purchase}"
+        )
+
+    def refresh_segments(self):
+        if self.segment_thread and self.segment_thread.isRunning():
+            return
+        self.segment_thread = CustomerSegmentThread(self.db)
+        self.segment_thread.finished.connect(self.on_segments_refreshed)
+        self.segment_thread.start()
+
+    def on_segments_refreshed(self, success, message):
+        if not success:
+            self.history_segment_label.setText(message)
+            return
+        customer_id = self.history_customer_combo.customer_id()
+        if customer_id is not None and self.history_segment_label.text():
+            self.show_customer_segment(customer_id)
+
     def print_customer_history(self):
-        customer_id = self.history_customer_combo.currentData()
+        customer_id = self.history_customer_combo.customer_id()
         customer_name = self.history_customer_combo.currentText()
         if customer_id is None:
             QMessageBox.warning(self, "Error", "Please select a customer.")
@@ -402,22 +708,21 @@ class AccountsReports(QWidget):
             return
 
         # Check if customer exists
-        cid = None
-        for id_val, name in self.all_customers:
-            if name == customer_name:
-                cid = id_val
-                break
+        conn = self.db.get_connection()
+        cid = self.customers.find(conn.cursor(), customer_name)
+        conn.close()
 
         # If not found, add new customer
         if cid is None:
+            match = self.customers.best_match(customer_name)
+            similar = f"\nThe closest existing customer is '{match.name}'." if match else ""
             reply = QMessageBox.question(self, "Add Customer",
-                                       f"Customer '{customer_name}' not found. Add as new customer?",
+                                       f"Customer '{customer_name}' not found.{similar} Add as new customer?",
                                        QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
             if reply == QMessageBox.StandardButton.Yes:
                 conn = self.db.get_connection()
                 cur = conn.cursor()
-                cur.execute("INSERT INTO Customers (name) VALUES (?)", (customer_name,))
-                cid = cur.lastrowid
+                cid = self.customers.create(cur, customer_name)
                 conn.commit()
                 conn.close()
                 # Reload customers
@@ -473,11 +778,9 @@ class AccountsReports(QWidget):
             return
 
         # Find customer ID
-        cid = None
-        for id_val, name in self.all_customers:
-            if name == customer_name:
-                cid = id_val
-                break
+        conn = self.db.get_connection()
+        cid = self.customers.find(conn.cursor(), customer_name)
+        conn.close()
 
         if cid is None:
             QMessageBox.warning(self, "Error", "Customer not found. Please load the ledger first to add the customer.")
@@ -522,14 +825,6 @@ class AccountsReports(QWidget):
     def load_profit_loss(self):
         conn = self.db.get_connection()
         cur = conn.cursor()
-        cur.execute("""
-            SELECT c.name, SUM(si.total_price)
-            FROM SalesItems si
-            JOIN Products p ON si.product_id=p.id
-            JOIN Categories c ON p.category_id=c.id
-            GROUP BY c.id
-        """)
-        sales = dict(cur.fetchall())
         cur.execute("""
             SELECT c.name, SUM(pb.cost_price*pb.quantity)
             FROM ProductBatches pb
@@ -539,14 +834,14 @@ class AccountsReports(QWidget):
         """)
         costs = dict(cur.fetchall())
 
-        # Calculate total expenses
-        cur.execute("SELECT SUM(amount) FROM PayrollTransactions")
-        payroll_expenses = cur.fetchone()[0] or 0
-        cur.execute("SELECT SUM(amount) FROM Expenses")
-        other_expenses = cur.fetchone()[0] or 0
+        conn.close()
+
+        # Sales and expenses come from the latest period snapshot plus the open period
+        sales = self.period_close.category_sales()
+        payroll_expenses = self.period_close.payroll_total()
+        other_expenses = self.period_close.expense_total()
         total_expenses = payroll_expenses + other_expenses
 
-        conn.close()
         cats = set(sales) | set(costs)
         self.reports_table.setRowCount(len(cats))
         gross_profit = 0
@@ -567,7 +862,7 @@ class AccountsReports(QWidget):
     def load_combined_ledger(self):
         f = self.ledger_from.date().toString("yyyy-MM-dd")
         t = self.ledger_to.date().toString("yyyy-MM-dd")
-        customer_filter = self.ledger_customer_combo.currentData()
+        customer_filter = self.ledger_customer_combo.customer_id()
 
         conn = self.db.get_connection()
         cur = conn.cursor()
@@ -703,7 +998,12 @@ class AccountsReports(QWidget):
             self.generate_bill(sale_id, items, sale[3], sale[0], sale[1], sale[2])
 
     def generate_bill(self, sale_id, items, total, sale_date, buyer_name, buyer_contact):
-        file = f"invoice_{sale_id}.pdf"
+        # Re-open the invoice rendered earlier unless the sale has changed since
+        stored = self.documents.prepare('invoice', sale_id, [items, total, sale_date, buyer_name, buyer_contact])
+        file = stored.path
+        if stored.cached:
+            os.startfile(file)
+            return
 
         # Load Noto Nastaliq Urdu font
         if getattr(sys, 'frozen', False):
@@ -880,12 +1180,18 @@ class AccountsReports(QWidget):
 
         # Print document to PDF
         doc.print(printer)
+        self.documents.register(stored)
 
         # Open the PDF
         os.startfile(file)
 
     def generate_payment_receipt(self, receipt_id, customer_name, previous_balance, amount_paid, remaining_balance, description):
-        filename = f"payment_receipt_{receipt_id}.pdf"
+        stored = self.documents.prepare('payment_receipt', receipt_id, [customer_name, previous_balance, amount_paid,
+                                                                       remaining_balance, description])
+        filename = stored.path
+        if stored.cached:
+            os.startfile(filename)
+            return
 
         # Load Urdu font
         if getattr(sys, 'frozen', False):
@@ -1095,13 +1401,13 @@ class AccountsReports(QWidget):
         printer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
 
         document.print(printer)
+        self.documents.register(stored)
 
         # Open the PDF
         os.startfile(filename)
 
     def generate_customer_ledger_pdf(self, customer_id, customer_name):
         """Generate PDF ledger for a specific customer"""
-        filename = f"customer_ledger_{customer_id}.pdf"
 
         # Load Urdu font
         if getattr(sys, 'frozen', False):
@@ -1129,26 +1435,35 @@ class AccountsReports(QWidget):
                 logo_data = base64.b64encode(f.read()).decode('utf-8')
                 logo_img_tag = f'<img src="data:image/png;base64,{logo_data}" alt="Logo" style="height: 60px; opacity: 0.2;">'
 
-        # Get customer ledger data
+        # Get customer ledger data for the open period, carried forward from the last closed period
+        open_from, opening_debit, opening_credit, snapshot_balance = self.period_close.customer_opening(customer_id)
         conn = self.db.get_connection()
         cur = conn.cursor()
         cur.execute("""
             SELECT date, description, debit, credit, balance
             FROM CustomerLedger
-            WHERE customer_id = ?
+            WHERE customer_id = ? AND date >= ?
             ORDER BY date
-        """, (customer_id,))
+        """, (customer_id, open_from or ''))
         ledger_entries = cur.fetchall()
         conn.close()
 
+        stored = self.documents.prepare('customer_ledger', customer_id, [customer_name, open_from, opening_debit,
+                                                                        opening_credit, snapshot_balance, ledger_entries])
+        filename = stored.path
+        if stored.cached:
+            os.startfile(filename)
+            return
+
         # Calculate totals
-        total_debit = sum(entry[2] or 0 for entry in ledger_entries)
-        total_credit = sum(entry[3] or 0 for entry in ledger_entries)
-        current_balance = ledger_entries[-1][4] if ledger_entries else 0.0
+        total_debit = opening_debit + sum(entry[2] or 0 for entry in ledger_entries)
+        total_credit = opening_credit + sum(entry[3] or 0 for entry in ledger_entries)
+        current_balance = ledger_entries[-1][4] if ledger_entries else snapshot_balance
+        period_text = f"From {open_from}" if open_from else "All Transactions"
 
         # Opening balance (balance of first entry minus debit or plus credit, but since ordered, first balance is after first transaction)
-        opening_balance = 0.0
-        if ledger_entries:
+        opening_balance = snapshot_balance
+        if ledger_entries and not open_from:
             first_entry = ledger_entries[0]
             if first_entry[2]:  # debit
                 opening_balance = first_entry[4] - first_entry[2]
@@ -1282,7 +1597,7 @@ class AccountsReports(QWidget):
         <div class="customer-info">
         <p><strong>Customer:</strong> {customer_name}</p>
         <p><strong>Statement Date:</strong> {QDate.currentDate().toString("yyyy-MM-dd")}</p>
-        <p><strong>Period:</strong> All Transactions</p>
+        <p><strong>Period:</strong> {period_text}</p>
         <p><strong>Opening Balance:</strong> Rs. {opening_balance:.2f}</p>
         </div>
 
@@ -1362,6 +1677,7 @@ class AccountsReports(QWidget):
         printer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
 
         document.print(printer)
+        self.documents.register(stored)
 
         # Open the PDF
         os.startfile(filename)
@@ -1371,6 +1687,7 @@ class ManualLedgerDialog(QDialog):
     def __init__(self, db, parent=None):
         super().__init__(parent)
         self.db = db
+        self.customers = CustomerDirectory(db)
         self.setWindowTitle("Add Manual Ledger Entry")
         self.setModal(True)
         self.setFixedSize(500, 300)
@@ -1380,9 +1697,7 @@ class ManualLedgerDialog(QDialog):
         form_layout = QFormLayout()
 
         # Customer selection
-        self.customer_combo = QComboBox()
-        self.customer_combo.setEditable(True)
-        self.load_customers()
+        self.customer_combo = CustomerPicker(self.db)
         form_layout.addRow("Customer:", self.customer_combo)
 
         # Date
@@ -1415,15 +1730,6 @@ class ManualLedgerDialog(QDialog):
 
         self.customer_combo.setFocus()
 
-    def load_customers(self):
-        conn = self.db.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT id, name FROM Customers ORDER BY name")
-        customers = cur.fetchall()
-        conn.close()
-        for cid, name in customers:
-            self.customer_combo.addItem(name, cid)
-
     def add_entry(self):
         customer_name = self.customer_combo.currentText().strip()
         if not customer_name:
@@ -1444,14 +1750,18 @@ class ManualLedgerDialog(QDialog):
 
         try:
             # Check if customer exists
-            cur.execute("SELECT id FROM Customers WHERE name = ?", (customer_name,))
-            existing = cur.fetchone()
-            if existing:
-                customer_id = existing[0]
-            else:
+            customer_id = self.customers.find(cur, customer_name)
+            if not customer_id:
+                match = self.customers.best_match(customer_name)
+                if match:
+                    reply = QMessageBox.question(self, "Existing Customer?",
+                                                 f"'{customer_name}' is not a customer yet. Add this entry to {match.name} instead?",
+                                                 QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+                    if reply == QMessageBox.StandardButton.Yes:
+                        customer_id = match.id
+            if not customer_id:
                 # Add new customer
-                cur.execute("INSERT INTO Customers (name) VALUES (?)", (customer_name,))
-                customer_id = cur.lastrowid
+                customer_id = self.customers.create(cur, customer_name)
                 # Reload customers in parent
                 if hasattr(self.parent(), 'load_customers_for_ledger'):
                     self.parent().load_customers_for_ledger()
@@ -0,0 +1,77 @@
+"""
+Barcode Assignment for Eagle Traders
+Internal EAN-13 codes for products that have no barcode
+"""
+
+import sqlite3
+from barcode_symbology import ean_check_digit
+
+
+class BarcodeAssigner:
+    """Assigns in-store EAN-13 codes: GS1 prefix 20 (restricted circulation, never issued to
+    manufacturers), the product id as a 10-digit serial, then the check digit.
+
+    A code is only taken if neither Products.barcode nor CustomBarcodes.code already holds it
+    (both indexed, custom codes uniquely), and a code a unique index still rejects is skipped;
+    a product whose own serial is taken gets the next free serial above all product ids instead.
+    """
+    PREFIX = "20"
+
+    def __init__(self, db):
+        self.db = db
+
+    @classmethod
+    def internal_code(cls, serial):
+        digits = f"{cls.PREFIX}{serial:010d}"
+        return digits + ean_check_digit(digits)
+
+    def missing(self):
+        """Number of products without a barcode"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM Products WHERE barcode IS NULL OR TRIM(barcode) = ''")
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def assign(self):
+        """Give every product without a barcode an unused internal EAN-13 in one transaction;
+        return the (product_id, name, code) rows assigned"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            # Hold the write lock so codes checked as free can't be taken before the commit
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT id, name FROM Products WHERE barcode IS NULL OR TRIM(barcode) = '' ORDER BY id")
+            products = cursor.fetchall()
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Products")
+            next_serial = cursor.fetchone()[0] + 1
+
+            def taken(code):
+                cursor.execute("""
+                    SELECT EXISTS(SELECT 1 FROM Products WHERE barcode = ?)
+                        OR EXISTS(SELECT 1 FROM CustomBarcodes WHERE code = ?)
+                """, (code, code))
+                return cursor.fetchone()[0]
+
+            assigned = []
+            for product_id, name in products:
+                code = self.internal_code(product_id)
+                while True:
+                    if not taken(code):
+                        try:
+                            # Written as we go, so later products see this code as taken
+                            cursor.execute("UPDATE Products SET barcode = ? WHERE id = ?", (code, product_id))
+                            break
+                        except sqlite3.IntegrityError:
+                            pass  # A unique index holds it after all; only this statement was undone
+                    code = self.internal_code(next_serial)
+                    next_serial += 1
+                assigned.append((product_id, name, code))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return assigned
@@ -3,12 +3,12 @@ from PyQt6.QtWidgets import (
     QLineEdit, QGroupBox, QFormLayout, QMessageBox, QSpinBox, QScrollArea,
     QTabWidget, QTableWidget, QTableWidgetItem, QInputDialog, QSizePolicy
 )
-from PyQt6.QtGui import QPixmap, QPainter, QFont
-from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QPainter
+from PyQt6.QtCore import Qt, QRect
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
-import barcode
-from barcode.writer import ImageWriter
-import io
+from barcode_symbology import render_sticker, paint_sticker
+from sticker_batch import StickerBatchDialog
+from barcode_assignment import BarcodeAssigner
 import sqlite3
 
 class BarcodeSticker(QWidget):
@@ -134,8 +134,44 @@ class BarcodeSticker(QWidget):
         self.print_btn.setEnabled(False)
         layout.addWidget(self.print_btn)
 
+        self.batch_print_btn = QPushButton("Batch Print Stickers...")
+        self.batch_print_btn.clicked.connect(self.open_batch_print)
+        layout.addWidget(self.batch_print_btn)
+
+        self.assign_barcodes_btn = QPushButton("Assign Missing Barcodes...")
+        self.assign_barcodes_btn.clicked.connect(self.assign_missing_barcodes)
+        layout.addWidget(self.assign_barcodes_btn)
+
         layout.addStretch()
 
+    def open_batch_print(self):
+        StickerBatchDialog(self.db, self).exec()
+
+    def assign_missing_barcodes(self):
+        assigner = BarcodeAssigner(self.db)
+        missing = assigner.missing()
+        if not missing:
+            QMessageBox.information(self, "Assign Barcodes", "Every product already has a barcode.")
+            return
+        reply = QMessageBox.question(self, "Assign Barcodes",
+                                     f"Assign internal EAN-13 barcodes to {missing} products without one?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            assigned = assigner.assign()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to assign barcodes: {str(e)}")
+            return
+
+        reply = QMessageBox.question(self, "Assign Barcodes",
+                                     f"Assigned {len(assigned)} barcodes. Print stickers for these products now?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply == QMessageBox.StandardButton.Yes:
+            dialog = StickerBatchDialog(self.db, self)
+            dialog.add_rows([(product_id, name, code, "", 1) for product_id, name, code in assigned])
+            dialog.exec()
+
     def create_saved_tab(self):
         saved_tab = QWidget()
         self.tab_widget.addTab(saved_tab, "Saved Configurations")
@@ -264,7 +300,7 @@ class BarcodeSticker(QWidget):
             self.load_custom_barcodes()
             self.load_custom_barcodes_for_combo()
         except sqlite3.IntegrityError:
-            QMessageBox.warning(self, "Error", "Barcode name already exists.")
+            QMessageBox.warning(self, "Error", "Barcode name or code already exists.")
         finally:
             conn.close()
 
@@ -310,7 +346,7 @@ class BarcodeSticker(QWidget):
             self.load_custom_barcodes()
             self.load_custom_barcodes_for_combo()
         except sqlite3.IntegrityError:
-            QMessageBox.warning(self, "Error", "Barcode name already exists.")
+            QMessageBox.warning(self, "Error", "Barcode name or code already exists.")
         finally:
             conn.close()
 
@@ -358,48 +394,16 @@ class BarcodeSticker(QWidget):
 
         barcode_data = code
 
-        try:
-            # Generate Code128 barcode
-            bc = barcode.get('code128', barcode_data, writer=ImageWriter())
-            fp = io.BytesIO()
-            bc.write(fp)
-            fp.seek(0)
-
-            barcode_pixmap = QPixmap()
-            barcode_pixmap.loadFromData(fp.getvalue())
-        except Exception as e:
-            QMessageBox.critical(self, "Barcode Error", f"Failed to generate barcode: {str(e)}")
-            return
-
         # Get sticker dimensions (use defaults)
         sticker_width = 300
         sticker_height = 150
+        sticker = (prod_name, barcode_data, f"Code: {barcode_data}")
 
-        # Create combined pixmap
-        combined_pixmap = QPixmap(sticker_width, sticker_height)
-        combined_pixmap.fill(Qt.GlobalColor.white)
-        painter = QPainter(combined_pixmap)
-        painter.setFont(QFont('Arial', 10))
-
-        # Draw text above
-        info_text = f"{prod_name}"
-        text_height = 20
-        painter.drawText(0, 0, sticker_width, text_height, Qt.AlignmentFlag.AlignCenter, info_text)
-
-        # Draw barcode
-        barcode_y = text_height + 5
-        barcode_max_height = int(sticker_height * 0.6)
-        scaled_barcode = barcode_pixmap.scaled(sticker_width - 20, barcode_max_height, Qt.AspectRatioMode.KeepAspectRatio)
-        barcode_x = (sticker_width - scaled_barcode.width()) // 2
-        painter.drawPixmap(barcode_x, barcode_y, scaled_barcode)
-
-        # Draw code below
-        manual_y = barcode_y + scaled_barcode.height() + 10
-        painter.setFont(QFont('Arial', 8))
-        manual_text = f"Code: {barcode_data}"
-        painter.drawText(0, manual_y, sticker_width, 15, Qt.AlignmentFlag.AlignCenter, manual_text)
-
-        painter.end()
+        try:
+            combined_pixmap = render_sticker(sticker_width, sticker_height, *sticker)
+        except ValueError as e:
+            QMessageBox.critical(self, "Barcode Error", f"Failed to generate barcode: {str(e)}")
+            return
 
         self.barcode_label.setPixmap(combined_pixmap)
         self.print_btn.setEnabled(True)
@@ -408,6 +412,7 @@ class BarcodeSticker(QWidget):
         self.weight = ""
         self.expiry = ""
         self.combined_pixmap = combined_pixmap
+        self.sticker = sticker
 
         # Switch to generate tab to show
         self.tab_widget.setCurrentIndex(0)
@@ -502,48 +507,16 @@ class BarcodeSticker(QWidget):
         else:
             barcode_data = selected_code
 
-        try:
-            # Generate Code128 barcode
-            bc = barcode.get('code128', barcode_data, writer=ImageWriter())
-            fp = io.BytesIO()
-            bc.write(fp)
-            fp.seek(0)
-
-            barcode_pixmap = QPixmap()
-            barcode_pixmap.loadFromData(fp.getvalue())
-        except Exception as e:
-            QMessageBox.critical(self, "Barcode Error", f"Failed to generate barcode: {str(e)}")
-            return
-
         # Get sticker dimensions
         sticker_width = self.width_spin.value()
         sticker_height = self.height_spin.value()
+        sticker = (f"{prod_name} | Expiry: {expiry} | Weight: {weight}", barcode_data, f"Code: {barcode_data}")
 
-        # Create a combined pixmap with adjustable size
-        combined_pixmap = QPixmap(sticker_width, sticker_height)
-        combined_pixmap.fill(Qt.GlobalColor.white)
-        painter = QPainter(combined_pixmap)
-        painter.setFont(QFont('Arial', 10))
-
-        # Draw text above in one line
-        info_text = f"{prod_name} | Expiry: {expiry} | Weight: {weight}"
-        text_height = 20
-        painter.drawText(0, 0, sticker_width, text_height, Qt.AlignmentFlag.AlignCenter, info_text)
-
-        # Draw barcode in middle
-        barcode_y = text_height + 5
-        barcode_max_height = int(sticker_height * 0.6)  # 60% of height for barcode
-        scaled_barcode = barcode_pixmap.scaled(sticker_width - 20, barcode_max_height, Qt.AspectRatioMode.KeepAspectRatio)
-        barcode_x = (sticker_width - scaled_barcode.width()) // 2
-        painter.drawPixmap(barcode_x, barcode_y, scaled_barcode)
-
-        # Draw manual code below barcode
-        manual_y = barcode_y + scaled_barcode.height() + 10
-        painter.setFont(QFont('Arial', 8))
-        manual_text = f"Code: {barcode_data}"
-        painter.drawText(0, manual_y, sticker_width, 15, Qt.AlignmentFlag.AlignCenter, manual_text)
-
-        painter.end()
+        try:
+            combined_pixmap = render_sticker(sticker_width, sticker_height, *sticker)
+        except ValueError as e:
+            QMessageBox.critical(self, "Barcode Error", f"Failed to generate barcode: {str(e)}")
+            return
 
         self.barcode_label.setPixmap(combined_pixmap)
 
@@ -553,6 +526,7 @@ class BarcodeSticker(QWidget):
         self.weight = weight
         self.expiry = expiry
         self.combined_pixmap = combined_pixmap
+        self.sticker = sticker
 
     def save_configuration(self):
         name, ok = QInputDialog.getText(self, "Save Configuration", "Enter configuration name:")
@@ -650,12 +624,16 @@ class BarcodeSticker(QWidget):
         if not hasattr(self, 'combined_pixmap'):
             return
 
-        printer = QPrinter()
+        printer = QPrinter(QPrinter.PrinterMode.HighResolution)
         dialog = QPrintDialog(printer, self)
         if dialog.exec() == QPrintDialog.DialogCode.Accepted:
+            # Repaint at the printer's own resolution instead of scaling the screen preview,
+            # so every bar lands on whole printer dots
+            scale = printer.resolution() / self.logicalDpiX()
+            rect = QRect(0, 0, round(self.combined_pixmap.width() * scale), round(self.combined_pixmap.height() * scale))
             painter = QPainter(printer)
-
-            # Draw the combined pixmap at actual size
-            painter.drawPixmap(0, 0, self.combined_pixmap)
-
-            painter.end()
\ No newline at end of file
+            module = paint_sticker(painter, rect, *self.sticker)
+            painter.end()
+            if module < 1:
+                QMessageBox.warning(self, "Error", "The barcode is too long for this sticker width and may not scan. "
+                                                   "Use a wider sticker or a shorter code.")
@@ -0,0 +1,397 @@
+"""
+Barcode Symbology for Eagle Traders
+Code 128 (A/B/C) and EAN-13/UPC-A encoders painted straight onto a QPainter at device resolution
+"""
+
+import itertools
+from collections import OrderedDict
+
+from PyQt6.QtGui import QPainter, QPixmap, QFont, QColor, QImage
+from PyQt6.QtCore import Qt, QRect, QRectF
+
+# Bar/space widths of Code 128 values 0-105; the stop pattern has an extra bar
+CODE128_WIDTHS = (
+    "212222 222122 222221 121223 121322 131222 122213 122312 132212 221213 "
+    "221312 231212 112232 122132 122231 113222 123122 123221 223211 221132 "
+    "221231 213212 223112 312131 311222 321122 321221 312212 322112 322211 "
+    "212123 212321 232121 111323 131123 131321 112313 132113 132311 211313 "
+    "231113 231311 112133 112331 132131 113123 113321 133121 313121 211331 "
+    "231131 213113 213311 213131 311123 311321 331121 312113 312311 332111 "
+    "314111 221411 431111 111224 111422 121124 121421 141122 141221 112214 "
+    "112412 122114 122411 142112 142211 241211 221114 413111 241112 134111 "
+    "111242 121142 121241 114212 124112 124211 411212 421112 421211 212141 "
+    "214121 412121 111143 111341 131141 114113 114311 411113 411311 113141 "
+    "114131 311141 411131 211412 211214 211232"
+).split()
+CODE128_STOP = "2331112"
+SHIFT, CODE_C, CODE_B, CODE_A = 98, 99, 100, 101
+START = {'A': 103, 'B': 104, 'C': 105}
+
+
+def widths_to_modules(widths):
+    """'2122' -> '1101': alternating bar and space runs starting with a bar"""
+    return "".join(("1" if i % 2 == 0 else "0") * int(w) for i, w in enumerate(widths))
+
+
+CODE128_PATTERNS = [widths_to_modules(w) for w in CODE128_WIDTHS]
+CODE128_STOP_PATTERN = widths_to_modules(CODE128_STOP)
+
+EAN_L = ["0001101", "0011001", "0010011", "0111101", "0100011",
+         "0110001", "0101111", "0111011", "0110111", "0001011"]
+EAN_R = ["".join("1" if m == "0" else "0" for m in code) for code in EAN_L]
+EAN_G = [code[::-1] for code in EAN_R]
+EAN_PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG",
+              "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+# Module ranges of the start, centre and end guards, drawn taller than the data bars
+EAN_GUARDS = ((0, 3), (45, 50), (92, 95))
+
+
+def _code128_value(char, code_set):
+    """Symbol value of a character in code set A or B, or None if the set can't encode it"""
+    o = ord(char)
+    if code_set == 'A' and o < 96:
+        return o + 64 if o < 32 else o - 32
+    if code_set == 'B' and 32 <= o < 128:
+        return o - 32
+    return None
+
+
+def encode_code128(data):
+    """Module string for data, choosing code sets A/B/C to give the fewest symbols.
+
+    Works backwards over the data keeping, for each position and code set, the cheapest way
+    to finish: encode in the current set, SHIFT one character between A and B, or switch set.
+    """
+    if not data:
+        raise ValueError("Nothing to encode")
+    if any(ord(c) > 127 for c in data):
+        raise ValueError("Code 128 only encodes ASCII characters")
+
+    n = len(data)
+    inf = float('inf')
+    # direct[i][s]: cheapest finish from i encoding data[i] in set s; best[i][s] also allows switching first
+    direct = [None] * n
+    best = [None] * n + [dict.fromkeys('ABC', (0, None))]
+    for i in range(n - 1, -1, -1):
+        here = {}
+        for s in 'AB':
+            options = []
+            if _code128_value(data[i], s) is not None:
+                options.append((1 + best[i + 1][s][0], ('char', s)))
+            other = 'B' if s == 'A' else 'A'
+            if _code128_value(data[i], other) is not None:
+                options.append((2 + best[i + 1][s][0], ('shift', other)))
+            here[s] = min(options, default=(inf, None))
+        pair = data[i:i + 2]
+        here['C'] = (1 + best[i + 2]['C'][0], ('pair', 'C')) if len(pair) == 2 and pair.isdigit() else (inf, None)
+        direct[i] = here
+        best[i] = {s: min([here[s]] + [(1 + here[t][0], ('switch', t)) for t in 'BCA' if t != s],
+                          key=lambda option: option[0])
+                   for s in 'ABC'}
+
+    code_set = min('CBA', key=lambda s: direct[0][s][0])  # ties prefer C, then B
+    values = [START[code_set]]
+    i = 0
+    while i < n:
+        action, target = best[i][code_set][1]
+        if action == 'switch':
+            values.append({'A': CODE_A, 'B': CODE_B, 'C': CODE_C}[target])
+            code_set = target
+            action, target = direct[i][code_set][1]
+        if action == 'pair':
+            values.append(int(data[i:i + 2]))
+            i += 2
+        elif action == 'shift':
+            values.extend([SHIFT, _code128_value(data[i], target)])
+            i += 1
+        else:
+            values.append(_code128_value(data[i], code_set))
+            i += 1
+
+    checksum = (values[0] + sum(position * value for position, value in enumerate(values[1:], 1))) % 103
+    values.append(checksum)
+    return "".join(CODE128_PATTERNS[value] for value in values) + CODE128_STOP_PATTERN
+
+
+def ean_check_digit(digits):
+    """Check digit for the first 12 digits of an EAN-13 (or 11 of a UPC-A, padded with a leading 0)"""
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits.zfill(12)))
+    return str((10 - total % 10) % 10)
+
+
+def encode_ean13(digits):
+    """Module string for a 12 or 13 digit EAN-13; a 13th digit must be the correct check digit"""
+    if not digits.isdigit() or len(digits) not in (12, 13):
+        raise ValueError("EAN-13 needs 12 or 13 digits")
+    check = ean_check_digit(digits[:12])
+    if len(digits) == 13 and digits[12] != check:
+        raise ValueError(f"Invalid EAN-13 check digit (expected {check})")
+    digits = digits[:12] + check
+    parity = EAN_PARITY[int(digits[0])]
+    left = "".join((EAN_L if p == 'L' else EAN_G)[int(d)] for p, d in zip(parity, digits[1:7]))
+    right = "".join(EAN_R[int(d)] for d in digits[7:])
+    return "101" + left + "01010" + right + "101"
+
+
+def encode_upca(digits):
+    """UPC-A (11 or 12 digits) is EAN-13 with a leading zero, so the bars are identical"""
+    if not digits.isdigit() or len(digits) not in (11, 12):
+        raise ValueError("UPC-A needs 11 or 12 digits")
+    return encode_ean13("0" + digits)
+
+
+def detect_symbology(data):
+    """EAN-13 or UPC-A when data is one with a valid check digit, otherwise Code 128"""
+    if data.isdigit():
+        if len(data) == 13 and ean_check_digit(data[:12]) == data[12]:
+            return 'ean13'
+        if len(data) == 12 and ean_check_digit(data[:11]) == data[11]:
+            return 'upca'
+    return 'code128'
+
+
+def encode(data, symbology='auto'):
+    """(symbology, modules) for data; symbology is 'auto', 'code128', 'ean13' or 'upca'"""
+    if symbology == 'auto':
+        symbology = detect_symbology(data)
+    encoder = {'code128': encode_code128, 'ean13': encode_ean13, 'upca': encode_upca}[symbology]
+    return symbology, encoder(data)
+
+
+def paint_barcode(painter, rect, data, symbology='auto', quiet_modules=10):
+    """Paint data's bars centred in rect (device pixels) and return the module width used.
+
+    Each module is a whole number of device pixels so every bar has crisp edges and the
+    bar/space ratios survive printing. If even one pixel per module doesn't fit, modules are
+    drawn fractionally so a preview still shows something, and the returned width is below 1.
+    """
+    symbology, modules = encode(data, symbology)
+    rect = QRect(rect) if isinstance(rect, QRect) else rect.toRect()
+    total = len(modules) + 2 * quiet_modules
+    module = rect.width() // total
+    if module < 1:
+        module = rect.width() / total
+    x0 = rect.left() + (rect.width() - len(modules) * module) / 2
+    if module >= 1:
+        x0 = int(x0)
+    guard_extra = int(rect.height() * 0.08) if symbology != 'code128' else 0
+    bar_height = rect.height() - guard_extra
+    guards = EAN_GUARDS if symbology != 'code128' else ()
+
+    painter.save()
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing, False)
+    black = QColor(0, 0, 0)
+    position = 0
+    for bit, run in itertools.groupby(modules):
+        width = len(list(run))
+        if bit == "1":
+            tall = any(start <= position < end for start, end in guards)
+            height = bar_height + guard_extra if tall else bar_height
+            if isinstance(module, int):
+                painter.fillRect(QRect(x0 + position * module, rect.top(), width * module, height), black)
+            else:
+                painter.fillRect(QRectF(x0 + position * module, rect.top(), width * module, height), black)
+        position += width
+    painter.restore()
+    return module
+
+
+class BarcodeCache:
+    """LRU cache of rendered bar images keyed on (data, width, height, symbology).
+
+    A batch of stickers repeats the same few codes many times over; with the bars cached each
+    repeat is a single image blit. Not shared between threads: each worker keeps its own.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, data, width, height, symbology='auto'):
+        """(image, module width) of the bars for data in a width x height box"""
+        key = (data, width, height, symbology)
+        if key in self.images:
+            self.hits += 1
+            self.images.move_to_end(key)
+            return self.images[key]
+        self.misses += 1
+        image = QImage(width, height, QImage.Format.Format_Grayscale8)
+        image.fill(Qt.GlobalColor.white)
+        painter = QPainter(image)
+        module = paint_barcode(painter, QRect(0, 0, width, height), data, symbology)
+        painter.end()
+        self.images[key] = (image, module)
+        if len(self.images) > self.maxsize:
+            self.images.popitem(last=False)
+        return image, module
+
+
+def paint_sticker(painter, rect, title, data, caption=None, symbology='auto', cache=None):
+    """Sticker layout: title line, barcode over 60% of the height, then a caption line.
+
+    rect is in device pixels; fonts are sized from the sticker height so the same layout
+    works on a screen pixmap and directly on a 203/300 dpi label printer. With a
+    BarcodeCache the bars are drawn from it (the painter must not be scaling).
+    """
+    painter.save()
+    painter.fillRect(rect, QColor(255, 255, 255))
+    painter.setPen(QColor(0, 0, 0))
+    text_height = max(int(rect.height() * 0.13), 10)
+    font = QFont('Arial')
+    font.setPixelSize(max(int(text_height * 0.8), 8))
+    painter.setFont(font)
+    painter.drawText(QRect(rect.left(), rect.top(), rect.width(), text_height), Qt.AlignmentFlag.AlignCenter, title)
+
+    barcode_top = rect.top() + text_height + int(rect.height() * 0.03)
+    barcode_height = int(rect.height() * 0.6)
+    margin = int(rect.width() * 0.03)
+    barcode_rect = QRect(rect.left() + margin, barcode_top, rect.width() - 2 * margin, barcode_height)
+    if cache is not None:
+        image, module = cache.get(data, barcode_rect.width(), barcode_rect.height(), symbology)
+        painter.drawImage(barcode_rect.topLeft(), image)
+    else:
+        module = paint_barcode(painter, barcode_rect, data, symbology)
+
+    caption_top = barcode_top + barcode_height + int(rect.height() * 0.03)
+    font.setPixelSize(max(int(text_height * 0.65), 7))
+    painter.setFont(font)
+    painter.drawText(QRect(rect.left(), caption_top, rect.width(), rect.bottom() - caption_top),
+                     Qt.AlignmentFlag.AlignHCenter | Qt.AlignmentFlag.AlignTop,
+                     caption if caption is not None else data)
+    painter.restore()
+    return module
+
+
+def render_sticker(width, height, title, data, caption=None, symbology='auto'):
+    """Sticker as a width x height pixmap (for on-screen preview)"""
+    pixmap = QPixmap(width, height)
+    pixmap.fill(Qt.GlobalColor.white)
+    painter = QPainter(pixmap)
+    paint_sticker(painter, QRect(0, 0, width, height), title, data, caption, symbology)
+    painter.end()
+    return pixmap
+
+
+def decode_image(image, row=None):
+    """Read back the barcode crossing one pixel row of a rendered QImage, as a scanner would.
+
+    Used to verify rendered stickers: thresholds the row, measures bar and space runs,
+    takes the narrowest as one module and decodes Code 128 or EAN-13. Returns
+    (symbology, text), or raises ValueError if the row doesn't hold a valid symbol.
+    """
+    image = image.convertToFormat(QImage.Format.Format_Grayscale8)
+    y = image.height() // 2 if row is None else row
+    line = image.constScanLine(y)
+    line.setsize(image.bytesPerLine())
+    pixels = bytes(line)[:image.width()]
+    bits = "".join("1" if p < 128 else "0" for p in pixels).strip("0")
+    runs = [(bit, len(list(run))) for bit, run in itertools.groupby(bits)]
+    if not runs:
+        raise ValueError("No bars found")
+    unit = min(length for _, length in runs)
+    modules = "".join(bit * round(length / unit) for bit, length in runs)
+
+    if len(modules) == 95 and modules.startswith("101") and modules[45:50] == "01010":
+        return 'ean13', _decode_ean13(modules)
+    return 'code128', _decode_code128(modules)
+
+
+def _decode_ean13(modules):
+    parity, digits = "", ""
+    for i in range(6):
+        code = modules[3 + i * 7:10 + i * 7]
+        if code in EAN_L:
+            parity, digits = parity + "L", digits + str(EAN_L.index(code))
+        elif code in EAN_G:
+            parity, digits = parity + "G", digits + str(EAN_G.index(code))
+        else:
+            raise ValueError("Unreadable EAN-13 digit")
+    for i in range(6):
+        code = modules[50 + i * 7:57 + i * 7]
+        if code not in EAN_R:
+            raise ValueError("Unreadable EAN-13 digit")
+        digits += str(EAN_R.index(code))
+    if parity not in EAN_PARITY:
+        raise ValueError("Invalid EAN-13 parity")
+    digits = str(EAN_PARITY.index(parity)) + digits
+    if ean_check_digit(digits[:12]) != digits[12]:
+        raise ValueError("EAN-13 check digit mismatch")
+    return digits
+
+
+def _decode_code128(modules):
+    if not modules.endswith(CODE128_STOP_PATTERN) or (len(modules) - 13) % 11:
+        raise ValueError("Not a Code 128 symbol")
+    try:
+        values = [CODE128_PATTERNS.index(modules[i:i + 11]) for i in range(0, len(modules) - 13, 11)]
+    except ValueError:
+        raise ValueError("Unreadable Code 128 symbol")
+    if len(values) < 3 or values[0] not in START.values():
+        raise ValueError("Missing Code 128 start")
+    *values, checksum = values
+    if (values[0] + sum(p * v for p, v in enumerate(values[1:], 1))) % 103 != checksum:
+        raise ValueError("Code 128 checksum mismatch")
+
+    code_set = {v: k for k, v in START.items()}[values[0]]
+    text, shifted = "", None
+    for value in values[1:]:
+        current = shifted or code_set
+        shifted = None
+        if current == 'C' and value < 100:
+            text += f"{value:02d}"
+        elif value == CODE_C:
+            code_set = 'C'
+        elif value == CODE_B and current != 'B':
+            code_set = 'B'
+        elif value == CODE_A and current != 'A':
+            code_set = 'A'
+        elif value == SHIFT and current in 'AB':
+            shifted = 'B' if current == 'A' else 'A'
+        elif current == 'A':
+            text += chr(value - 64 if value >= 64 else value + 32)
+        else:
+            text += chr(value + 32)
+    return text
+
+
+if __name__ == '__main__':
+    # Benchmark and scan check: python barcode_symbology.py
+    import sys
+    import time
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    samples = ["Sugar 1kg-000042", "4006381333931", "036000291452", "12345678901234", "ab\tCD12345xyz"]
+    # (name, width, height) in device pixels: the default on-screen sticker, and 203/300 dpi labels
+    sizes = [("Screen 300x150", 300, 150), ("50x25 mm @ 203 dpi", 400, 200), ("38x25 mm @ 203 dpi", 304, 200),
+             ("50x25 mm @ 300 dpi", 591, 295), ("100x50 mm @ 300 dpi", 1181, 591)]
+
+    failures = 0
+    for name, width, height in sizes:
+        for data in samples:
+            image = QImage(width, height, QImage.Format.Format_RGB32)
+            image.fill(Qt.GlobalColor.white)
+            painter = QPainter(image)
+            module = paint_sticker(painter, QRect(0, 0, width, height), "Eagle Traders", data)
+            painter.end()
+            row = int(height * 0.13) + int(height * 0.03) + int(height * 0.3)
+            try:
+                symbology, text = decode_image(image, row)
+                ok = text == (data if symbology != 'ean13' or len(data) == 13 else "0" + data)
+            except ValueError as e:
+                ok, symbology, text = False, "-", str(e)
+            failures += not ok
+            print(f"{name:22} {data!r:20} {symbology:8} module={module if isinstance(module, int) else round(module, 2)}px "
+                  f"{'OK' if ok else 'FAILED: ' + text}")
+
+    count = 2000
+    image = QImage(400, 200, QImage.Format.Format_RGB32)
+    started = time.perf_counter()
+    for i in range(count):
+        painter = QPainter(image)
+        paint_sticker(painter, QRect(0, 0, 400, 200), f"Product {i}", f"PRD-{i:08d}")
+        painter.end()
+    elapsed = time.perf_counter() - started
+    print(f"{count / elapsed:,.0f} stickers/s (50x25 mm at 203 dpi), {failures} scan failures")
@@ -0,0 +1,75 @@
+"""
+Batch Expiry for Eagle Traders
+Finds batches expiring within a window and the stock value tied up in them
+"""
+
+import calendar
+import datetime
+
+
+def expiry_key(day):
+    """Sortable key of the month a date falls in, matching ProductBatches.expiry_key (yyyymm)"""
+    return day.year * 100 + day.month
+
+
+class BatchExpiry:
+    """Batches expire at the end of their expiry month"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def expiring(self, within_days=30, as_of=None):
+        """Return batches with stock expiring within within_days of as_of (already expired ones included).
+
+        Rows are (batch_id, product_id, product, batch_number, expiry 'MM/YYYY', days_left, quantity, value),
+        soonest first. One range scan of the expiry_key index covers the whole batch table.
+        """
+        today = as_of or datetime.date.today()
+        cutoff = expiry_key(today + datetime.timedelta(days=within_days))
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT pb.id, pb.product_id, p.name, pb.batch_number, pb.expiry_month, pb.expiry_year,
+                   pb.quantity, pb.quantity * COALESCE(pb.cost_price, p.unit_price, 0)
+            FROM ProductBatches pb
+            JOIN Products p ON p.id = pb.product_id
+            WHERE pb.expiry_key <= ? AND pb.quantity > 0
+            ORDER BY pb.expiry_key, p.name
+        """, (cutoff,))
+        rows = cursor.fetchall()
+        conn.close()
+
+        batches = []
+        for batch_id, product_id, name, batch_number, month, year, quantity, value in rows:
+            month_end = datetime.date(year, month, calendar.monthrange(year, month)[1])
+            batches.append((batch_id, product_id, name, batch_number, f"{month:02d}/{year}",
+                            (month_end - today).days, quantity, value or 0))
+        # Whole months are fetched; drop the tail of the cutoff month that falls outside the window
+        return [batch for batch in batches if batch[5] <= within_days]
+
+
+if __name__ == '__main__':
+    # Benchmark: 500k batches
+    import os
+    import random
+    import tempfile
+    import time
+    from database import Database
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'expiry_bench.db'))
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO Products (id, name, unit_price) VALUES (?, ?, 100)",
+                     [(i, f"Product {i}") for i in range(1, 50001)])
+    year = datetime.date.today().year
+    conn.executemany("""
+        INSERT INTO ProductBatches (product_id, batch_number, quantity, expiry_month, expiry_year, cost_price)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [(i % 50000 + 1, f"B{i}", random.randint(0, 50), random.randint(1, 12), random.randint(year, year + 4),
+           random.randint(50, 500)) for i in range(500000)])
+    conn.commit()
+    conn.close()
+
+    started = time.perf_counter()
+    batches = BatchExpiry(db).expiring(30)
+    print(f"{len(batches)} batches expiring within 30 days, value Rs. {sum(b[7] for b in batches):,.2f}, "
+          f"found in {time.perf_counter() - started:.3f}s")
@@ -0,0 +1,426 @@
+"""
+Customer Identity for Eagle Traders
+Normalised name and phone keys for customer lookup, fuzzy suggestions and merging duplicate customers
+"""
+
+import collections
+import difflib
+import heapq
+import re
+import unicodedata
+
+import numpy as np
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTreeWidget, QTreeWidgetItem, QMessageBox
+)
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QFont
+
+Suggestion = collections.namedtuple('Suggestion', 'id name phone score')
+
+
+def name_key(name):
+    """Case-folded name with punctuation dropped and whitespace collapsed: ' Ali  Khan.' -> 'ali khan'"""
+    name = unicodedata.normalize('NFKC', name or "").casefold()
+    return " ".join(re.sub(r"[\W_]+", " ", name).split())
+
+
+def phone_key(phone):
+    """Subscriber digits of a phone number, so 0300-1234567, +92 300 1234567 and 00923001234567 agree;
+    None when there are too few digits to identify anyone"""
+    digits = re.sub(r"\D", "", phone or "")
+    if digits.startswith("00"):
+        digits = digits[2:]
+    if digits.startswith("92") and len(digits) == 12:
+        digits = digits[2:]
+    elif digits.startswith("0") and len(digits) == 11:
+        digits = digits[1:]
+    return digits if len(digits) >= 7 else None
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CustomerDirectory:
+    """Customer lookup by normalised name_key / phone_key instead of exact name.
+
+    find() and create() are single lookups on the indexed keys, so "Ali Khan " and "ali khan"
+    are the same customer. suggest() ranks near matches for typos: names sharing the typed
+    prefix come straight off the name_key index, the rest from an in-memory trigram index that
+    only scores customers sharing a trigram with the query, re-ranked with difflib. The
+    trigram index is rebuilt when a customer is added or a suggested one has been merged away.
+    """
+    # Names scoring below this aren't worth suggesting at all
+    MIN_SCORE = 0.5
+    # A suggestion this close is offered as "did you mean" before creating a new customer
+    SIMILAR_SCORE = 0.8
+
+    def __init__(self, db):
+        self.db = db
+        self.signature = None
+        self.ids = []
+        self.names = []
+        self.phones = []
+        self.keys = []
+        self.positions = {}  # id -> position in ids
+        self.gram_counts = np.zeros(0, dtype=np.int32)
+        self.postings = {}  # trigram -> array of positions in ids
+
+    def find(self, cursor, name):
+        """Id of the oldest customer with this name's key, or None"""
+        key = name_key(name)
+        if not key:
+            return None
+        cursor.execute("SELECT id FROM Customers WHERE name_key = ? ORDER BY id LIMIT 1", (key,))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def create(self, cursor, name, phone=None):
+        cursor.execute("INSERT INTO Customers (name, phone, name_key, phone_key) VALUES (?, ?, ?, ?)",
+                       (name, phone, name_key(name), phone_key(phone)))
+        return cursor.lastrowid
+
+    def load(self, cursor):
+        cursor.execute("SELECT MAX(id) FROM Customers")
+        signature = cursor.fetchone()[0]
+        if signature == self.signature:
+            return
+        cursor.execute("SELECT id, name, COALESCE(phone, ''), name_key FROM Customers WHERE name_key != ''")
+        rows = cursor.fetchall()
+        self.ids = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.phones = [row[2] for row in rows]
+        self.keys = [row[3] for row in rows]
+        self.positions = {customer_id: position for position, customer_id in enumerate(self.ids)}
+        counts = []
+        postings = collections.defaultdict(list)
+        for position, key in enumerate(self.keys):
+            grams = trigrams(key)
+            counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+        self.gram_counts = np.array(counts, dtype=np.int32)
+        self.postings = {gram: np.array(positions, dtype=np.int32) for gram, positions in postings.items()}
+        self.signature = signature
+
+    def suggest(self, text, phone=None, limit=8):
+        """Customers most like a typed name (and phone), best first, as Suggestions scored 0..1"""
+        key = name_key(text)
+        if not key and not phone_key(phone):
+            return []
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            self.load(cursor)
+            scores = {}
+            digits = phone_key(phone)
+            if digits:
+                cursor.execute("SELECT id FROM Customers WHERE phone_key = ?", (digits,))
+                for (customer_id,) in cursor.fetchall():
+                    scores[customer_id] = 1.0
+            if key:
+                # Everyone whose name starts with what was typed, straight off the index
+                cursor.execute("""
+                    SELECT id, name_key FROM Customers
+                    WHERE name_key >= ? AND name_key < ? ORDER BY name_key LIMIT ?
+                """, (key, key + "\uffff", limit))
+                for customer_id, candidate in cursor.fetchall():
+                    scores.setdefault(customer_id, 0.9 + 0.1 * len(key) / len(candidate))
+                scores.update((customer_id, score) for customer_id, score in self.fuzzy(key, limit * 2)
+                              if score > scores.get(customer_id, 0))
+            # Best score first, the longest-standing customer among equals
+            best = heapq.nlargest(limit, ((customer_id, score) for customer_id, score in scores.items()
+                                          if score >= self.MIN_SCORE),
+                                  key=lambda item: (item[1], -item[0]))
+            cursor.execute(f"SELECT id FROM Customers WHERE id IN ({','.join('?' * len(best))})",
+                           [customer_id for customer_id, _ in best])
+            existing = {row[0] for row in cursor.fetchall()}
+            if len(existing) < len(best):
+                # Someone was merged away since the index was built
+                self.signature = None
+                best = [item for item in best if item[0] in existing]
+        finally:
+            conn.close()
+        return [Suggestion(customer_id, self.names[self.positions[customer_id]], self.phones[self.positions[customer_id]], score)
+                for customer_id, score in best if customer_id in self.positions]
+
+    def fuzzy(self, key, count):
+        """(id, score) of the count names closest to key"""
+        grams = trigrams(key)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return []
+        # Dice coefficient over trigrams picks the candidates; difflib orders them
+        shared = np.bincount(np.concatenate(lists), minlength=len(self.ids))
+        dice = 2 * shared / (len(grams) + self.gram_counts)
+        count = min(count, len(dice))
+        candidates = np.argpartition(-dice, count - 1)[:count]
+        matcher = difflib.SequenceMatcher(b=key, autojunk=False)
+        results = []
+        for position in candidates[shared[candidates] > 0]:
+            matcher.set_seq1(self.keys[position])
+            results.append((self.ids[position], matcher.ratio()))
+        return results
+
+    def best_match(self, name, phone=None):
+        """The suggestion close enough to ask "did you mean" about, or None"""
+        suggestions = self.suggest(name, phone, limit=1)
+        if suggestions and suggestions[0].score >= self.SIMILAR_SCORE:
+            return suggestions[0]
+        return None
+
+    def duplicate_groups(self):
+        """Lists of (id, name, phone, sales, balance, created_at) sharing a name key or phone key, oldest first"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT 'name', name_key, group_concat(id) FROM Customers
+            WHERE name_key != '' GROUP BY name_key HAVING COUNT(*) > 1
+            UNION ALL
+            SELECT 'phone', phone_key, group_concat(id) FROM Customers
+            WHERE phone_key IS NOT NULL GROUP BY phone_key HAVING COUNT(DISTINCT name_key) > 1
+        """)
+        groups = []
+        for kind, key, ids in cursor.fetchall():
+            members = []
+            for customer_id in sorted(int(i) for i in ids.split(',')):
+                cursor.execute("""
+                    SELECT c.id, c.name, COALESCE(c.phone, ''),
+                           (SELECT COUNT(*) FROM SalesTransactions WHERE customer_id = c.id),
+                           COALESCE((SELECT balance FROM CustomerLedger WHERE customer_id = c.id ORDER BY id DESC LIMIT 1), 0),
+                           c.created_at
+                    FROM Customers c WHERE c.id = ?
+                """, (customer_id,))
+                members.append(cursor.fetchone())
+            groups.append((kind, key, members))
+        conn.close()
+        return groups
+
+    def merge(self, merges):
+        """Fold each (keep_id, [duplicate ids]) into its keep_id in one transaction; return customers removed.
+
+        Sales, returns and ledger entries are re-pointed, period snapshots and segment totals
+        are summed into the kept customer, its running ledger balance is recomputed and blank
+        contact details are filled from the duplicates before they are deleted.
+        """
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        merged_into = {}
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            for keep_id, duplicate_ids in merges:
+                while keep_id in merged_into:
+                    keep_id = merged_into[keep_id]
+                duplicates = [d for d in dict.fromkeys(duplicate_ids) if d != keep_id and d not in merged_into]
+                if not duplicates:
+                    continue
+                marks = ",".join("?" * len(duplicates))
+                everyone = [keep_id] + duplicates
+                all_marks = ",".join("?" * len(everyone))
+                for table in ('SalesTransactions', 'Returns', 'CustomerLedger'):
+                    cursor.execute(f"UPDATE {table} SET customer_id = ? WHERE customer_id IN ({marks})",
+                                   [keep_id] + duplicates)
+                cursor.execute(f"""
+                    INSERT INTO CustomerBalanceSnapshots (period_id, customer_id, total_debit, total_credit, balance)
+                    SELECT period_id, ?, SUM(total_debit), SUM(total_credit), SUM(balance)
+                    FROM CustomerBalanceSnapshots WHERE customer_id IN ({all_marks}) GROUP BY period_id
+                    ON CONFLICT(period_id, customer_id) DO UPDATE SET
+                        total_debit = excluded.total_debit, total_credit = excluded.total_credit,
+                        balance = excluded.balance
+                """, [keep_id] + everyone)
+                # Grouping on the (always true) filter yields one summed row, or none if nobody has totals yet
+                cursor.execute(f"""
+                    INSERT INTO CustomerSegments (customer_id, first_day, last_day, orders, sales_total, returns_total,
+                                                  last_sale_id, last_return_id)
+                    SELECT ?, MIN(first_day), MAX(last_day), SUM(orders), SUM(sales_total), SUM(returns_total),
+                           MAX(last_sale_id), MAX(last_return_id)
+                    FROM CustomerSegments WHERE customer_id IN ({all_marks})
+                    GROUP BY customer_id IN ({all_marks})
+                    ON CONFLICT(customer_id) DO UPDATE SET
+                        first_day = excluded.first_day, last_day = excluded.last_day, orders = excluded.orders,
+                        sales_total = excluded.sales_total, returns_total = excluded.returns_total,
+                        last_sale_id = excluded.last_sale_id, last_return_id = excluded.last_return_id
+                """, [keep_id] + everyone + everyone)
+                for table in ('CustomerBalanceSnapshots', 'CustomerSegments'):
+                    cursor.execute(f"DELETE FROM {table} WHERE customer_id IN ({marks})", duplicates)
+                # Ledger rows of both customers now interleave by id; rebuild the running balance
+                cursor.execute("""
+                    UPDATE CustomerLedger SET balance = running.balance
+                    FROM (
+                        SELECT id, SUM(COALESCE(debit, 0) - COALESCE(credit, 0)) OVER (ORDER BY id) AS balance
+                        FROM CustomerLedger WHERE customer_id = ?
+                    ) running
+                    WHERE CustomerLedger.id = running.id AND CustomerLedger.balance != running.balance
+                """, (keep_id,))
+                for column in ('phone', 'address', 'email'):
+                    cursor.execute(f"""
+                        UPDATE Customers SET {column} = (
+                            SELECT {column} FROM Customers WHERE id IN ({marks}) AND COALESCE({column}, '') != ''
+                            ORDER BY id LIMIT 1)
+                        WHERE id = ? AND COALESCE({column}, '') = ''
+                          AND EXISTS (SELECT 1 FROM Customers WHERE id IN ({marks}) AND COALESCE({column}, '') != '')
+                    """, duplicates + [keep_id] + duplicates)
+                cursor.execute("SELECT phone FROM Customers WHERE id = ?", (keep_id,))
+                cursor.execute("UPDATE Customers SET phone_key = ? WHERE id = ?", (phone_key(cursor.fetchone()[0]), keep_id))
+                cursor.execute(f"DELETE FROM Customers WHERE id IN ({marks})", duplicates)
+                for duplicate_id in duplicates:
+                    merged_into[duplicate_id] = keep_id
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return len(merged_into)
+
+
+class CustomerMergeDialog(QDialog):
+    """Customers sharing a normalised name or phone, grouped; checked ones are merged into the kept one"""
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.directory = CustomerDirectory(db)
+        self.merged = 0
+        self.setWindowTitle("Merge Duplicate Customers")
+        self.resize(820, 520)
+        layout = QVBoxLayout(self)
+
+        layout.addWidget(QLabel("Checked customers are merged into the one marked Keep, together with their sales, "
+                                "returns and ledger entries. Select a customer and press Keep Selected to keep it instead."))
+        self.tree = QTreeWidget()
+        self.tree.setHeaderLabels(["Customer", "Keep", "Phone", "Sales", "Balance", "Created"])
+        self.tree.setColumnWidth(0, 260)
+        layout.addWidget(self.tree)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        buttons = QHBoxLayout()
+        keep_btn = QPushButton("Keep Selected")
+        keep_btn.clicked.connect(self.keep_selected)
+        buttons.addWidget(keep_btn)
+        buttons.addStretch()
+        merge_btn = QPushButton("Merge Checked")
+        merge_btn.clicked.connect(self.merge_checked)
+        buttons.addWidget(merge_btn)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.accept)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+        self.load_groups()
+
+    def load_groups(self):
+        self.tree.clear()
+        groups = self.directory.duplicate_groups()
+        bold = QFont()
+        bold.setBold(True)
+        for kind, key, members in groups:
+            group = QTreeWidgetItem([f"Same {kind}: {key} ({len(members)})"])
+            group.setFont(0, bold)
+            self.tree.addTopLevelItem(group)
+            for customer_id, name, phone, sales, balance, created_at in members:
+                item = QTreeWidgetItem([name, "", phone, str(sales), f"{balance:.2f}", str(created_at or "")])
+                item.setData(0, Qt.ItemDataRole.UserRole, customer_id)
+                item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+                # A shared phone is often a family or a shop's landline, so those are only merged when ticked
+                item.setCheckState(0, Qt.CheckState.Checked if kind == 'name' else Qt.CheckState.Unchecked)
+                group.addChild(item)
+            self.set_keep(group.child(0))
+            group.setExpanded(True)
+        self.summary_label.setText(f"{len(groups)} groups of possible duplicates" if groups else "No duplicate customers found.")
+
+    def set_keep(self, item):
+        group = item.parent()
+        for index in range(group.childCount()):
+            group.child(index).setText(1, "")
+        item.setText(1, "Keep")
+        item.setCheckState(0, Qt.CheckState.Checked)
+
+    def keep_selected(self):
+        item = self.tree.currentItem()
+        if item is None or item.parent() is None:
+            QMessageBox.warning(self, "Error", "Please select a customer to keep.")
+            return
+        self.set_keep(item)
+
+    def merge_checked(self):
+        merges = []
+        for group_index in range(self.tree.topLevelItemCount()):
+            group = self.tree.topLevelItem(group_index)
+            keep_id, duplicates = None, []
+            for index in range(group.childCount()):
+                item = group.child(index)
+                customer_id = item.data(0, Qt.ItemDataRole.UserRole)
+                if item.text(1) == "Keep":
+                    keep_id = customer_id
+                elif item.checkState(0) == Qt.CheckState.Checked:
+                    duplicates.append(customer_id)
+            if duplicates:
+                merges.append((keep_id, duplicates))
+        if not merges:
+            QMessageBox.warning(self, "Error", "No customers are checked for merging.")
+            return
+        count = sum(len(duplicates) for _, duplicates in merges)
+        reply = QMessageBox.question(self, "Merge Customers",
+                                     f"Merge {count} customers into {len(merges)} kept customers? This cannot be undone.",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            merged = self.directory.merge(merges)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to merge customers: {str(e)}")
+            return
+        self.merged += merged
+        QMessageBox.information(self, "Success", f"{merged} duplicate customers merged.")
+        self.load_groups()
+
+
+if __name__ == '__main__':
+    # Benchmark: 30k customers; exact lookup by key vs. the old name scan, and suggestions vs. difflib over everyone
+    import os
+    import random
+    import string
+    import tempfile
+    import time
+    from database import Database
+
+    random.seed(7)
+    first = ["Ali", "Ahmed", "Bilal", "Fatima", "Hassan", "Usman", "Ayesha", "Zain", "Sana", "Omar", "Hamza", "Maryam"]
+    last = ["Khan", "Malik", "Butt", "Sheikh", "Qureshi", "Chaudhry", "Raza", "Siddiqui", "Iqbal", "Javed"]
+    names = [f"{random.choice(first)} {random.choice(last)} {''.join(random.choices(string.ascii_lowercase, k=4))}"
+             for _ in range(30000)]
+    db = Database(os.path.join(tempfile.mkdtemp(), 'identity_bench.db'))
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO Customers (name, phone, name_key, phone_key) VALUES (?, ?, ?, ?)",
+                     [(name, f"0300{i:07d}", name_key(name), phone_key(f"0300{i:07d}")) for i, name in enumerate(names)])
+    conn.commit()
+    directory = CustomerDirectory(db)
+    cursor = conn.cursor()
+    probes = random.sample(names, 200)
+
+    started = time.perf_counter()
+    for name in probes:
+        directory.find(cursor, f" {name.upper()} ")
+    print(f"find by name_key: {(time.perf_counter() - started) / len(probes) * 1000:.3f} ms")
+    conn.execute("DROP INDEX idx_customers_name_key")
+    started = time.perf_counter()
+    for name in probes[:20]:
+        cursor.execute("SELECT id FROM Customers WHERE name = ?", (name,)).fetchone()
+    print(f"exact name scan: {(time.perf_counter() - started) / 20 * 1000:.3f} ms")
+    conn.close()
+
+    typos = [name[:5] + name[6:] for name in probes[:50]]
+    directory.suggest("warm up")
+    started = time.perf_counter()
+    hits = sum(probes[i] in [s.name for s in directory.suggest(typo)] for i, typo in enumerate(typos))
+    print(f"suggest: {(time.perf_counter() - started) / len(typos) * 1000:.2f} ms, {hits}/{len(typos)} typos found")
+    keys = [name_key(name) for name in names]
+    started = time.perf_counter()
+    for typo in typos[:5]:
+        difflib.get_close_matches(name_key(typo), keys, n=8)
+    print(f"difflib over all names: {(time.perf_counter() - started) / 5 * 1000:.0f} ms")
@@ -0,0 +1,217 @@
+"""
+Customer Picker for Eagle Traders
+Editable customer combo box over a lazily paged SQL model, with a completer that searches as you type
+"""
+
+from PyQt6.QtWidgets import QComboBox, QCompleter
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex
+from customer_identity import CustomerDirectory, name_key
+
+
+class CustomerListModel(QAbstractListModel):
+    """Customers by name, fetched a page at a time as a view scrolls.
+
+    Pages are keyset-paged on (name_key, id) over idx_customers_name_key, so the first page
+    of 30k customers costs the same as the last and only the pages scrolled to are held.
+    With a filter, names starting with the text come first (an index range), then names
+    containing it, found through the CustomerSearch trigram index once three characters
+    are typed. An optional placeholder row ("All Customers") with no id comes first.
+    Unpaged models stop at the first page, for completers, which fetch every page there is.
+    """
+    PAGE_SIZE = 100
+
+    def __init__(self, db, placeholder=None, paged=True, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.placeholder = placeholder
+        self.paged = paged
+        self.key = ""
+        self.segment = None
+        self.rows = []  # (id, name)
+        self.after = None  # keyset of the last row fetched
+        self.exhausted = False
+        conn = self.db.get_connection()
+        self.has_search = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'CustomerSearch'").fetchone() is not None
+        conn.close()
+        self.set_filter()
+
+    def set_filter(self, text="", segment=None):
+        self.beginResetModel()
+        self.key = name_key(text)
+        self.segment = segment
+        self.rows = [(None, self.placeholder)] if self.placeholder is not None else []
+        self.after = None
+        self.exhausted = False
+        self.rows.extend(self.fetch_page())
+        self.endResetModel()
+
+    def fetch_page(self):
+        """(id, name) rows of the next page"""
+        params = {'limit': self.PAGE_SIZE}
+        joins, where = "", ["c.name_key IS NOT NULL"]
+        if self.segment:
+            joins = "JOIN CustomerSegments s ON s.customer_id = c.id"
+            where.append("s.segment = :segment")
+            params['segment'] = self.segment
+        if self.key:
+            # 0 for names starting with the text, 1 for names only containing it
+            rank = "(c.name_key < :start OR c.name_key >= :end)"
+            order = "rank, c.name_key, c.id"
+            params.update(start=self.key, end=self.key + "\uffff")
+            if len(self.key) >= 3 and self.has_search:
+                where.append("c.id IN (SELECT rowid FROM CustomerSearch WHERE CustomerSearch MATCH :match)")
+                params['match'] = '"' + self.key.replace('"', '""') + '"'
+            else:
+                where.append("c.name_key >= :start AND c.name_key < :end")
+            if self.after:
+                where.append(f"({rank}, c.name_key, c.id) > (:rank, :key, :id)")
+                params.update(zip(('rank', 'key', 'id'), self.after))
+        else:
+            rank = "0"
+            order = "c.name_key, c.id"  # Straight off the index; a constant rank would force a sort
+            if self.after:
+                where.append("(c.name_key, c.id) > (:key, :id)")
+                params.update(zip(('key', 'id'), self.after[1:]))
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT c.id, c.name, c.name_key, {rank} AS rank FROM Customers c {joins}
+            WHERE {' AND '.join(where)}
+            ORDER BY {order}
+            LIMIT :limit
+        """, params)
+        page = cursor.fetchall()
+        conn.close()
+        if page:
+            customer_id, _, key, rank_value = page[-1]
+            self.after = (rank_value, key, customer_id)
+        self.exhausted = len(page) < self.PAGE_SIZE or not self.paged
+        return [(customer_id, name) for customer_id, name, _, _ in page]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self.exhausted:
+            return
+        page = self.fetch_page()
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        customer_id, name = self.rows[index.row()]
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            return name
+        if role == Qt.ItemDataRole.UserRole:
+            return customer_id
+        return None
+
+
+class CustomerPicker(QComboBox):
+    """Editable customer combo box shared by the POS and the accounts screens.
+
+    The drop-down list pages customers in from CustomerListModel as it is scrolled, and a
+    second, filtered model behind the completer is re-queried on every edit, so neither
+    ever holds the whole customer table. Any name can still be typed; customer_id()
+    resolves it through the normalised name key.
+    """
+
+    def __init__(self, db, placeholder=None, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.placeholder = placeholder
+        self.directory = CustomerDirectory(db)
+        self.picked = None  # (name, id) last chosen from the completer
+        self.setEditable(True)
+        self.setInsertPolicy(QComboBox.InsertPolicy.NoInsert)
+        self.setMaxVisibleItems(15)
+        # setModel() hands the model to the line edit's completer, which would fetch every page
+        self.setCompleter(None)
+        self.customer_model = CustomerListModel(db, placeholder, parent=self)
+        self.setModel(self.customer_model)
+
+        self.completion_model = CustomerListModel(db, paged=False, parent=self)
+        completer = QCompleter(self.completion_model, self)
+        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        completer.activated[QModelIndex].connect(self.on_completion_picked)
+        self.setCompleter(completer)
+        self.lineEdit().textEdited.connect(self.complete_customers)
+
+    def complete_customers(self, text):
+        self.completion_model.set_filter(text, self.customer_model.segment)
+
+    def on_completion_picked(self, index):
+        self.picked = (index.data(Qt.ItemDataRole.DisplayRole), index.data(Qt.ItemDataRole.UserRole))
+
+    def refresh(self, segment=None):
+        """Re-read the customers (only those in segment, if given) and go back to the placeholder/blank entry"""
+        self.picked = None
+        self.customer_model.set_filter(segment=segment)
+        self.completion_model.set_filter(segment=segment)
+        self.setCurrentIndex(0)
+
+    def customer_id(self):
+        """Id of the customer named in the box, None for the placeholder or a name that isn't a customer"""
+        text = self.currentText().strip()
+        if not text or text == self.placeholder:
+            return None
+        if self.picked and self.picked[0].strip() == text:
+            return self.picked[1]
+        index = self.currentIndex()
+        if index >= 0 and self.itemText(index).strip() == text and self.itemData(index) is not None:
+            return self.itemData(index)
+        conn = self.db.get_connection()
+        customer_id = self.directory.find(conn.cursor(), text)
+        conn.close()
+        return customer_id
+
+
+if __name__ == '__main__':
+    # Benchmark: building a picker over 30k customers vs. the old addItem loop, then typing a name
+    import os
+    import random
+    import string
+    import sys
+    import tempfile
+    import time
+    from PyQt6.QtWidgets import QApplication
+    from database import Database
+
+    app = QApplication(sys.argv)
+    random.seed(7)
+    names = [f"{random.choice(['Ali', 'Sana', 'Omar', 'Hamza'])} {''.join(random.choices(string.ascii_lowercase, k=6))}"
+             for _ in range(30000)]
+    db = Database(os.path.join(tempfile.mkdtemp(), 'picker_bench.db'))
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO Customers (name, name_key) VALUES (?, ?)", [(name, name_key(name)) for name in names])
+    conn.commit()
+    rows = conn.execute("SELECT id, name FROM Customers ORDER BY name").fetchall()
+    conn.close()
+
+    started = time.perf_counter()
+    combo = QComboBox()
+    combo.setEditable(True)
+    for customer_id, name in rows:
+        combo.addItem(name, customer_id)
+    print(f"addItem loop: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    started = time.perf_counter()
+    picker = CustomerPicker(db, "All Customers")
+    print(f"CustomerPicker: {(time.perf_counter() - started) * 1000:.1f} ms, {picker.count()} rows loaded")
+    started = time.perf_counter()
+    for _ in range(30):
+        picker.customer_model.fetchMore()
+    print(f"30 more pages: {(time.perf_counter() - started) / 30 * 1000:.2f} ms per page, {picker.count()} rows loaded")
+    started = time.perf_counter()
+    for text in ("a", "al", "ali", "ali q", "ali qw", "xyz", "kqz"):
+        picker.complete_customers(text)
+    print(f"completion per keystroke: {(time.perf_counter() - started) / 7 * 1000:.2f} ms")
@@ -412,14 +412,12 @@ class Dashboard(QWidget):
 
         # Low Stock Products
         cursor.execute("""
-            SELECT COUNT(DISTINCT p.id)
+            SELECT COUNT(*)
             FROM Products p
-            LEFT JOIN ProductBatches pb ON p.id = pb.product_id
-            GROUP BY p.id
-            HAVING COALESCE(SUM(pb.quantity), 0) < 10
+            LEFT JOIN StockLevels sl ON sl.product_id = p.id
+            WHERE COALESCE(sl.quantity, 0) < 10
         """)
-        low_stock_result = cursor.fetchall()
-        low_stock_count = len(low_stock_result)
+        low_stock_count = cursor.fetchone()[0]
 
         # Total Sales Amount
         cursor.execute("SELECT COALESCE(SUM(total_amount), 0) FROM SalesTransactions")
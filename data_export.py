@@ -0,0 +1,344 @@
+"""
+Streaming Data Export for Eagle Traders
+Writes large tables to CSV or XLSX in chunks so memory stays flat
+"""
+
+import csv
+import os
+import re
+import sqlite3
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLabel, QPushButton,
+    QComboBox, QCheckBox, QDateEdit, QProgressBar, QFileDialog, QMessageBox
+)
+from PyQt6.QtCore import QDate, QThread, pyqtSignal
+from notification_manager import show_success_notification, show_error_notification
+
+CHUNK_SIZE = 5000
+
+# name -> (headers, query, date column used for range filtering)
+EXPORTS = {
+    "Sales Records": (
+        ["ID", "Date", "Customer", "Buyer", "Contact", "Total", "Status"],
+        """SELECT st.id, st.date, c.name, st.buyer_name, st.buyer_contact, st.total_amount, st.status
+           FROM SalesTransactions st LEFT JOIN Customers c ON st.customer_id = c.id""",
+        "st.date"),
+    "Sales Items": (
+        ["Sale ID", "Date", "Product", "Barcode", "Quantity", "Unit Price", "Total"],
+        """SELECT si.sale_id, st.date, p.name, p.barcode, si.quantity, si.unit_price, si.total_price
+           FROM SalesItems si
+           JOIN SalesTransactions st ON si.sale_id = st.id
+           LEFT JOIN Products p ON si.product_id = p.id""",
+        "st.date"),
+    "Stock Ledger": (
+        ["ID", "Date", "Product", "Batch", "Movement", "Quantity", "Reason", "Reference"],
+        """SELECT sl.id, sl.date, p.name, sl.batch_id, sl.movement_type, sl.quantity, sl.reason, sl.reference_id
+           FROM StockLedger sl LEFT JOIN Products p ON sl.product_id = p.id""",
+        "sl.date"),
+    "Customer Ledgers": (
+        ["ID", "Date", "Customer", "Description", "Debit", "Credit", "Balance"],
+        """SELECT cl.id, cl.date, c.name, cl.description, cl.debit, cl.credit, cl.balance
+           FROM CustomerLedger cl LEFT JOIN Customers c ON cl.customer_id = c.id""",
+        "cl.date"),
+    "General Ledger": (
+        ["ID", "Date", "Description", "Type", "Amount", "Balance"],
+        "SELECT gl.id, gl.date, gl.description, gl.type, gl.amount, gl.balance FROM GeneralLedger gl",
+        "gl.date"),
+    "Expenses": (
+        ["ID", "Date", "Category", "Description", "Amount"],
+        "SELECT e.id, e.date, e.category, e.description, e.amount FROM Expenses e",
+        "e.date"),
+    "Payroll": (
+        ["ID", "Date", "Employee", "Position", "Amount", "Description"],
+        """SELECT pt.id, pt.date, em.name, em.position, pt.amount, pt.description
+           FROM PayrollTransactions pt LEFT JOIN Employees em ON pt.employee_id = em.id""",
+        "pt.date"),
+}
+
+
+class CsvExportWriter:
+    def __init__(self, file_path):
+        self.file = open(file_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+
+    def write_row(self, row):
+        self.writer.writerow(["" if value is None else value for value in row])
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxExportWriter:
+    """Minimal XLSX writer.
+
+    Rows are streamed into the sheet XML with inline strings, so nothing but the
+    current row is held in memory and no spreadsheet library is needed. The first row
+    written is the header; when a sheet reaches Excel's row limit the export carries on
+    in a new sheet that starts with the header again.
+    """
+
+    MAX_ROWS = 1048576  # Per sheet, header included
+    # Control characters XML 1.0 does not allow, even escaped (a GS1 barcode's GS separator, for one)
+    ILLEGAL_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+    def __init__(self, file_path, sheet_name="Export"):
+        self.zip = zipfile.ZipFile(file_path, 'w', zipfile.ZIP_DEFLATED)
+        self.sheet_name = self.ILLEGAL_XML.sub('', sheet_name)
+        self.sheets = 0
+        self.sheet = None
+        self.header = None
+        self.rows = 0  # rows in the current sheet
+
+    def new_sheet(self):
+        if self.sheet:
+            self.end_sheet()
+        self.sheets += 1
+        # force_zip64 lets a sheet grow past 4 GB without knowing its size up front
+        self.sheet = self.zip.open(f'xl/worksheets/sheet{self.sheets}.xml', 'w', force_zip64=True)
+        self.sheet.write(b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                         b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+        self.rows = 0
+        if self.header is not None:
+            self.write_cells(self.header)
+
+    def end_sheet(self):
+        self.sheet.write(b'</sheetData></worksheet>')
+        self.sheet.close()
+
+    def write_row(self, row):
+        if self.header is None:
+            self.header = row
+            self.new_sheet()
+            return
+        if self.rows >= self.MAX_ROWS:
+            self.new_sheet()
+        self.write_cells(row)
+
+    def write_cells(self, row):
+        cells = []
+        for value in row:
+            if value is None:
+                cells.append('<c/>')
+            elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                cells.append(f'<c><v>{value}</v></c>')
+            else:
+                text = escape(self.ILLEGAL_XML.sub('', str(value)))
+                cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+        self.sheet.write(f'<row>{"".join(cells)}</row>'.encode('utf-8'))
+        self.rows += 1
+
+    def sheet_title(self, number):
+        # Unique and at most 31 characters, as Excel requires
+        suffix = "" if number == 1 else f" ({number})"
+        return escape(self.sheet_name[:31 - len(suffix)] + suffix)
+
+    def close(self):
+        if self.sheet is None:
+            self.new_sheet()
+        self.end_sheet()
+        numbers = range(1, self.sheets + 1)
+        self.zip.writestr('[Content_Types].xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + ''.join(f'<Override PartName="/xl/worksheets/sheet{n}.xml" '
+                      'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                      for n in numbers) +
+            '</Types>'
+        ))
+        self.zip.writestr('_rels/.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'
+        ))
+        self.zip.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(f'<Relationship Id="rId{n}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                      f'Target="worksheets/sheet{n}.xml"/>' for n in numbers) +
+            '</Relationships>'
+        ))
+        self.zip.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + ''.join(f'<sheet name="{self.sheet_title(n)}" sheetId="{n}" r:id="rId{n}"/>' for n in numbers) +
+            '</sheets></workbook>'
+        ))
+        self.zip.close()
+
+
+class ExportThread(QThread):
+    """Thread for streaming a query result to a file"""
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db_path, file_path, headers, query, params=(), file_format="csv", sheet_name="Export"):
+        super().__init__()
+        self.db_path = db_path
+        self.file_path = file_path
+        self.headers = headers
+        self.query = query
+        self.params = params
+        self.file_format = file_format
+        self.sheet_name = sheet_name
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        # Write to a temp file next to the target so a cancelled or failed export never leaves a partial file
+        temp_path = None
+        writer = None
+        try:
+            fd, temp_path = tempfile.mkstemp(suffix='.' + self.file_format, dir=os.path.dirname(self.file_path) or None)
+            os.close(fd)
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT COUNT(*) FROM ({self.query})", self.params)
+            total = cursor.fetchone()[0] or 1
+
+            writer = XlsxExportWriter(temp_path, self.sheet_name) if self.file_format == "xlsx" else CsvExportWriter(temp_path)
+            writer.write_row(self.headers)
+            cursor.execute(self.query, self.params)
+            written = 0
+            while not self.cancelled:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    writer.write_row(row)
+                written += len(rows)
+                self.progress.emit(min(99, written * 100 // total))
+            conn.close()
+            writer.close()
+            writer = None
+
+            if self.cancelled:
+                os.remove(temp_path)
+                self.finished.emit(False, "Export cancelled.")
+                return
+            os.replace(temp_path, self.file_path)
+            self.progress.emit(100)
+            self.finished.emit(True, f"Exported {written:,} rows to {os.path.basename(self.file_path)}")
+
+        except Exception as e:
+            if writer:
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+            self.finished.emit(False, f"Export failed: {str(e)}")
+
+
+class ExportDialog(QDialog):
+    """Pick a dataset, date range and format, then export in the background"""
+
+    def __init__(self, db, parent=None, dataset=None):
+        super().__init__(parent)
+        self.db = db
+        self.export_thread = None
+        self.setWindowTitle("Export Data")
+        self.setMinimumWidth(420)
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+
+        self.dataset_combo = QComboBox()
+        self.dataset_combo.addItems(EXPORTS.keys())
+        if dataset in EXPORTS:
+            self.dataset_combo.setCurrentText(dataset)
+        form.addRow("Data:", self.dataset_combo)
+
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("CSV (.csv)", "csv")
+        self.format_combo.addItem("Excel (.xlsx)", "xlsx")
+        form.addRow("Format:", self.format_combo)
+
+        self.use_dates = QCheckBox("Limit to date range")
+        form.addRow(self.use_dates)
+        self.from_date = QDateEdit()
+        self.from_date.setCalendarPopup(True)
+        self.from_date.setDate(QDate.currentDate().addMonths(-1))
+        form.addRow("From:", self.from_date)
+        self.to_date = QDateEdit()
+        self.to_date.setCalendarPopup(True)
+        self.to_date.setDate(QDate.currentDate())
+        form.addRow("To:", self.to_date)
+        layout.addLayout(form)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        self.export_btn = QPushButton("Export")
+        self.export_btn.clicked.connect(self.start_export)
+        btn_layout.addWidget(self.export_btn)
+        self.cancel_btn = QPushButton("Close")
+        self.cancel_btn.clicked.connect(self.cancel_or_close)
+        btn_layout.addWidget(self.cancel_btn)
+        layout.addLayout(btn_layout)
+
+    def start_export(self):
+        dataset = self.dataset_combo.currentText()
+        file_format = self.format_combo.currentData()
+        default_name = f"{dataset.lower().replace(' ', '_')}.{file_format}"
+        file_filter = "Excel Files (*.xlsx)" if file_format == "xlsx" else "CSV Files (*.csv)"
+        file_path, _ = QFileDialog.getSaveFileName(self, f"Export {dataset}", default_name, file_filter)
+        if not file_path:
+            return
+
+        headers, query, date_column = EXPORTS[dataset]
+        params = ()
+        if self.use_dates.isChecked():
+            query += f" WHERE {date_column} >= ? AND {date_column} < date(?, '+1 day')"
+            params = (self.from_date.date().toString("yyyy-MM-dd"), self.to_date.date().toString("yyyy-MM-dd"))
+        query += f" ORDER BY {date_column}"
+
+        self.export_btn.setEnabled(False)
+        self.cancel_btn.setText("Cancel")
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.status_label.setText(f"Exporting {dataset}...")
+
+        self.export_thread = ExportThread(self.db.db_path, file_path, headers, query, params, file_format, dataset)
+        self.export_thread.progress.connect(self.progress_bar.setValue)
+        self.export_thread.finished.connect(self.on_export_finished)
+        self.export_thread.start()
+
+    def cancel_or_close(self):
+        if self.export_thread and self.export_thread.isRunning():
+            self.export_thread.cancel()
+            self.status_label.setText("Cancelling...")
+        else:
+            self.accept()
+
+    def on_export_finished(self, success, message):
+        self.export_btn.setEnabled(True)
+        self.cancel_btn.setText("Close")
+        self.progress_bar.setVisible(False)
+        self.status_label.setText(message)
+        if success:
+            show_success_notification("Export Complete", message)
+        elif not self.export_thread.cancelled:
+            show_error_notification("Export Failed", message)
+            QMessageBox.critical(self, "Error", message)
+
+    def reject(self):
+        if self.export_thread and self.export_thread.isRunning():
+            self.export_thread.cancel()
+            self.export_thread.wait()
+        super().reject()
@@ -2,6 +2,7 @@ import sqlite3
 import os
 import sys
 import shutil
+from customer_identity import name_key, phone_key
 
 class Database:
     def __init__(self, db_path='eagle_traders.db'):
@@ -82,6 +83,11 @@ class Database:
             cursor.execute("ALTER TABLE Products ADD COLUMN min_stock_level INTEGER DEFAULT 0")
         except sqlite3.OperationalError:
             pass  # Column already exists
+        try:
+            # Sortable yyyymm expiry, so near-expiry batches are one index range scan
+            cursor.execute("ALTER TABLE ProductBatches ADD COLUMN expiry_key INTEGER GENERATED ALWAYS AS (expiry_year * 100 + expiry_month) VIRTUAL")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
 
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS ProductBatches (
@@ -91,6 +97,7 @@ class Database:
                 quantity INTEGER NOT NULL,
                 expiry_month INTEGER,
                 expiry_year INTEGER,
+                expiry_key INTEGER GENERATED ALWAYS AS (expiry_year * 100 + expiry_month) VIRTUAL,
                 purchase_date DATE,
                 cost_price REAL,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -126,6 +133,55 @@ class Database:
             )
         ''')
 
+        # Normalised lookup keys (see customer_identity), filled in for customers saved before they existed
+        try:
+            cursor.execute("ALTER TABLE Customers ADD COLUMN name_key TEXT")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        try:
+            cursor.execute("ALTER TABLE Customers ADD COLUMN phone_key TEXT")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        conn.create_function('customer_name_key', 1, name_key, deterministic=True)
+        conn.create_function('customer_phone_key', 1, phone_key, deterministic=True)
+        cursor.execute("""
+            UPDATE Customers SET name_key = customer_name_key(name), phone_key = customer_phone_key(phone)
+            WHERE name_key IS NULL
+        """)
+
+        # Trigram index over name_key so the customer picker finds names containing the typed text;
+        # kept in step with Customers by triggers. Skipped where SQLite was built without FTS5.
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'CustomerSearch'")
+        customer_search_existed = cursor.fetchone() is not None
+        try:
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS CustomerSearch
+                USING fts5(name_key, content='Customers', content_rowid='id', tokenize='trigram')
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_customer_search_insert AFTER INSERT ON Customers
+                BEGIN
+                    INSERT INTO CustomerSearch (rowid, name_key) VALUES (NEW.id, NEW.name_key);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_customer_search_delete AFTER DELETE ON Customers
+                BEGIN
+                    INSERT INTO CustomerSearch (CustomerSearch, rowid, name_key) VALUES ('delete', OLD.id, OLD.name_key);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_customer_search_update AFTER UPDATE OF name_key ON Customers
+                BEGIN
+                    INSERT INTO CustomerSearch (CustomerSearch, rowid, name_key) VALUES ('delete', OLD.id, OLD.name_key);
+                    INSERT INTO CustomerSearch (rowid, name_key) VALUES (NEW.id, NEW.name_key);
+                END
+            ''')
+            if not customer_search_existed:
+                cursor.execute("INSERT INTO CustomerSearch (CustomerSearch) VALUES ('rebuild')")
+        except sqlite3.OperationalError:
+            pass  # No FTS5; the picker falls back to prefix matches
+
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS SalesTransactions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -163,6 +219,7 @@ class Database:
                 quantity INTEGER NOT NULL,
                 unit_price REAL NOT NULL,
                 total_price REAL NOT NULL,
+                discount_percent REAL DEFAULT 0,
                 created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (sale_id) REFERENCES SalesTransactions(id),
                 FOREIGN KEY (product_id) REFERENCES Products(id),
@@ -303,20 +360,426 @@ class Database:
             )
         ''')
 
+        # Accounting period close: one row per closed month plus cumulative snapshots at its end
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS AccountingPeriods (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                period_start DATE NOT NULL,
+                period_end DATE NOT NULL UNIQUE,
+                closed_by TEXT,
+                closed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS CustomerBalanceSnapshots (
+                period_id INTEGER NOT NULL,
+                customer_id INTEGER NOT NULL,
+                total_debit REAL NOT NULL DEFAULT 0,
+                total_credit REAL NOT NULL DEFAULT 0,
+                balance REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (period_id, customer_id),
+                FOREIGN KEY (period_id) REFERENCES AccountingPeriods(id),
+                FOREIGN KEY (customer_id) REFERENCES Customers(id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS StockSnapshots (
+                period_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                stock_value REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (period_id, product_id),
+                FOREIGN KEY (period_id) REFERENCES AccountingPeriods(id),
+                FOREIGN KEY (product_id) REFERENCES Products(id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS CategorySalesSnapshots (
+                period_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                revenue REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (period_id, category_id),
+                FOREIGN KEY (period_id) REFERENCES AccountingPeriods(id),
+                FOREIGN KEY (category_id) REFERENCES Categories(id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ExpenseSnapshots (
+                period_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                amount REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (period_id, category),
+                FOREIGN KEY (period_id) REFERENCES AccountingPeriods(id)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS PayrollSnapshots (
+                period_id INTEGER NOT NULL,
+                employee_id INTEGER NOT NULL,
+                amount REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (period_id, employee_id),
+                FOREIGN KEY (period_id) REFERENCES AccountingPeriods(id),
+                FOREIGN KEY (employee_id) REFERENCES Employees(id)
+            )
+        ''')
+
+        # Lock closed periods: reject any insert, edit or delete dated on or before the last closed month end
+        for table in ('CustomerLedger', 'GeneralLedger', 'SalesTransactions', 'StockLedger', 'Expenses', 'PayrollTransactions'):
+            locked_before = "(SELECT date(MAX(period_end), '+1 day') FROM AccountingPeriods)"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_period_lock_insert
+                BEFORE INSERT ON {table}
+                WHEN NEW.date < {locked_before}
+                BEGIN
+                    SELECT RAISE(ABORT, 'Accounting period is closed');
+                END
+            ''')
+            # Merging customers may re-point closed rows and rebuild the running balance; nothing else may change
+            cursor.execute(f"PRAGMA table_info({table})")
+            locked_columns = ", ".join(column[1] for column in cursor.fetchall() if column[1] not in ('customer_id', 'balance'))
+            cursor.execute(f"DROP TRIGGER IF EXISTS trg_{table}_period_lock_update")
+            cursor.execute(f'''
+                CREATE TRIGGER trg_{table}_period_lock_update
+                BEFORE UPDATE OF {locked_columns} ON {table}
+                WHEN OLD.date < {locked_before} OR NEW.date < {locked_before}
+                BEGIN
+                    SELECT RAISE(ABORT, 'Accounting period is closed');
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_period_lock_delete
+                BEFORE DELETE ON {table}
+                WHEN OLD.date < {locked_before}
+                BEGIN
+                    SELECT RAISE(ABORT, 'Accounting period is closed');
+                END
+            ''')
+
+        # Stock on hand per product, maintained from StockLedger by triggers so reads are a single row lookup
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'StockLevels'")
+        stock_levels_existed = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS StockLevels (
+                product_id INTEGER PRIMARY KEY,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES Products(id)
+            )
+        ''')
+        signed = "CASE {row}.movement_type WHEN 'out' THEN -{row}.quantity ELSE {row}.quantity END"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_stock_levels_insert
+            AFTER INSERT ON StockLedger
+            BEGIN
+                INSERT INTO StockLevels (product_id, quantity) VALUES (NEW.product_id, {signed.format(row='NEW')})
+                ON CONFLICT(product_id) DO UPDATE SET quantity = quantity + excluded.quantity, updated_at = CURRENT_TIMESTAMP;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_stock_levels_delete
+            AFTER DELETE ON StockLedger
+            BEGIN
+                UPDATE StockLevels SET quantity = quantity - ({signed.format(row='OLD')}), updated_at = CURRENT_TIMESTAMP
+                WHERE product_id = OLD.product_id;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_stock_levels_update
+            AFTER UPDATE OF product_id, movement_type, quantity ON StockLedger
+            BEGIN
+                UPDATE StockLevels SET quantity = quantity - ({signed.format(row='OLD')}), updated_at = CURRENT_TIMESTAMP
+                WHERE product_id = OLD.product_id;
+                INSERT INTO StockLevels (product_id, quantity) VALUES (NEW.product_id, {signed.format(row='NEW')})
+                ON CONFLICT(product_id) DO UPDATE SET quantity = quantity + excluded.quantity, updated_at = CURRENT_TIMESTAMP;
+            END
+        ''')
+        if not stock_levels_existed:
+            self.migrate_stock_levels(cursor)
+
+        # Low stock transitions: a row each time a product's stock falls to its minimum level or recovers above it
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS StockAlerts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                product_id INTEGER NOT NULL,
+                event TEXT NOT NULL CHECK(event IN ('entered', 'cleared')),
+                quantity INTEGER NOT NULL,
+                min_level INTEGER NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES Products(id)
+            )
+        ''')
+        min_level = "(SELECT COALESCE(min_stock_level, 0) FROM Products WHERE id = {product})"
+        stock = "(SELECT COALESCE(MAX(quantity), 0) FROM StockLevels WHERE product_id = {product})"
+        alert_triggers = {
+            # name: (event, old quantity, new quantity, old minimum, new minimum, product); no old quantity
+            # for a product's first level, which can only enter low stock
+            'level_insert': ('AFTER INSERT ON StockLevels', None, 'NEW.quantity', min_level, min_level, 'NEW.product_id'),
+            'level_update': ('AFTER UPDATE OF quantity ON StockLevels', 'OLD.quantity', 'NEW.quantity', min_level, min_level, 'NEW.product_id'),
+            'level_delete': ('AFTER DELETE ON StockLevels', 'OLD.quantity', '0', min_level, min_level, 'OLD.product_id'),
+            'min_level': ('AFTER UPDATE OF min_stock_level ON Products', stock, stock,
+                          'COALESCE(OLD.min_stock_level, 0)', 'COALESCE(NEW.min_stock_level, 0)', 'NEW.id'),
+        }
+        # An earlier level_insert counted the first level as a move up from 0, logging 'cleared' for every new product
+        cursor.execute("DROP TRIGGER IF EXISTS trg_stock_alerts_level_insert")
+        for name, (event, old_qty, new_qty, old_min, new_min, product) in alert_triggers.items():
+            old_min, new_min = old_min.format(product=product), new_min.format(product=product)
+            new_qty = new_qty.format(product=product)
+            if old_qty is None:
+                when = f"{new_qty} <= {new_min}"
+            else:
+                when = f"({old_qty.format(product=product)} <= {old_min}) != ({new_qty} <= {new_min})"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_stock_alerts_{name}
+                {event}
+                WHEN {when}
+                BEGIN
+                    INSERT INTO StockAlerts (product_id, event, quantity, min_level)
+                    VALUES ({product}, CASE WHEN {new_qty} <= {new_min} THEN 'entered' ELSE 'cleared' END, {new_qty}, {new_min});
+                END
+            ''')
+
+        # Units and revenue per product per day (day = Julian day number), kept by triggers so sales history is one range scan
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'ProductDailySales'")
+        daily_sales_existed = cursor.fetchone() is not None
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ProductDailySales (
+                day INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                revenue REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, product_id)
+            ) WITHOUT ROWID
+        ''')
+        try:
+            cursor.execute("ALTER TABLE ProductDailySales ADD COLUMN revenue REAL NOT NULL DEFAULT 0")
+            # Rollup from before revenue was kept: refill it and recreate its triggers below
+            cursor.execute("DROP TRIGGER IF EXISTS trg_product_daily_sales_insert")
+            cursor.execute("DROP TRIGGER IF EXISTS trg_product_daily_sales_delete")
+            cursor.execute("DELETE FROM ProductDailySales")
+            daily_sales_existed = False
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        sale_day = "(SELECT CAST(julianday(date(date)) AS INTEGER) FROM SalesTransactions WHERE id = {row}.sale_id)"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_product_daily_sales_insert
+            AFTER INSERT ON SalesItems
+            BEGIN
+                INSERT INTO ProductDailySales (day, product_id, quantity, revenue)
+                VALUES ({sale_day.format(row='NEW')}, NEW.product_id, NEW.quantity, NEW.total_price)
+                ON CONFLICT(day, product_id) DO UPDATE SET quantity = quantity + excluded.quantity,
+                                                           revenue = revenue + excluded.revenue;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_product_daily_sales_delete
+            AFTER DELETE ON SalesItems
+            BEGIN
+                UPDATE ProductDailySales SET quantity = quantity - OLD.quantity, revenue = revenue - OLD.total_price
+                WHERE day = {sale_day.format(row='OLD')} AND product_id = OLD.product_id;
+            END
+        ''')
+        if not daily_sales_existed:
+            cursor.execute('''
+                INSERT INTO ProductDailySales (day, product_id, quantity, revenue)
+                SELECT CAST(julianday(date(st.date)) AS INTEGER), si.product_id, SUM(si.quantity), SUM(si.total_price)
+                FROM SalesTransactions st
+                JOIN SalesItems si ON si.sale_id = st.id
+                GROUP BY 1, 2
+            ''')
+
+        # Reorder points derived from sales velocity, waiting for review before they replace min_stock_level
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ReorderSuggestions (
+                product_id INTEGER PRIMARY KEY,
+                avg_daily_demand REAL NOT NULL DEFAULT 0,
+                demand_std REAL NOT NULL DEFAULT 0,
+                safety_stock INTEGER NOT NULL DEFAULT 0,
+                suggested_min INTEGER NOT NULL DEFAULT 0,
+                computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES Products(id)
+            )
+        ''')
+
+        # Customer RFM segments: running purchase totals folded in from sales and returns past
+        # last_sale_id / last_return_id, plus scores and segment recomputed for everyone on refresh
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS CustomerSegments (
+                customer_id INTEGER PRIMARY KEY,
+                first_day INTEGER,
+                last_day INTEGER,
+                orders INTEGER NOT NULL DEFAULT 0,
+                sales_total REAL NOT NULL DEFAULT 0,
+                returns_total REAL NOT NULL DEFAULT 0,
+                last_sale_id INTEGER NOT NULL DEFAULT 0,
+                last_return_id INTEGER NOT NULL DEFAULT 0,
+                balance REAL NOT NULL DEFAULT 0,
+                r_score INTEGER,
+                f_score INTEGER,
+                m_score INTEGER,
+                segment TEXT,
+                ltv REAL,
+                computed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (customer_id) REFERENCES Customers(id)
+            )
+        ''')
+
+        # Generated PDFs (bills, invoices, receipts, ledgers) kept by DocumentStore; path is relative to its root
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Documents (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                doc_type TEXT NOT NULL,
+                entity_id INTEGER NOT NULL,
+                source_hash TEXT NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                compressed INTEGER NOT NULL DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                last_opened_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(doc_type, entity_id, source_hash)
+            )
+        ''')
+
+        # Thermal receipt printer per POS terminal; output is 'none', 'device', 'tcp' or 'file'
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ReceiptPrinters (
+                terminal TEXT PRIMARY KEY,
+                output TEXT NOT NULL DEFAULT 'none',
+                target TEXT,
+                paper_mm INTEGER NOT NULL DEFAULT 80,
+                columns TEXT,
+                logo_path TEXT,
+                header TEXT,
+                footer TEXT,
+                open_drawer INTEGER NOT NULL DEFAULT 0,
+                open_pdf INTEGER NOT NULL DEFAULT 1
+            )
+        ''')
+
+        # Promotion rules; each targets a product or a whole category. kind is one of
+        # 'quantity_break', 'category_discount', 'buy_x_get_y' or 'segment_price'
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS Promotions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                product_id INTEGER,
+                category_id INTEGER,
+                segment TEXT,
+                min_qty INTEGER NOT NULL DEFAULT 1,
+                buy_qty INTEGER,
+                free_qty INTEGER,
+                discount_percent REAL,
+                fixed_price REAL,
+                start_date DATE,
+                end_date DATE,
+                active INTEGER NOT NULL DEFAULT 1,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (product_id) REFERENCES Products(id),
+                FOREIGN KEY (category_id) REFERENCES Categories(id)
+            )
+        ''')
+
+        # Carts open on each POS terminal, rewritten shortly after every change so they survive a crash
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS HeldCarts (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                terminal TEXT NOT NULL,
+                label TEXT NOT NULL,
+                buyer_name TEXT,
+                buyer_contact TEXT,
+                items TEXT NOT NULL DEFAULT '[]',
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Monthly stock checkpoints: cumulative per product and batch quantities of every ledger row dated before checkpoint_date
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS StockCheckpoints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                checkpoint_date DATE NOT NULL UNIQUE,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS StockCheckpointItems (
+                checkpoint_id INTEGER NOT NULL,
+                product_id INTEGER NOT NULL,
+                batch_id INTEGER,
+                quantity INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (checkpoint_id) REFERENCES StockCheckpoints(id),
+                FOREIGN KEY (product_id) REFERENCES Products(id),
+                FOREIGN KEY (batch_id) REFERENCES ProductBatches(id)
+            )
+        ''')
+        # A backdated movement makes every later checkpoint stale; drop them so they get rebuilt
+        for event, row in (('INSERT', 'NEW'), ('UPDATE', 'OLD'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_stock_checkpoints_{event.lower()}_{row.lower()}
+                AFTER {event} ON StockLedger
+                WHEN {row}.date < (SELECT MAX(checkpoint_date) FROM StockCheckpoints)
+                BEGIN
+                    DELETE FROM StockCheckpointItems WHERE checkpoint_id IN
+                        (SELECT id FROM StockCheckpoints WHERE checkpoint_date > {row}.date);
+                    DELETE FROM StockCheckpoints WHERE checkpoint_date > {row}.date;
+                END
+            ''')
+
         # Indexes for performance
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_category ON Products(category_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_supplier ON Products(supplier_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_barcode ON Products(barcode)')
+        # One custom barcode per code, so a scan resolves to one product; replaces the plain index of earlier versions
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'idx_custom_barcodes_code'")
+        index_sql = cursor.fetchone()
+        if index_sql and 'UNIQUE' not in index_sql[0].upper():
+            cursor.execute('DROP INDEX idx_custom_barcodes_code')
+        try:
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_custom_barcodes_code ON CustomBarcodes(code)')
+        except sqlite3.IntegrityError:
+            # Codes already duplicated; keep the lookup fast until they are edited apart
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_custom_barcodes_code ON CustomBarcodes(code)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_name ON Products(name)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_batches_product ON ProductBatches(product_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_ledger_product ON StockLedger(product_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_batches_expiry ON ProductBatches(expiry_key) WHERE quantity > 0')
+        # Covers the per-product and per-batch ledger replay used by the stock audit
+        cursor.execute('DROP INDEX IF EXISTS idx_stock_ledger_product')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_ledger_product_movement ON StockLedger(product_id, batch_id, movement_type, quantity)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_ledger_batch ON StockLedger(batch_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_alerts_product ON StockAlerts(product_id)')
+        cursor.execute('DROP INDEX IF EXISTS idx_stock_checkpoint_items_checkpoint')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_checkpoint_items_product ON StockCheckpointItems(checkpoint_id, product_id, batch_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_name_key ON Customers(name_key)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customers_phone_key ON Customers(phone_key)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_customer ON SalesTransactions(customer_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_items_sale ON SalesItems(sale_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_returns_sale ON Returns(sale_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_returns_customer ON Returns(customer_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_return_items_return ON ReturnItems(return_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_ledger_customer ON CustomerLedger(customer_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_segments_segment ON CustomerSegments(segment)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_held_carts_terminal ON HeldCarts(terminal)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_promotions_active ON Promotions(active, start_date, end_date)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_supplier_ledger_supplier ON SupplierLedger(supplier_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_payroll_employee ON PayrollTransactions(employee_id)')
+        # Covers receivables aging, which reads only these columns per customer in date order
+        cursor.execute('DROP INDEX IF EXISTS idx_customer_ledger_customer_date')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_ledger_customer_date_amounts ON CustomerLedger(customer_id, date, debit, credit)')
+        # Date indexes so reports can seek straight to the open period
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_customer_ledger_date ON CustomerLedger(date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_general_ledger_date ON GeneralLedger(date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_date ON SalesTransactions(date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_ledger_date ON StockLedger(date)')
+        # Keyset paging of the stock ledger viewer: (date, id) per product or per movement type
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_ledger_product_date ON StockLedger(product_id, date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_ledger_movement_date ON StockLedger(movement_type, date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_date ON Expenses(date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_payroll_date ON PayrollTransactions(date)')
 
         # Create default admin user if no users exist
         cursor.execute("SELECT COUNT(*) FROM Users")
@@ -382,6 +845,48 @@ class Database:
         conn.close()
         return deleted
 
+    def migrate_stock_levels(self, cursor):
+        """Seed StockLevels from the ledger, posting an opening balance wherever the old stock figures disagree.
+
+        Before StockLevels existed, stock was kept in Products.current_stock and ProductBatches.quantity
+        independently. Batches are taken as the physical count for products that have them, otherwise
+        current_stock; the difference from the ledger is posted as an 'adjustment' so the ledger stays
+        the single source of truth. A batch's opening balance is posted to that batch, so the stock
+        audit can check each batch against its own ledger rows.
+        """
+        signed = "CASE movement_type WHEN 'out' THEN -quantity ELSE quantity END"
+        cursor.execute(f"""
+            INSERT INTO StockLedger (product_id, batch_id, movement_type, quantity, reason)
+            SELECT b.product_id, b.id, 'adjustment', b.quantity - COALESCE(l.quantity, 0), 'Opening balance'
+            FROM ProductBatches b
+            LEFT JOIN (
+                SELECT batch_id, SUM({signed}) AS quantity FROM StockLedger
+                WHERE batch_id IS NOT NULL GROUP BY batch_id
+            ) l ON l.batch_id = b.id
+            WHERE b.quantity != COALESCE(l.quantity, 0)
+        """)
+        # Products with batches: cancel the stock that was never in a batch. Others: match current_stock.
+        opening = "CASE WHEN b.product_id IS NULL THEN COALESCE(p.current_stock, 0) - COALESCE(l.total, 0) ELSE -COALESCE(l.loose, 0) END"
+        cursor.execute(f"""
+            INSERT INTO StockLedger (product_id, movement_type, quantity, reason)
+            SELECT p.id, 'adjustment', {opening}, 'Opening balance'
+            FROM Products p
+            LEFT JOIN (SELECT DISTINCT product_id FROM ProductBatches) b ON b.product_id = p.id
+            LEFT JOIN (
+                SELECT product_id, SUM({signed}) AS total,
+                       SUM(CASE WHEN batch_id IS NULL THEN {signed} ELSE 0 END) AS loose
+                FROM StockLedger GROUP BY product_id
+            ) l ON l.product_id = p.id
+            WHERE {opening} != 0
+        """)
+        # Rebuild from the full ledger, since the insert trigger only saw the opening balances
+        cursor.execute("DELETE FROM StockLevels")
+        cursor.execute("""
+            INSERT INTO StockLevels (product_id, quantity)
+            SELECT product_id, SUM(CASE movement_type WHEN 'out' THEN -quantity ELSE quantity END)
+            FROM StockLedger GROUP BY product_id
+        """)
+
 if __name__ == '__main__':
     db = Database()
     print("Database initialized.")
\ No newline at end of file
@@ -0,0 +1,301 @@
+"""
+Demand Forecasting for Eagle Traders
+Derives reorder points from sales velocity and lets the user review them before they become min stock levels
+"""
+
+import datetime
+import math
+from statistics import NormalDist
+
+import numpy as np
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget, QMessageBox,
+    QSpinBox, QDoubleSpinBox, QFormLayout
+)
+from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from notification_manager import show_success_notification, show_error_notification
+from ui_factory import setup_professional_table, create_professional_table_item
+
+# ProductDailySales.day (CAST(julianday(date) AS INTEGER)) minus date.toordinal() for the same calendar day
+JULIAN_DAY_OFFSET = 1721424
+
+
+class DemandForecast:
+    """Reorder points for every product at once from a product x day matrix of units sold.
+
+    Daily demand is forecast with simple exponential smoothing. Safety stock is
+    z * (standard deviation of recent daily demand) * sqrt(lead time), and the
+    reorder point is the forecast demand over the lead time plus safety stock.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    def daily_demand(self, days=730, end=None):
+        """Return (product_ids, matrix) where matrix[i, d] is units of product_ids[i] sold on day d of the window"""
+        end = end or datetime.date.today()
+        first_day = (end - datetime.timedelta(days=days - 1)).toordinal() + JULIAN_DAY_OFFSET
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM Products ORDER BY id")
+        product_ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+        matrix = np.zeros((len(product_ids), days), dtype=np.float32)
+        # One row per day with its products and quantities as text lists, parsed by NumPy in C,
+        # instead of a Python tuple per product-day
+        cursor.execute("""
+            SELECT day - ?, group_concat(product_id, ' '), group_concat(quantity, ' ')
+            FROM ProductDailySales
+            WHERE day >= ? AND day < ? AND quantity != 0
+            GROUP BY day
+        """, (first_day, first_day, first_day + days))
+        for day, products, quantities in cursor:
+            products = np.fromstring(products, dtype=np.int64, sep=' ')
+            pos = np.searchsorted(product_ids, products)
+            known = (pos < len(product_ids)) & (product_ids[np.minimum(pos, len(product_ids) - 1)] == products)
+            matrix[pos[known], day] = np.fromstring(quantities, dtype=np.float32, sep=' ')[known]
+        conn.close()
+        return product_ids, matrix
+
+    def compute(self, lead_time=7, service_level=0.95, alpha=0.1, variability_days=90, history_days=730):
+        """Return (product_id, avg_daily_demand, demand_std, safety_stock, reorder_point) for products with sales"""
+        product_ids, demand = self.daily_demand(history_days)
+        if not len(product_ids):
+            return []
+        # Start the smoothing from the first month's average, then run it over the rest in one pass per day
+        level = demand[:, :30].mean(axis=1)
+        for day in range(30, demand.shape[1]):
+            level += alpha * (demand[:, day] - level)
+        sigma = demand[:, -variability_days:].std(axis=1)
+        z = NormalDist().inv_cdf(service_level)
+        safety = z * sigma * math.sqrt(lead_time)
+        reorder = np.ceil(level * lead_time + safety)
+
+        sold = np.flatnonzero(demand.any(axis=1))
+        return list(zip(product_ids[sold].tolist(), level[sold].astype(float).round(3).tolist(),
+                        sigma[sold].astype(float).round(3).tolist(),
+                        np.ceil(safety[sold]).astype(int).tolist(), reorder[sold].astype(int).tolist()))
+
+    def write_suggestions(self, suggestions):
+        """Replace the stored suggestions with a fresh set from compute()"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("DELETE FROM ReorderSuggestions")
+            cursor.executemany("""
+                INSERT INTO ReorderSuggestions (product_id, avg_daily_demand, demand_std, safety_stock, suggested_min)
+                VALUES (?, ?, ?, ?, ?)
+            """, suggestions)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_suggestions(self):
+        """Suggestions that differ from the product's current min stock level"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT rs.product_id, p.name, rs.avg_daily_demand, rs.demand_std, rs.safety_stock,
+                   COALESCE(p.min_stock_level, 0), rs.suggested_min
+            FROM ReorderSuggestions rs
+            JOIN Products p ON p.id = rs.product_id
+            WHERE rs.suggested_min != COALESCE(p.min_stock_level, 0)
+            ORDER BY p.name
+        """)
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def apply(self, product_ids):
+        """Set min_stock_level to the suggested value for the given products"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.executemany("""
+                UPDATE Products SET min_stock_level =
+                    (SELECT suggested_min FROM ReorderSuggestions WHERE product_id = Products.id)
+                WHERE id = ?
+            """, [(product_id,) for product_id in product_ids])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+class ForecastThread(QThread):
+    """Thread for recomputing reorder suggestions"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db, lead_time, service_level):
+        super().__init__()
+        self.forecast = DemandForecast(db)
+        self.lead_time = lead_time
+        self.service_level = service_level
+
+    def run(self):
+        try:
+            suggestions = self.forecast.compute(self.lead_time, self.service_level)
+            self.forecast.write_suggestions(suggestions)
+            self.finished.emit(True, f"Reorder points calculated for {len(suggestions)} products")
+        except Exception as e:
+            self.finished.emit(False, f"Failed to calculate reorder points: {str(e)}")
+
+
+class ReorderReviewDialog(QDialog):
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.forecast = DemandForecast(db)
+        self.forecast_thread = None
+        self.setWindowTitle("Reorder Points")
+        self.resize(950, 600)
+
+        layout = QVBoxLayout(self)
+        form_layout = QFormLayout()
+        self.lead_time_spin = QSpinBox()
+        self.lead_time_spin.setRange(1, 180)
+        self.lead_time_spin.setValue(7)
+        self.lead_time_spin.setSuffix(" days")
+        form_layout.addRow("Supplier lead time:", self.lead_time_spin)
+        self.service_level_spin = QDoubleSpinBox()
+        self.service_level_spin.setRange(50.0, 99.9)
+        self.service_level_spin.setValue(95.0)
+        self.service_level_spin.setSuffix(" %")
+        form_layout.addRow("Service level:", self.service_level_spin)
+        layout.addLayout(form_layout)
+
+        self.table = QTableWidget()
+        setup_professional_table(self.table, [
+            "Apply", "Product", "Avg Daily Demand", "Std Dev", "Safety Stock", "Current Min", "Suggested Min"
+        ], ['text', 'text', 'numeric', 'numeric', 'numeric', 'numeric', 'numeric'])
+        layout.addWidget(self.table)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        btn_layout = QHBoxLayout()
+        self.calculate_btn = QPushButton("Recalculate")
+        self.calculate_btn.clicked.connect(self.recalculate)
+        btn_layout.addWidget(self.calculate_btn)
+        select_btn = QPushButton("Select All")
+        select_btn.clicked.connect(lambda: self.set_all_checked(Qt.CheckState.Checked))
+        btn_layout.addWidget(select_btn)
+        clear_btn = QPushButton("Select None")
+        clear_btn.clicked.connect(lambda: self.set_all_checked(Qt.CheckState.Unchecked))
+        btn_layout.addWidget(clear_btn)
+        btn_layout.addStretch()
+        apply_btn = QPushButton("Apply Selected")
+        apply_btn.clicked.connect(self.apply_selected)
+        btn_layout.addWidget(apply_btn)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+        self.load_suggestions()
+
+    def recalculate(self):
+        if self.forecast_thread and self.forecast_thread.isRunning():
+            return
+        self.calculate_btn.setEnabled(False)
+        self.status_label.setText("Calculating reorder points from sales history...")
+        self.forecast_thread = ForecastThread(self.db, self.lead_time_spin.value(),
+                                              self.service_level_spin.value() / 100)
+        self.forecast_thread.finished.connect(self.on_recalculated)
+        self.forecast_thread.start()
+
+    def on_recalculated(self, success, message):
+        self.calculate_btn.setEnabled(True)
+        if success:
+            show_success_notification("Reorder Points", message)
+            self.load_suggestions()
+        else:
+            self.status_label.setText(message)
+            show_error_notification("Reorder Points", message)
+
+    def load_suggestions(self):
+        try:
+            rows = self.forecast.get_suggestions()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to load reorder suggestions: {str(e)}")
+            return
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(rows))
+        for row, (product_id, name, avg, std, safety, current, suggested) in enumerate(rows):
+            check_item = create_professional_table_item("", 'text')
+            check_item.setFlags(check_item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+            check_item.setCheckState(Qt.CheckState.Checked)
+            check_item.setData(Qt.ItemDataRole.UserRole, product_id)
+            self.table.setItem(row, 0, check_item)
+            self.table.setItem(row, 1, create_professional_table_item(name, 'text'))
+            self.table.setItem(row, 2, create_professional_table_item(avg, 'numeric'))
+            self.table.setItem(row, 3, create_professional_table_item(std, 'numeric'))
+            self.table.setItem(row, 4, create_professional_table_item(safety, 'numeric'))
+            self.table.setItem(row, 5, create_professional_table_item(current, 'numeric'))
+            self.table.setItem(row, 6, create_professional_table_item(suggested, 'numeric'))
+        self.table.setSortingEnabled(True)
+        self.status_label.setText(f"{len(rows)} products with a suggested min stock level different from the current one"
+                                  if rows else "No pending suggestions. Recalculate to refresh them from sales history.")
+
+    def set_all_checked(self, state):
+        for row in range(self.table.rowCount()):
+            self.table.item(row, 0).setCheckState(state)
+
+    def apply_selected(self):
+        product_ids = [self.table.item(row, 0).data(Qt.ItemDataRole.UserRole) for row in range(self.table.rowCount())
+                       if self.table.item(row, 0).checkState() == Qt.CheckState.Checked]
+        if not product_ids:
+            QMessageBox.warning(self, "Error", "Select at least one product.")
+            return
+        try:
+            self.forecast.apply(product_ids)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to apply min stock levels: {str(e)}")
+            return
+        show_success_notification("Reorder Points", f"Min stock level updated for {len(product_ids)} products")
+        self.load_suggestions()
+
+    def reject(self):
+        if self.forecast_thread and self.forecast_thread.isRunning():
+            self.forecast_thread.wait()
+        super().reject()
+
+
+if __name__ == '__main__':
+    # Benchmark: 40k products, two years of daily sales
+    import os
+    import tempfile
+    import time
+    from database import Database
+
+    db = Database(os.path.join(tempfile.mkdtemp(), 'forecast_bench.db'))
+    conn = db.get_connection()
+    products = 40000
+    conn.executemany("INSERT INTO Products (id, name, unit_price) VALUES (?, ?, 100)",
+                     [(i, f"Product {i}") for i in range(1, products + 1)])
+    rng = np.random.default_rng(3)
+    first_day = datetime.date.today() - datetime.timedelta(days=729)
+    sale_id = 0
+    for day in range(730):
+        date = f"{first_day + datetime.timedelta(days=day)} 12:00:00"
+        sales = [(sale_id + i, date, 0, 'completed') for i in range(1, 501)]
+        items = [(sale_id + 1 + i % 500, int(product), int(quantity), 100, 100 * int(quantity))
+                 for i, (product, quantity) in enumerate(zip(rng.integers(1, products + 1, 6000),
+                                                             rng.integers(1, 6, 6000)))]
+        conn.executemany("INSERT INTO SalesTransactions (id, date, total_amount, status) VALUES (?, ?, ?, ?)", sales)
+        conn.executemany("INSERT INTO SalesItems (sale_id, product_id, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?)", items)
+        sale_id += 500
+    conn.commit()
+    conn.close()
+
+    forecast = DemandForecast(db)
+    started = time.perf_counter()
+    suggestions = forecast.compute()
+    computed = time.perf_counter() - started
+    forecast.write_suggestions(suggestions)
+    print(f"Reorder points for {len(suggestions)} products over 730 days: computed in {computed:.2f}s, "
+          f"written in {time.perf_counter() - started - computed:.2f}s")
@@ -0,0 +1,165 @@
+"""
+Document Store for Eagle Traders
+Generated PDFs filed under sharded directories, indexed in Documents and re-used while their source data is unchanged
+"""
+
+import collections
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+DOCUMENTS_ROOT = "documents"
+
+StoredDocument = collections.namedtuple('StoredDocument', 'doc_type entity_id source_hash path cached')
+
+
+class DocumentStore:
+    """Index of generated documents.
+
+    A document is identified by its type, the id of the sale/receipt/customer it is for, and a
+    hash of the data it was rendered from. prepare() returns the existing file when that hash
+    is already on disk, so a viewer click doesn't render the same PDF again; otherwise it
+    returns a fresh path for the caller to render to and register(). Files live under
+    <root>/<doc_type>/<first two hash characters>/, never under names built from customer input.
+    """
+    # Older versions of a document are deleted this long after a newer one replaced them
+    SUPERSEDED_DAYS = 30
+    # Documents nobody has opened for this long are gzipped; prepare() restores them on demand
+    COMPRESS_DAYS = 90
+
+    def __init__(self, db, root=DOCUMENTS_ROOT):
+        self.db = db
+        self.root = root
+
+    @staticmethod
+    def source_hash(source):
+        return hashlib.sha256(json.dumps(source, default=str, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def absolute(self, relative_path):
+        return os.path.abspath(os.path.join(self.root, relative_path))
+
+    def prepare(self, doc_type, entity_id, source):
+        """StoredDocument for rendering source; cached is True if path already holds that rendering"""
+        source_hash = self.source_hash(source)
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, path, compressed FROM Documents
+            WHERE doc_type = ? AND entity_id = ? AND source_hash = ?
+        """, (doc_type, entity_id, source_hash))
+        row = cursor.fetchone()
+        if row:
+            doc_id, relative_path, compressed = row
+            path = self.absolute(relative_path)
+            if compressed and os.path.exists(path + '.gz'):
+                with gzip.open(path + '.gz', 'rb') as packed, open(path, 'wb') as unpacked:
+                    shutil.copyfileobj(packed, unpacked)
+                os.remove(path + '.gz')
+                cursor.execute("UPDATE Documents SET compressed = 0 WHERE id = ?", (doc_id,))
+            if os.path.exists(path):
+                cursor.execute("UPDATE Documents SET last_opened_at = CURRENT_TIMESTAMP WHERE id = ?", (doc_id,))
+                conn.commit()
+                conn.close()
+                return StoredDocument(doc_type, entity_id, source_hash, path, True)
+            # The file was removed by hand; render it again under the same entry
+            cursor.execute("DELETE FROM Documents WHERE id = ?", (doc_id,))
+            conn.commit()
+        conn.close()
+
+        relative_path = os.path.join(doc_type, source_hash[:2], f"{doc_type}_{entity_id}_{source_hash[:12]}.pdf")
+        path = self.absolute(relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return StoredDocument(doc_type, entity_id, source_hash, path, False)
+
+    def register(self, document):
+        """Index a document once its file has been written"""
+        relative_path = os.path.relpath(document.path, os.path.abspath(self.root))
+        conn = self.db.get_connection()
+        conn.execute("""
+            INSERT OR REPLACE INTO Documents (doc_type, entity_id, source_hash, path, size)
+            VALUES (?, ?, ?, ?, ?)
+        """, (document.doc_type, document.entity_id, document.source_hash, relative_path,
+              os.path.getsize(document.path)))
+        conn.commit()
+        conn.close()
+
+    def cleanup(self):
+        """Delete superseded versions, gzip long-unopened files and drop entries whose files are gone;
+        returns (deleted, compressed, bytes saved)"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT d.id, d.path, d.compressed, d.size FROM Documents d
+            WHERE EXISTS (SELECT 1 FROM Documents n
+                          WHERE n.doc_type = d.doc_type AND n.entity_id = d.entity_id AND n.id > d.id
+                            AND n.created_at < datetime('now', '-{self.SUPERSEDED_DAYS} days'))
+        """)
+        superseded = cursor.fetchall()
+        cursor.execute(f"""
+            SELECT id, path, size FROM Documents
+            WHERE compressed = 0 AND last_opened_at < datetime('now', '-{self.COMPRESS_DAYS} days')
+        """)
+        stale = cursor.fetchall()
+        cursor.execute("SELECT id, path, compressed FROM Documents")
+        everything = cursor.fetchall()
+        conn.close()
+
+        deleted_ids, saved = [], 0
+        for doc_id, relative_path, compressed, size in superseded:
+            path = self.absolute(relative_path) + ('.gz' if compressed else '')
+            if os.path.exists(path):
+                saved += os.path.getsize(path)
+                os.remove(path)
+            deleted_ids.append(doc_id)
+        gone = set(deleted_ids)
+
+        compressed_ids = []
+        for doc_id, relative_path, size in stale:
+            path = self.absolute(relative_path)
+            if doc_id in gone or not os.path.exists(path):
+                continue
+            with open(path, 'rb') as unpacked, gzip.open(path + '.gz', 'wb') as packed:
+                shutil.copyfileobj(unpacked, packed)
+            saved += size - os.path.getsize(path + '.gz')
+            os.remove(path)
+            compressed_ids.append(doc_id)
+        done = gone | set(compressed_ids)
+
+        for doc_id, relative_path, compressed in everything:
+            path = self.absolute(relative_path) + ('.gz' if compressed else '')
+            if doc_id not in done and not os.path.exists(path):
+                deleted_ids.append(doc_id)
+
+        conn = self.db.get_connection()
+        try:
+            conn.execute("PRAGMA busy_timeout = 5000")
+            conn.executemany("DELETE FROM Documents WHERE id = ?", [(doc_id,) for doc_id in deleted_ids])
+            conn.executemany("UPDATE Documents SET compressed = 1 WHERE id = ?", [(doc_id,) for doc_id in compressed_ids])
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return len(deleted_ids), len(compressed_ids), saved
+
+
+class DocumentCleanupThread(QThread):
+    """Thread for cleaning up old generated documents"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db):
+        super().__init__()
+        self.store = DocumentStore(db)
+
+    def run(self):
+        try:
+            deleted, compressed, saved = self.store.cleanup()
+            self.finished.emit(True, f"{deleted} documents removed, {compressed} compressed, {saved / 1e6:.1f} MB freed")
+        except Exception as e:
+            self.finished.emit(False, f"Failed to clean up documents: {str(e)}")
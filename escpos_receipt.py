@@ -0,0 +1,493 @@
+"""
+ESC/POS Receipts for Eagle Traders
+Sale receipts for 58/80 mm thermal printers, sent to a device, a raw TCP port or a file
+"""
+
+import collections
+import datetime
+import os
+import socket
+import sys
+
+import numpy as np
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QFormLayout, QLineEdit, QComboBox, QCheckBox, QPlainTextEdit,
+    QPushButton, QMessageBox, QFileDialog, QDialogButtonBox
+)
+from PyQt6.QtGui import QImage, QPainter, QFont, QFontDatabase, QFontMetrics
+from PyQt6.QtCore import Qt, QRect, QThread, pyqtSignal
+
+ESC = b'\x1b'
+GS = b'\x1d'
+INIT = ESC + b'@'
+CODE_PAGE_437 = ESC + b't\x00'
+ALIGN = {'left': ESC + b'a\x00', 'center': ESC + b'a\x01', 'right': ESC + b'a\x02'}
+BOLD_ON, BOLD_OFF = ESC + b'E\x01', ESC + b'E\x00'
+DOUBLE_ON, DOUBLE_OFF = GS + b'!\x11', GS + b'!\x00'
+FEED_AND_CUT = GS + b'V\x42\x03'
+OPEN_DRAWER = ESC + b'p\x00\x19\xfa'
+
+# Print head width in dots and Font A (12 x 24) characters per line
+PAPER = {58: (384, 32), 80: (576, 48)}
+DEFAULT_COLUMNS = {58: "name:*,qty:4,total:9", 80: "name:*,qty:5,price:9,disc:5,total:10"}
+COLUMN_TITLES = {'name': "Item", 'qty': "Qty", 'price': "Price", 'disc': "Disc", 'total': "Total"}
+DEFAULT_HEADER = "Eagle Traders\nDanish Colony Nowshera Road Mardan\nPhone: +92 330 - 6500009"
+DEFAULT_FOOTER = ("۱. واپسی ممکن ہے اگر مصنوعات میں کم از کم 30 دن باقی ہوں۔\n"
+                  "۲. ڈیلیوری کے وقت سامان کی جانچ پڑتال کریں۔\n"
+                  "۳. خریداری کے بعد کسی قسم کی ذمہ داری نہیں ہوگی۔")
+URDU_FONT_PATH = "fonts/NotoNastaliqUrdu-VariableFont_wght.ttf"
+RASTER_PIXEL_SIZE = 22
+# Narrowest the name column may be squeezed to by wide numbers before the name gets its own line
+MIN_NAME_WIDTH = 4
+
+
+def parse_columns(spec, chars):
+    """[(key, width)] from 'name:*,qty:5,...'; the '*' column takes what the others leave"""
+    columns = []
+    for part in spec.split(','):
+        key, _, width = part.strip().partition(':')
+        if key not in COLUMN_TITLES:
+            raise ValueError(f"Unknown receipt column '{key}'")
+        columns.append((key, width.strip()))
+    fixed = sum(int(width) for _, width in columns if width != '*')
+    flexible = [key for key, width in columns if width == '*']
+    # One space between columns
+    spare = chars - fixed - (len(columns) - 1)
+    if len(flexible) > 1 or (flexible and spare < 4) or (not flexible and spare < 0):
+        raise ValueError(f"Receipt columns don't fit {chars} characters")
+    return [(key, spare if width == '*' else int(width)) for key, width in columns]
+
+
+def pack_raster(image, stretch=False):
+    """GS v 0 raster command for a Grayscale8 image, dark pixels printed.
+
+    With stretch, the threshold sits halfway between the darkest pixel and white, so a
+    light-coloured logo still prints as a solid shape.
+    """
+    width, height = image.width(), image.height()
+    pixels = np.frombuffer(image.constBits().asarray(image.sizeInBytes()), dtype=np.uint8)
+    pixels = pixels.reshape(height, image.bytesPerLine())[:, :width]
+    threshold = (int(pixels.min()) + 256) // 2 if stretch and pixels.size else 128
+    bits = np.packbits(pixels < threshold, axis=1)
+    row_bytes = bits.shape[1]
+    return (GS + b'v0\x00' + bytes([row_bytes & 0xff, row_bytes >> 8, height & 0xff, height >> 8])
+            + bits.tobytes())
+
+
+def is_rtl(text):
+    # Hebrew, Arabic and Urdu blocks
+    return any('\u0590' <= ch <= '\u08ff' for ch in text)
+
+
+class RasterCache:
+    """Raster commands for text lines the printer's code page can't show (Urdu) and for the logo.
+
+    Header and footer lines and the logo repeat on every receipt, so each is drawn once and
+    the packed bytes reused; entries are keyed on everything that changes the output.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.font_family = None
+
+    def get(self, key, render):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        data = render()
+        self.entries[key] = data
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return data
+
+    def font(self):
+        if self.font_family is None:
+            if getattr(sys, 'frozen', False):
+                font_path = os.path.join(sys._MEIPASS, URDU_FONT_PATH)
+            else:
+                font_path = URDU_FONT_PATH
+            font_id = QFontDatabase.addApplicationFont(font_path)
+            families = QFontDatabase.applicationFontFamilies(font_id) if font_id != -1 else []
+            self.font_family = families[0] if families else "Arial"
+        font = QFont(self.font_family)
+        font.setPixelSize(RASTER_PIXEL_SIZE)
+        return font
+
+    def text_line(self, text, width, align):
+        def render():
+            font = self.font()
+            height = QFontMetrics(font).height()
+            image = QImage(width, height, QImage.Format.Format_Grayscale8)
+            image.fill(Qt.GlobalColor.white)
+            painter = QPainter(image)
+            painter.setFont(font)
+            painter.setPen(Qt.GlobalColor.black)
+            flags = {'left': Qt.AlignmentFlag.AlignLeft, 'center': Qt.AlignmentFlag.AlignHCenter,
+                     'right': Qt.AlignmentFlag.AlignRight}[align]
+            painter.drawText(QRect(0, 0, width, height), flags | Qt.AlignmentFlag.AlignVCenter, text)
+            painter.end()
+            return pack_raster(image)
+        return self.get(('text', text, width, align), render)
+
+    def cells_line(self, cells, width, chars):
+        """A column row rastered cell by cell, so right-to-left names don't reorder the columns;
+        cells are (text, start char, width in chars, align)"""
+        def render():
+            font = self.font()
+            height = QFontMetrics(font).height()
+            image = QImage(width, height, QImage.Format.Format_Grayscale8)
+            image.fill(Qt.GlobalColor.white)
+            painter = QPainter(image)
+            painter.setFont(font)
+            painter.setPen(Qt.GlobalColor.black)
+            dots_per_char = width / chars
+            for text, start, span, align in cells:
+                flags = Qt.AlignmentFlag.AlignRight if align == 'right' else Qt.AlignmentFlag.AlignLeft
+                painter.drawText(QRect(round(start * dots_per_char), 0, round(span * dots_per_char), height),
+                                 flags | Qt.AlignmentFlag.AlignVCenter, text)
+            painter.end()
+            return pack_raster(image)
+        return self.get(('cells', cells, width, chars), render)
+
+    def logo(self, path, width):
+        """Logo scaled to at most a third of the paper, or b'' if it can't be read"""
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return b''
+
+        def render():
+            image = QImage(path)
+            if image.isNull():
+                return b''
+            target = min(image.width(), width // 3)
+            image = image.scaledToWidth(target, Qt.TransformationMode.SmoothTransformation)
+            # Transparent areas print as paper
+            canvas = QImage(width, image.height(), QImage.Format.Format_Grayscale8)
+            canvas.fill(Qt.GlobalColor.white)
+            painter = QPainter(canvas)
+            painter.drawImage((width - image.width()) // 2, 0, image)
+            painter.end()
+            return pack_raster(canvas, stretch=True)
+        return self.get(('logo', path, mtime, width), render)
+
+
+class ReceiptBuilder:
+    """Builds the ESC/POS byte stream for one receipt"""
+
+    def __init__(self, paper_mm=80, columns=None, cache=None):
+        self.dots, self.chars = PAPER[paper_mm]
+        self.columns = parse_columns(columns or DEFAULT_COLUMNS[paper_mm], self.chars)
+        self.cache = cache or RasterCache()
+        self.parts = [INIT, CODE_PAGE_437]
+
+    def text(self, line, align='left', bold=False, double=False):
+        """A line in the printer's font, or rastered if it has characters code page 437 lacks"""
+        try:
+            encoded = line.encode('cp437')
+        except UnicodeEncodeError:
+            if align == 'left' and is_rtl(line):
+                align = 'right'
+            self.parts += [ALIGN['left'], self.cache.text_line(line, self.dots, align)]
+            return self
+        self.parts += [ALIGN[align], BOLD_ON if bold else b'', DOUBLE_ON if double else b'',
+                       encoded, b'\n', DOUBLE_OFF if double else b'', BOLD_OFF if bold else b'']
+        return self
+
+    def rule(self, char='-'):
+        return self.text(char * self.chars)
+
+    def pair(self, label, value, bold=False):
+        """Label on the left, value on the right of one line"""
+        return self.text(f"{label}{value:>{self.chars - len(label)}}", bold=bold)
+
+    def row(self, values, bold=False):
+        """One line laid out in the configured columns.
+
+        Numbers are never cut: a column too narrow for its value widens at the name column's
+        expense, and a name left narrower than MIN_NAME_WIDTH goes on a line of its own first.
+        """
+        values = {key: str(values.get(key, "")) for key, _ in self.columns}
+        columns = [(key, width if key == 'name' else max(width, len(values[key]))) for key, width in self.columns]
+        overflow = sum(width for _, width in columns) + len(columns) - 1 - self.chars
+        if overflow > 0 and 'name' in values:
+            name_width = dict(columns)['name'] - overflow
+            if name_width < MIN_NAME_WIDTH:
+                self.cells([('name', self.chars)], values, bold)
+                values['name'] = ""
+                name_width = max(name_width, 0)
+            columns = [(key, name_width if key == 'name' else width) for key, width in columns]
+        return self.cells(columns, values, bold)
+
+    def cells(self, columns, values, bold=False):
+        """One line of [(key, width)] cells; names are cut to their width and left aligned, the rest right aligned"""
+        cells = [values[key][:width].ljust(width) if key == 'name' else values[key].rjust(width)
+                 for key, width in columns]
+        line = " ".join(cells)
+        try:
+            line.encode('cp437')
+        except UnicodeEncodeError:
+            spans, start = [], 0
+            for (key, width), cell in zip(columns, cells):
+                spans.append((cell.strip(), start, width, 'right' if key != 'name' or is_rtl(cell) else 'left'))
+                start += width + 1
+            self.parts += [ALIGN['left'], self.cache.cells_line(tuple(spans), self.dots, self.chars)]
+            return self
+        return self.text(line, bold=bold)
+
+    def logo(self, path):
+        self.parts += [ALIGN['left'], self.cache.logo(path, self.dots)]
+        return self
+
+    def raw(self, data):
+        self.parts.append(data)
+        return self
+
+    def build(self):
+        return b''.join(self.parts)
+
+
+def sale_receipt(settings, sale, cache=None):
+    """ESC/POS bytes for a sale.
+
+    settings: dict with paper_mm, columns, logo_path, header, footer, open_drawer
+    sale: dict with sale_id, date, buyer_name, items ([product_id, name, qty, price, discount, total]),
+    total, amount_received, change, balance_due
+    """
+    builder = ReceiptBuilder(settings.get('paper_mm') or 80, settings.get('columns'), cache)
+    if settings.get('logo_path'):
+        builder.logo(settings['logo_path'])
+    for i, line in enumerate((settings.get('header') or DEFAULT_HEADER).splitlines()):
+        builder.text(line, 'center', bold=i == 0, double=i == 0)
+    builder.rule()
+    builder.pair("Receipt #", str(sale['sale_id']))
+    builder.pair("Date", sale['date'])
+    if sale.get('buyer_name'):
+        builder.text(f"Customer: {sale['buyer_name']}")
+    builder.rule()
+    builder.row(COLUMN_TITLES, bold=True)
+    for _, name, qty, price, discount, line_total in sale['items']:
+        builder.row({'name': name, 'qty': qty, 'price': f"{price:.2f}", 'disc': f"{discount:g}%" if discount else "",
+                     'total': f"{line_total:.2f}"})
+    builder.rule()
+    builder.pair("TOTAL Rs.", f"{sale['total']:.2f}", bold=True)
+    builder.pair("Received", f"{sale['amount_received']:.2f}")
+    if sale['change']:
+        builder.pair("Change", f"{sale['change']:.2f}")
+    if sale['balance_due']:
+        builder.pair("Balance Due", f"{sale['balance_due']:.2f}", bold=True)
+    builder.rule()
+    for line in (settings.get('footer') or DEFAULT_FOOTER).splitlines():
+        builder.text(line, 'center')
+    builder.raw(FEED_AND_CUT)
+    if settings.get('open_drawer'):
+        builder.raw(OPEN_DRAWER)
+    return builder.build()
+
+
+def send(output, target, data, timeout=3):
+    """Write a receipt to a printer device path, a raw TCP port (host[:port], 9100 by default) or a file"""
+    if output == 'tcp':
+        host, _, port = target.partition(':')
+        with socket.create_connection((host, int(port or 9100)), timeout=timeout) as sock:
+            sock.sendall(data)
+    elif output == 'device':
+        with open(target, 'wb', buffering=0) as device:
+            device.write(data)
+    elif output == 'file':
+        with open(target, 'ab') as stand_in:
+            stand_in.write(data)
+    else:
+        raise ValueError(f"Unknown receipt output '{output}'")
+
+
+class ReceiptPrinterSettings:
+    """The ReceiptPrinters row of a terminal"""
+    FIELDS = ['output', 'target', 'paper_mm', 'columns', 'logo_path', 'header', 'footer', 'open_drawer', 'open_pdf']
+
+    def __init__(self, db, terminal=None):
+        self.db = db
+        self.terminal = terminal or socket.gethostname()
+
+    def load(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {', '.join(self.FIELDS)} FROM ReceiptPrinters WHERE terminal = ?", (self.terminal,))
+        row = cursor.fetchone()
+        conn.close()
+        if not row:
+            return {'output': 'none', 'target': '', 'paper_mm': 80, 'columns': '', 'logo_path': 'header.png',
+                    'header': DEFAULT_HEADER, 'footer': DEFAULT_FOOTER, 'open_drawer': 0, 'open_pdf': 1}
+        return dict(zip(self.FIELDS, row))
+
+    def save(self, settings):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO ReceiptPrinters (terminal, {', '.join(self.FIELDS)})
+            VALUES (?, {', '.join('?' * len(self.FIELDS))})
+        """, (self.terminal, *[settings[field] for field in self.FIELDS]))
+        conn.commit()
+        conn.close()
+
+
+class ReceiptPrintThread(QThread):
+    """Sends receipt bytes without holding up the POS if the printer is slow or offline"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, output, target, data):
+        super().__init__()
+        self.output = output
+        self.target = target
+        self.data = data
+
+    def run(self):
+        try:
+            send(self.output, self.target, self.data)
+            self.finished.emit(True, "Receipt printed")
+        except Exception as e:
+            self.finished.emit(False, f"Failed to print receipt: {str(e)}")
+
+
+class ReceiptPrinterDialog(QDialog):
+    """Receipt printer settings for this terminal, with a test print"""
+
+    def __init__(self, db, cache=None, parent=None):
+        super().__init__(parent)
+        self.store = ReceiptPrinterSettings(db)
+        self.cache = cache or RasterCache()
+        self.test_thread = None
+        self.setWindowTitle("Receipt Printer")
+        self.resize(500, 520)
+        settings = self.store.load()
+
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.output_combo = QComboBox()
+        for output, label in (('none', "Off (PDF invoice only)"), ('device', "Printer Device"),
+                              ('tcp', "Network Printer (TCP)"), ('file', "File (testing)")):
+            self.output_combo.addItem(label, output)
+        self.output_combo.setCurrentIndex(max(self.output_combo.findData(settings['output']), 0))
+        form.addRow("Output:", self.output_combo)
+        self.target_edit = QLineEdit(settings['target'] or "")
+        self.target_edit.setPlaceholderText("/dev/usb/lp0, 192.168.1.50:9100 or receipts.bin")
+        form.addRow("Device / Address / File:", self.target_edit)
+        self.paper_combo = QComboBox()
+        self.paper_combo.addItem("80 mm", 80)
+        self.paper_combo.addItem("58 mm", 58)
+        self.paper_combo.setCurrentIndex(max(self.paper_combo.findData(settings['paper_mm']), 0))
+        form.addRow("Paper:", self.paper_combo)
+        self.columns_edit = QLineEdit(settings['columns'] or "")
+        self.columns_edit.setPlaceholderText(f"Default: {DEFAULT_COLUMNS[80]}")
+        form.addRow("Columns:", self.columns_edit)
+        logo_layout = QHBoxLayout()
+        self.logo_edit = QLineEdit(settings['logo_path'] or "")
+        logo_layout.addWidget(self.logo_edit)
+        browse_btn = QPushButton("Browse...")
+        browse_btn.clicked.connect(self.browse_logo)
+        logo_layout.addWidget(browse_btn)
+        form.addRow("Logo:", logo_layout)
+        self.header_edit = QPlainTextEdit(settings['header'] or "")
+        self.header_edit.setMaximumHeight(80)
+        form.addRow("Header:", self.header_edit)
+        self.footer_edit = QPlainTextEdit(settings['footer'] or "")
+        self.footer_edit.setMaximumHeight(80)
+        form.addRow("Footer:", self.footer_edit)
+        self.drawer_check = QCheckBox("Open cash drawer after printing")
+        self.drawer_check.setChecked(bool(settings['open_drawer']))
+        form.addRow(self.drawer_check)
+        self.pdf_check = QCheckBox("Also open the PDF invoice after each sale")
+        self.pdf_check.setChecked(bool(settings['open_pdf']))
+        form.addRow(self.pdf_check)
+        layout.addLayout(form)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Save | QDialogButtonBox.StandardButton.Cancel)
+        test_btn = buttons.addButton("Test Print", QDialogButtonBox.ButtonRole.ActionRole)
+        test_btn.clicked.connect(self.test_print)
+        buttons.accepted.connect(self.save)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def browse_logo(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Select Logo", "", "Images (*.png *.jpg *.bmp)")
+        if file_path:
+            self.logo_edit.setText(file_path)
+
+    def settings(self):
+        settings = {
+            'output': self.output_combo.currentData(),
+            'target': self.target_edit.text().strip(),
+            'paper_mm': self.paper_combo.currentData(),
+            'columns': self.columns_edit.text().strip(),
+            'logo_path': self.logo_edit.text().strip(),
+            'header': self.header_edit.toPlainText().strip(),
+            'footer': self.footer_edit.toPlainText().strip(),
+            'open_drawer': int(self.drawer_check.isChecked()),
+            'open_pdf': int(self.pdf_check.isChecked()),
+        }
+        if settings['output'] != 'none' and not settings['target']:
+            raise ValueError("Enter the printer device, network address or file.")
+        parse_columns(settings['columns'] or DEFAULT_COLUMNS[settings['paper_mm']], PAPER[settings['paper_mm']][1])
+        return settings
+
+    def save(self):
+        try:
+            settings = self.settings()
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        try:
+            self.store.save(settings)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to save receipt printer: {str(e)}")
+            return
+        self.accept()
+
+    def test_print(self):
+        try:
+            settings = self.settings()
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        if settings['output'] == 'none':
+            QMessageBox.warning(self, "Error", "Choose an output to test.")
+            return
+        sale = {'sale_id': 0, 'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M'), 'buyer_name': "Test",
+                'items': [[0, "Test item", 2, 150.0, 0, 300.0], [0, "ٹیسٹ آئٹم", 1, 99.5, 10, 89.55]],
+                'total': 389.55, 'amount_received': 400.0, 'change': 10.45, 'balance_due': 0.0}
+        self.test_thread = ReceiptPrintThread(settings['output'], settings['target'],
+                                              sale_receipt(settings, sale, self.cache))
+        self.test_thread.finished.connect(
+            lambda success, message: (QMessageBox.information if success else QMessageBox.warning)(
+                self, "Test Print", message))
+        self.test_thread.start()
+
+
+if __name__ == '__main__':
+    # Benchmark: python escpos_receipt.py -- a 30-line 80 mm receipt with logo and Urdu footer, written to a file
+    import tempfile
+    import time
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    settings = {'paper_mm': 80, 'columns': '', 'logo_path': 'header.png', 'header': DEFAULT_HEADER,
+                'footer': DEFAULT_FOOTER, 'open_drawer': 1}
+    items = [[i, f"Product {i}" if i % 5 else f"چاول {i}", i % 4 + 1, 120.0 + i, 5 if i % 3 == 0 else 0,
+              (i % 4 + 1) * (120.0 + i)] for i in range(30)]
+    sale = {'sale_id': 1042, 'date': '2026-10-19 12:00', 'buyer_name': "Walk-in", 'items': items,
+            'total': sum(item[5] for item in items), 'amount_received': 20000.0, 'change': 1.0, 'balance_due': 0.0}
+    target = os.path.join(tempfile.mkdtemp(), 'receipts.bin')
+    cache = RasterCache()
+    for label in ("Cold", "Warm"):
+        started = time.perf_counter()
+        data = sale_receipt(settings, sale, cache)
+        send('file', target, data)
+        print(f"{label}: {len(data):,} bytes built and written in {(time.perf_counter() - started) * 1000:.1f} ms")
+    for paper in (58, 80):
+        settings['paper_mm'] = paper
+        started = time.perf_counter()
+        runs = 50
+        for _ in range(runs):
+            sale_receipt(settings, sale, cache)
+        print(f"{paper} mm warm build: {(time.perf_counter() - started) / runs * 1000:.2f} ms")
@@ -7,8 +7,11 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtCore import QDate, Qt
 from PyQt6.QtGui import QFont
 from database import Database
+from period_close import PeriodClose
+from data_export import ExportDialog
 from ui_factory import setup_professional_table, create_professional_table_item
 import os
+import sqlite3
 import sys
 
 
@@ -16,6 +19,7 @@ class ExpenseManagement(QWidget):
     def __init__(self, db):
         super().__init__()
         self.db = db
+        self.period_close = PeriodClose(db)
         self.init_ui()
 
     def init_ui(self):
@@ -55,7 +59,13 @@ class ExpenseManagement(QWidget):
         # Title
         title = QLabel("Expense Management")
         title.setStyleSheet("font-size: 18pt; font-weight: bold; margin-bottom: 10px; color: #ffffff;")
-        layout.addWidget(title)
+        title_layout = QHBoxLayout()
+        title_layout.addWidget(title)
+        title_layout.addStretch()
+        export_btn = QPushButton("Export Data")
+        export_btn.clicked.connect(lambda: ExportDialog(self.db, self, "Expenses" if self.tabs.currentIndex() else "Payroll").exec())
+        title_layout.addWidget(export_btn)
+        layout.addLayout(title_layout)
 
         self.tabs = QTabWidget()
         layout.addWidget(self.tabs)
@@ -247,10 +257,16 @@ class ExpenseManagement(QWidget):
             employee_id, date, amount, description = dialog.get_data()
             conn = self.db.get_connection()
             cur = conn.cursor()
-            cur.execute("INSERT INTO PayrollTransactions (employee_id, date, amount, description) VALUES (?, ?, ?, ?)",
-                       (employee_id, date, amount, description))
-            conn.commit()
-            conn.close()
+            try:
+                cur.execute("INSERT INTO PayrollTransactions (employee_id, date, amount, description) VALUES (?, ?, ?, ?)",
+                           (employee_id, date, amount, description))
+                conn.commit()
+            except sqlite3.IntegrityError as e:
+                # Raised by the period lock trigger for dates in a closed period
+                QMessageBox.warning(self, "Error", f"Failed to add payroll transaction: {str(e)}")
+                return
+            finally:
+                conn.close()
             self.load_payroll()
             self.update_salaries_summary()
             QMessageBox.information(self, "Success", "Payroll transaction added successfully.")
@@ -267,10 +283,16 @@ class ExpenseManagement(QWidget):
 
         conn = self.db.get_connection()
         cur = conn.cursor()
-        cur.execute("INSERT INTO Expenses (date, category, description, amount) VALUES (?, ?, ?, ?)",
-                   (date, category, description, amount))
-        conn.commit()
-        conn.close()
+        try:
+            cur.execute("INSERT INTO Expenses (date, category, description, amount) VALUES (?, ?, ?, ?)",
+                       (date, category, description, amount))
+            conn.commit()
+        except sqlite3.IntegrityError as e:
+            # Raised by the period lock trigger for dates in a closed period
+            QMessageBox.warning(self, "Error", f"Failed to add expense: {str(e)}")
+            return
+        finally:
+            conn.close()
         self.load_expenses()
         self.update_expenses_summary()
         # Clear fields
@@ -279,19 +301,11 @@ class ExpenseManagement(QWidget):
         QMessageBox.information(self, "Success", "Expense added successfully.")
 
     def update_salaries_summary(self):
-        conn = self.db.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT SUM(amount) FROM PayrollTransactions")
-        total = cur.fetchone()[0] or 0
-        conn.close()
+        total = self.period_close.payroll_total()
         self.total_salaries_label.setText(f"Total Salaries Paid: Rs. {total:,.2f}")
 
     def update_expenses_summary(self):
-        conn = self.db.get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT SUM(amount) FROM Expenses")
-        total = cur.fetchone()[0] or 0
-        conn.close()
+        total = self.period_close.expense_total()
         self.total_expenses_label.setText(f"Total Expenses: Rs. {total:,.2f}")
 
 
@@ -0,0 +1,96 @@
+"""
+Held Carts for Eagle Traders
+Parked carts per POS terminal, journaled to HeldCarts so an unfinished sale survives a crash
+"""
+
+import json
+import socket
+import sqlite3
+
+
+class CartJournal:
+    """Open carts of one terminal, kept in HeldCarts.
+
+    Changes only mark a cart dirty; flush() writes every dirty cart in one short transaction,
+    so the POS can call it from a timer a moment after the last change instead of writing on
+    every keystroke or scan.
+    """
+    # A checkout waiting on its payment dialog can hold the write lock; try again on the next flush
+    BUSY_TIMEOUT_MS = 200
+
+    def __init__(self, db, terminal=None):
+        self.db = db
+        self.terminal = terminal or socket.gethostname()
+        self.dirty = {}  # cart id -> cart dict
+
+    def load(self):
+        """This terminal's carts as dicts (id, label, buyer_name, buyer_contact, items), oldest first"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, label, buyer_name, buyer_contact, items FROM HeldCarts
+            WHERE terminal = ? ORDER BY id
+        """, (self.terminal,))
+        rows = cursor.fetchall()
+        conn.close()
+        carts = []
+        for cart_id, label, buyer_name, buyer_contact, items in rows:
+            try:
+                items = [list(item) for item in json.loads(items)]
+            except ValueError:
+                items = []  # A torn write can't happen inside a transaction, but never fail a restore
+            carts.append({'id': cart_id, 'label': label, 'buyer_name': buyer_name or "",
+                          'buyer_contact': buyer_contact or "", 'items': items})
+        return carts
+
+    def create(self, label):
+        """A new empty cart, written immediately"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO HeldCarts (terminal, label) VALUES (?, ?)", (self.terminal, label))
+        cart_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+        return {'id': cart_id, 'label': label, 'buyer_name': "", 'buyer_contact': "", 'items': []}
+
+    def mark(self, cart):
+        self.dirty[cart['id']] = cart
+
+    def flush(self):
+        """Write all dirty carts; return False if the database was busy and they are still pending"""
+        if not self.dirty:
+            return True
+        rows = [(cart['label'], cart['buyer_name'], cart['buyer_contact'],
+                 json.dumps(cart['items'], separators=(',', ':')), cart_id)
+                for cart_id, cart in self.dirty.items()]
+        conn = self.db.get_connection()
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {self.BUSY_TIMEOUT_MS}")
+            conn.executemany("""
+                UPDATE HeldCarts SET label = ?, buyer_name = ?, buyer_contact = ?, items = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            """, rows)
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+            return False
+        finally:
+            conn.close()
+        self.dirty.clear()
+        return True
+
+    def settle(self, cursor, cart_id):
+        """Empty a cart on the sale's own cursor, so it commits or rolls back with the sale"""
+        cursor.execute("""
+            UPDATE HeldCarts SET buyer_name = '', buyer_contact = '', items = '[]', updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (cart_id,))
+
+    def discard(self, cart_id):
+        """Remove a cart once it is sold or abandoned"""
+        self.dirty.pop(cart_id, None)
+        conn = self.db.get_connection()
+        conn.execute("DELETE FROM HeldCarts WHERE id = ?", (cart_id,))
+        conn.commit()
+        conn.close()
@@ -1,19 +1,30 @@
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox,
     QPushButton, QTableWidget, QTableWidgetItem, QDialog, QDialogButtonBox,
-    QFormLayout, QSpinBox, QHeaderView, QMessageBox, QScrollArea
+    QFormLayout, QSpinBox, QHeaderView, QMessageBox, QScrollArea, QDateEdit, QCompleter
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer, QDate, QStringListModel
 from database import Database
+from data_export import ExportDialog
+from demand_forecast import ReorderReviewDialog
+from stock import SIGNED_QUANTITY, StockService, record_stock_movement
+from stock_audit import StockAuditDialog, StockAsOfDialog, StockCheckpointThread
 from ui_factory import setup_professional_table, create_professional_table_item, ensure_table_visibility
 
 class InventoryManagement(QWidget):
     def __init__(self, db):
         super().__init__()
         self.db = db
+        self.checkpoint_thread = None
         self.init_ui()
         self.load_inventory()
 
+        # Keep monthly stock checkpoints current so as-of queries replay at most a month of ledger rows
+        self.checkpoint_timer = QTimer(self)
+        self.checkpoint_timer.timeout.connect(self.write_stock_checkpoints)
+        self.checkpoint_timer.start(6 * 60 * 60 * 1000)
+        QTimer.singleShot(0, self.write_stock_checkpoints)
+
     def init_ui(self):
         # Main scroll area
         scroll_area = QScrollArea()
@@ -61,6 +72,10 @@ class InventoryManagement(QWidget):
         set_min_btn.clicked.connect(self.set_min_stock)
         button_layout.addWidget(set_min_btn)
 
+        reorder_btn = QPushButton("Reorder Points")
+        reorder_btn.clicked.connect(self.review_reorder_points)
+        button_layout.addWidget(reorder_btn)
+
         low_stock_btn = QPushButton("Low Stock Alert")
         low_stock_btn.clicked.connect(self.show_low_stock)
         button_layout.addWidget(low_stock_btn)
@@ -69,6 +84,14 @@ class InventoryManagement(QWidget):
         ledger_btn.clicked.connect(self.view_ledger)
         button_layout.addWidget(ledger_btn)
 
+        reconcile_btn = QPushButton("Reconcile Stock")
+        reconcile_btn.clicked.connect(self.reconcile_stock)
+        button_layout.addWidget(reconcile_btn)
+
+        as_of_btn = QPushButton("Stock As Of Date")
+        as_of_btn.clicked.connect(self.show_stock_as_of)
+        button_layout.addWidget(as_of_btn)
+
         layout.addLayout(button_layout)
 
         # Set the scroll area as the main widget
@@ -79,8 +102,9 @@ class InventoryManagement(QWidget):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT p.id, p.name, p.current_stock, p.min_stock_level, c.name
+            SELECT p.id, p.name, COALESCE(sl.quantity, 0), p.min_stock_level, c.name
             FROM Products p
+            LEFT JOIN StockLevels sl ON sl.product_id = p.id
             LEFT JOIN Categories c ON p.category_id = c.id
         """)
         products = cursor.fetchall()
@@ -151,14 +175,7 @@ class InventoryManagement(QWidget):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         try:
-            # Update product stock
-            cursor.execute("UPDATE Products SET current_stock = current_stock + ? WHERE id = ?", (quantity, product_id))
-            # Insert into StockLedger
-            movement_type = 'in' if quantity > 0 else 'out' if quantity < 0 else 'adjustment'
-            cursor.execute("""
-                INSERT INTO StockLedger (product_id, movement_type, quantity, reason)
-                VALUES (?, ?, ?, ?)
-            """, (product_id, movement_type, abs(quantity), reason))
+            record_stock_movement(cursor, product_id, quantity, reason)
             conn.commit()
             QMessageBox.information(dialog, "Success", "Stock adjusted successfully.")
             dialog.accept()
@@ -232,13 +249,20 @@ class InventoryManagement(QWidget):
         for prod_id, name in products:
             self.min_product_combo.addItem(name, prod_id)
 
+    def review_reorder_points(self):
+        dialog = ReorderReviewDialog(self.db, self)
+        dialog.exec()
+        self.load_inventory()
+
     def show_low_stock(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT name, current_stock, min_stock_level FROM Products
-            WHERE current_stock <= min_stock_level
-            ORDER BY name
+            SELECT p.name, COALESCE(sl.quantity, 0), p.min_stock_level
+            FROM Products p
+            LEFT JOIN StockLevels sl ON sl.product_id = p.id
+            WHERE COALESCE(sl.quantity, 0) <= p.min_stock_level
+            ORDER BY p.name
         """)
         low_stock_products = cursor.fetchall()
         conn.close()
@@ -252,71 +276,30 @@ class InventoryManagement(QWidget):
             message += f"{name}: Current {stock}, Min {min_stock}\n"
         QMessageBox.warning(self, "Low Stock Alert", message)
 
-    def view_ledger(self):
-        dialog = QDialog(self)
-        dialog.setWindowTitle("Stock Ledger")
-        dialog.resize(800, 600)
-        layout = QVBoxLayout(dialog)
+    def reconcile_stock(self):
+        dialog = StockAuditDialog(self.db, self)
+        dialog.exec()
+        self.load_inventory()
 
-        # Filter by product
-        filter_layout = QHBoxLayout()
-        filter_layout.addWidget(QLabel("Filter by Product:"))
-        self.ledger_product_combo = QComboBox()
-        self.ledger_product_combo.addItem("All Products", None)
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM Products ORDER BY name")
-        products = cursor.fetchall()
-        conn.close()
-        for prod_id, name in products:
-            self.ledger_product_combo.addItem(name, prod_id)
-        self.ledger_product_combo.currentIndexChanged.connect(self.load_ledger)
-        filter_layout.addWidget(self.ledger_product_combo)
-        layout.addLayout(filter_layout)
+    def show_stock_as_of(self):
+        dialog = StockAsOfDialog(self.db, self)
+        dialog.exec()
 
-        # Ledger table
-        self.ledger_table = QTableWidget()
-        setup_professional_table(self.ledger_table, ["ID", "Product", "Movement", "Quantity", "Reason", "Date"], ['id', 'text', 'status', 'numeric', 'text', 'date'])
-        layout.addWidget(self.ledger_table)
+    def write_stock_checkpoints(self):
+        if self.checkpoint_thread and self.checkpoint_thread.isRunning():
+            return
+        self.checkpoint_thread = StockCheckpointThread(self.db)
+        self.checkpoint_thread.finished.connect(self.on_checkpoints_written)
+        self.checkpoint_thread.start()
 
-        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
-        buttons.rejected.connect(dialog.reject)
-        layout.addWidget(buttons)
+    def on_checkpoints_written(self, success, message):
+        if not success:
+            print(message)
 
-        self.load_ledger()
+    def view_ledger(self):
+        dialog = StockLedgerDialog(self.db, self)
         dialog.exec()
 
-    def load_ledger(self):
-        product_id = self.ledger_product_combo.currentData()
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        if product_id:
-            cursor.execute("""
-                SELECT sl.id, p.name, sl.movement_type, sl.quantity, sl.reason, sl.date
-                FROM StockLedger sl
-                JOIN Products p ON sl.product_id = p.id
-                WHERE sl.product_id = ?
-                ORDER BY sl.date DESC
-            """, (product_id,))
-        else:
-            cursor.execute("""
-                SELECT sl.id, p.name, sl.movement_type, sl.quantity, sl.reason, sl.date
-                FROM StockLedger sl
-                JOIN Products p ON sl.product_id = p.id
-                ORDER BY sl.date DESC
-            """)
-        entries = cursor.fetchall()
-        conn.close()
-
-        self.ledger_table.setRowCount(len(entries))
-        for row, (entry_id, prod_name, movement, qty, reason, date) in enumerate(entries):
-            self.ledger_table.setItem(row, 0, create_professional_table_item(entry_id, 'id'))
-            self.ledger_table.setItem(row, 1, create_professional_table_item(prod_name, 'text'))
-            self.ledger_table.setItem(row, 2, create_professional_table_item(movement, 'status', {'in': 'green', 'out': 'red', 'adjustment': 'yellow'}))
-            self.ledger_table.setItem(row, 3, create_professional_table_item(qty, 'numeric'))
-            self.ledger_table.setItem(row, 4, create_professional_table_item(reason or "", 'text'))
-            self.ledger_table.setItem(row, 5, create_professional_table_item(date, 'date'))
-
     def bulk_adjust_stock(self):
         dialog = QDialog(self)
         dialog.setWindowTitle("Bulk Stock Adjustment")
@@ -356,7 +339,11 @@ class InventoryManagement(QWidget):
     def load_bulk_products(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id, name, current_stock FROM Products ORDER BY name")
+        cursor.execute("""
+            SELECT p.id, p.name, COALESCE(sl.quantity, 0)
+            FROM Products p LEFT JOIN StockLevels sl ON sl.product_id = p.id
+            ORDER BY p.name
+        """)
         products = cursor.fetchall()
         conn.close()
 
@@ -412,14 +399,7 @@ class InventoryManagement(QWidget):
         cursor = conn.cursor()
         try:
             for prod_id, quantity in adjustments:
-                # Update product stock
-                cursor.execute("UPDATE Products SET current_stock = current_stock + ? WHERE id = ?", (quantity, prod_id))
-                # Insert into StockLedger
-                movement_type = 'in' if quantity > 0 else 'out'
-                cursor.execute("""
-                    INSERT INTO StockLedger (product_id, movement_type, quantity, reason)
-                    VALUES (?, ?, ?, ?)
-                """, (prod_id, movement_type, abs(quantity), reason))
+                record_stock_movement(cursor, prod_id, quantity, reason)
 
             conn.commit()
             QMessageBox.information(dialog, "Success", f"Stock adjusted for {len(adjustments)} products.")
@@ -428,4 +408,206 @@ class InventoryManagement(QWidget):
         except Exception as e:
             QMessageBox.critical(dialog, "Error", f"Failed to adjust stock: {str(e)}")
         finally:
-            conn.close()
\ No newline at end of file
+            conn.close()
+
+
+class StockLedgerDialog(QDialog):
+    """Stock ledger viewer, one page at a time in date order.
+
+    Pages are keyset-paged on (date, id) over the date indexes, so each page costs the
+    same however long the ledger is. Running in/out totals carry over from the
+    previous page; the opening balance of a product comes from the nearest stock checkpoint.
+    """
+    PAGE_SIZE = 200
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.product_ids = {}
+        self.pages = []  # start key and running totals of each page shown so far
+        self.setWindowTitle("Stock Ledger")
+        self.resize(1000, 650)
+        layout = QVBoxLayout(self)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Product:"))
+        self.product_edit = QLineEdit()
+        self.product_edit.setPlaceholderText("All products")
+        self.product_model = QStringListModel()
+        completer = QCompleter(self.product_model, self)
+        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        completer.setCompletionMode(QCompleter.CompletionMode.UnfilteredPopupCompletion)
+        self.product_edit.setCompleter(completer)
+        self.product_edit.textEdited.connect(self.suggest_products)
+        completer.activated.connect(self.reload)
+        self.product_edit.returnPressed.connect(self.reload)
+        filter_layout.addWidget(self.product_edit)
+
+        filter_layout.addWidget(QLabel("From:"))
+        self.from_date = QDateEdit()
+        self.from_date.setCalendarPopup(True)
+        self.from_date.setDate(QDate.currentDate().addMonths(-1))
+        filter_layout.addWidget(self.from_date)
+        filter_layout.addWidget(QLabel("To:"))
+        self.to_date = QDateEdit()
+        self.to_date.setCalendarPopup(True)
+        self.to_date.setDate(QDate.currentDate())
+        filter_layout.addWidget(self.to_date)
+
+        filter_layout.addWidget(QLabel("Movement:"))
+        self.movement_combo = QComboBox()
+        self.movement_combo.addItem("All", None)
+        for movement in ('in', 'out', 'adjustment'):
+            self.movement_combo.addItem(movement.capitalize(), movement)
+        filter_layout.addWidget(self.movement_combo)
+
+        apply_btn = QPushButton("Apply")
+        apply_btn.clicked.connect(self.reload)
+        filter_layout.addWidget(apply_btn)
+        layout.addLayout(filter_layout)
+
+        self.opening_label = QLabel("")
+        layout.addWidget(self.opening_label)
+
+        self.ledger_table = QTableWidget()
+        setup_professional_table(self.ledger_table,
+                                 ["ID", "Product", "Movement", "Quantity", "Reason", "Date", "Total In", "Total Out", "Balance"],
+                                 ['id', 'text', 'status', 'numeric', 'text', 'date', 'numeric', 'numeric', 'numeric'])
+        self.ledger_table.setSortingEnabled(False)
+        layout.addWidget(self.ledger_table)
+
+        page_layout = QHBoxLayout()
+        self.prev_btn = QPushButton("< Previous")
+        self.prev_btn.clicked.connect(self.previous_page)
+        page_layout.addWidget(self.prev_btn)
+        self.page_label = QLabel("")
+        page_layout.addWidget(self.page_label)
+        self.next_btn = QPushButton("Next >")
+        self.next_btn.clicked.connect(self.next_page)
+        page_layout.addWidget(self.next_btn)
+        page_layout.addStretch()
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Close)
+        export_btn = buttons.addButton("Export", QDialogButtonBox.ButtonRole.ActionRole)
+        export_btn.clicked.connect(lambda: ExportDialog(self.db, self, "Stock Ledger").exec())
+        buttons.rejected.connect(self.reject)
+        page_layout.addWidget(buttons)
+        layout.addLayout(page_layout)
+
+        self.reload()
+
+    def suggest_products(self, text):
+        if len(text.strip()) < 2:
+            return
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name FROM Products WHERE name LIKE ? OR barcode = ? ORDER BY name LIMIT 20",
+                       (f"%{text.strip()}%", text.strip()))
+        products = cursor.fetchall()
+        conn.close()
+        self.product_ids.update({name: prod_id for prod_id, name in products})
+        self.product_model.setStringList([name for _, name in products])
+
+    def selected_product(self):
+        """Product id for the typed name, None for all products"""
+        name = self.product_edit.text().strip()
+        if not name:
+            return None
+        if name not in self.product_ids:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT id FROM Products WHERE name = ? COLLATE NOCASE OR barcode = ? LIMIT 1", (name, name))
+            row = cursor.fetchone()
+            conn.close()
+            self.product_ids[name] = row[0] if row else -1
+        return self.product_ids[name]
+
+    def reload(self):
+        self.product_id = self.selected_product()
+        self.start = self.from_date.date().toString("yyyy-MM-dd")
+        self.end = self.to_date.date().addDays(1).toString("yyyy-MM-dd")
+        self.movement = self.movement_combo.currentData()
+        # A running balance only makes sense for one product with every movement included
+        self.opening = None
+        if self.product_id and self.product_id > 0 and self.movement is None:
+            try:
+                self.opening = StockService(self.db).on_hand_before(self.product_id, self.start)
+            except Exception as e:
+                QMessageBox.critical(self, "Error", f"Failed to load opening balance: {str(e)}")
+                return
+        if self.product_id == -1:
+            self.opening_label.setText("No product matches that name or barcode.")
+        elif self.opening is not None:
+            self.opening_label.setText(f"Opening balance on {self.start}: {self.opening}")
+        else:
+            self.opening_label.setText("")
+        self.pages = [(self.start, 0, 0, 0)]
+        self.load_page()
+
+    def load_page(self):
+        key_date, key_id, total_in, total_out = self.pages[-1]
+        where = ["sl.date >= ?", "sl.date < ?", "(sl.date > ? OR sl.id > ?)"]
+        params = [key_date, self.end, key_date, key_id]
+        if self.product_id:
+            where.insert(0, "sl.product_id = ?")
+            params.insert(0, self.product_id)
+        if self.movement:
+            where.insert(0, "sl.movement_type = ?")
+            params.insert(0, self.movement)
+        try:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+            # Window over the page only: the running totals of earlier pages are added on top
+            cursor.execute(f"""
+                SELECT id, name, movement_type, quantity, reason, date,
+                       SUM(CASE WHEN {SIGNED_QUANTITY} > 0 THEN {SIGNED_QUANTITY} ELSE 0 END) OVER w,
+                       -- A negative adjustment stores a negative quantity; out is counted as a positive amount
+                       SUM(CASE WHEN {SIGNED_QUANTITY} < 0 THEN -({SIGNED_QUANTITY}) ELSE 0 END) OVER w
+                FROM (
+                    SELECT sl.id, p.name, sl.movement_type, sl.quantity, sl.reason, sl.date
+                    FROM StockLedger sl
+                    JOIN Products p ON sl.product_id = p.id
+                    WHERE {' AND '.join(where)}
+                    ORDER BY sl.date, sl.id
+                    LIMIT ?
+                )
+                WINDOW w AS (ORDER BY date, id)
+                ORDER BY date, id
+            """, params + [self.PAGE_SIZE + 1])
+            entries = cursor.fetchall()
+            conn.close()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to load stock ledger: {str(e)}")
+            return
+
+        has_more = len(entries) > self.PAGE_SIZE
+        entries = entries[:self.PAGE_SIZE]
+        self.ledger_table.setRowCount(len(entries))
+        for row, (entry_id, prod_name, movement, qty, reason, date, page_in, page_out) in enumerate(entries):
+            running_in = total_in + page_in
+            running_out = total_out + page_out
+            self.ledger_table.setItem(row, 0, create_professional_table_item(entry_id, 'id'))
+            self.ledger_table.setItem(row, 1, create_professional_table_item(prod_name, 'text'))
+            self.ledger_table.setItem(row, 2, create_professional_table_item(movement, 'status', {'in': 'green', 'out': 'red', 'adjustment': 'yellow'}))
+            self.ledger_table.setItem(row, 3, create_professional_table_item(qty, 'numeric'))
+            self.ledger_table.setItem(row, 4, create_professional_table_item(reason or "", 'text'))
+            self.ledger_table.setItem(row, 5, create_professional_table_item(date, 'date'))
+            self.ledger_table.setItem(row, 6, create_professional_table_item(running_in, 'numeric'))
+            self.ledger_table.setItem(row, 7, create_professional_table_item(running_out, 'numeric'))
+            balance = "" if self.opening is None else self.opening + running_in - running_out
+            self.ledger_table.setItem(row, 8, create_professional_table_item(balance, 'numeric'))
+
+        if entries:
+            last = entries[-1]
+            self.next_key = (last[5], last[0], total_in + last[6], total_out + last[7])
+        self.next_btn.setEnabled(has_more)
+        self.prev_btn.setEnabled(len(self.pages) > 1)
+        self.page_label.setText(f"Page {len(self.pages)}")
+
+    def next_page(self):
+        self.pages.append(self.next_key)
+        self.load_page()
+
+    def previous_page(self):
+        if len(self.pages) > 1:
+            self.pages.pop()
+            self.load_page()
@@ -1,6 +1,7 @@
 """
 Low Stock Alerts System for Eagle Traders
-Monitors inventory levels and provides alerts for low stock items
+Shows products at or below their minimum stock level and batches close to expiry,
+and toasts when a product drops low or a batch enters the expiry window
 """
 
 from PyQt6.QtWidgets import (
@@ -10,65 +11,60 @@ from PyQt6.QtWidgets import (
 )
 from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
 from database import Database
+from batch_expiry import BatchExpiry
 from ui_factory import setup_professional_table, create_professional_table_item
 from notification_manager import show_warning_notification
 import datetime
 
 
-class LowStockChecker(QThread):
-    """Thread for checking low stock items"""
-    alerts_found = pyqtSignal(list)  # List of low stock items
+class LowStockAlertQueue:
+    """Reads low stock transitions from StockAlerts, which triggers write as stock moves.
 
-    def __init__(self, db, threshold=10):
-        super().__init__()
-        self.db = db
-        self.threshold = threshold
-        self.running = True
+    Keeps the id of the last row read, so each poll is a primary key range scan of
+    only the new transitions.
+    """
 
-    def run(self):
-        while self.running:
-            try:
-                low_stock_items = self.check_low_stock()
-                if low_stock_items:
-                    self.alerts_found.emit(low_stock_items)
-            except Exception as e:
-                print(f"Low stock check error: {e}")
-
-            # Check every 5 minutes
-            self.sleep(300)
-
-    def stop(self):
-        self.running = False
-
-    def check_low_stock_once(self):
-        """Check for products below threshold (single check)"""
+    def __init__(self, db):
+        self.db = db
         conn = self.db.get_connection()
         cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM StockAlerts")
+        self.last_id = cursor.fetchone()[0]
+        conn.close()
 
+    def fetch(self):
+        """Return the latest new transition per product as (product_id, event, quantity, min_level)"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
         cursor.execute("""
-            SELECT p.id, p.name, c.name as category,
-                   COALESCE(SUM(pb.quantity), 0) as total_stock,
-                   p.min_stock_level
-            FROM Products p
-            LEFT JOIN ProductBatches pb ON p.id = pb.product_id
-            LEFT JOIN Categories c ON p.category_id = c.id
-            GROUP BY p.id, p.name, c.name, p.min_stock_level
-            HAVING COALESCE(SUM(pb.quantity), 0) <= ?
-        """, (self.threshold,))
+            SELECT id, product_id, event, quantity, min_level FROM StockAlerts
+            WHERE id > ? ORDER BY id
+        """, (self.last_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        latest = {}
+        for alert_id, product_id, event, quantity, min_level in rows:
+            latest[product_id] = (product_id, event, quantity, min_level)
+            self.last_id = alert_id
+        return list(latest.values())
 
-        low_stock_items = []
-        for row in cursor.fetchall():
-            product_id, name, category, stock, min_level = row
-            low_stock_items.append({
-                'id': product_id,
-                'name': name,
-                'category': category or 'Uncategorized',
-                'current_stock': stock,
-                'min_level': min_level or 0
-            })
 
-        conn.close()
-        return low_stock_items
+class ExpiryChecker(QThread):
+    """Thread for finding batches that expire within the window"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db, within_days):
+        super().__init__()
+        self.expiry = BatchExpiry(db)
+        self.within_days = within_days
+        self.batches = []
+
+    def run(self):
+        try:
+            self.batches = self.expiry.expiring(self.within_days)
+            self.finished.emit(True, f"{len(self.batches)} batches expiring")
+        except Exception as e:
+            self.finished.emit(False, f"Expiry check failed: {str(e)}")
 
 
 class LowStockAlertsWidget(QWidget):
@@ -78,14 +74,21 @@ class LowStockAlertsWidget(QWidget):
         print("LowStockAlertsWidget init start")
         super().__init__()
         self.db = db
-        self.checker_thread = None
+        self.alert_queue = None
+        self.low_items = {}  # product id -> item currently shown, so repeat alerts for it are not toasted again
         self.alerts_enabled = True
-        self.threshold = 10
+        self.queue_timer = QTimer(self)
+        self.queue_timer.timeout.connect(self.process_alert_queue)
+        self.expiry_thread = None
+        self.notified_batches = set()  # batch ids already toasted as near expiry
+        self.expiry_timer = QTimer(self)
+        self.expiry_timer.timeout.connect(self.check_expiry)
         self.init_ui()
         print("LowStockAlertsWidget init_ui done")
         self.load_alerts()
         print("LowStockAlertsWidget load_alerts done")
-        # self.start_monitoring()  # Disabled for debugging
+        self.start_monitoring()
+        self.check_expiry()
         print("LowStockAlertsWidget init end")
 
     def init_ui(self):
@@ -107,17 +110,9 @@ class LowStockAlertsWidget(QWidget):
         self.enable_check.stateChanged.connect(self.toggle_alerts)
         settings_layout.addWidget(self.enable_check)
 
-        # Threshold setting
-        threshold_layout = QHBoxLayout()
-        threshold_layout.addWidget(QLabel("Low stock threshold:"))
-        self.threshold_spin = QSpinBox()
-        self.threshold_spin.setRange(0, 1000)
-        self.threshold_spin.setValue(10)
-        self.threshold_spin.valueChanged.connect(self.update_threshold)
-        threshold_layout.addWidget(self.threshold_spin)
-        threshold_layout.addWidget(QLabel("units"))
-        threshold_layout.addStretch()
-        settings_layout.addLayout(threshold_layout)
+        levels_label = QLabel("Alerts fire when a product's stock falls to its minimum level (Inventory > Set Min Stock).")
+        levels_label.setWordWrap(True)
+        settings_layout.addWidget(levels_label)
 
         # Manual check button
         check_btn = QPushButton("Check Now")
@@ -139,6 +134,31 @@ class LowStockAlertsWidget(QWidget):
         alerts_layout.addWidget(self.alerts_table)
         layout.addWidget(alerts_group)
 
+        # Near-expiry batches section
+        expiry_group = QGroupBox("Batches Near Expiry")
+        expiry_layout = QVBoxLayout(expiry_group)
+
+        window_layout = QHBoxLayout()
+        window_layout.addWidget(QLabel("Expiring within:"))
+        self.expiry_days_spin = QSpinBox()
+        self.expiry_days_spin.setRange(0, 365)
+        self.expiry_days_spin.setValue(30)
+        self.expiry_days_spin.valueChanged.connect(self.check_expiry)
+        window_layout.addWidget(self.expiry_days_spin)
+        window_layout.addWidget(QLabel("days"))
+        window_layout.addStretch()
+        self.expiry_value_label = QLabel("")
+        window_layout.addWidget(self.expiry_value_label)
+        expiry_layout.addLayout(window_layout)
+
+        self.expiry_table = QTableWidget()
+        setup_professional_table(self.expiry_table, [
+            "Product", "Batch", "Expiry", "Days Left", "Quantity", "Value at Risk"
+        ], ['text', 'text', 'text', 'numeric', 'numeric', 'numeric'])
+        self.expiry_table.setMaximumHeight(300)
+        expiry_layout.addWidget(self.expiry_table)
+        layout.addWidget(expiry_group)
+
         # Statistics section
         stats_group = QGroupBox("Stock Statistics")
         stats_layout = QVBoxLayout(stats_group)
@@ -151,39 +171,56 @@ class LowStockAlertsWidget(QWidget):
         layout.addWidget(stats_group)
 
     def start_monitoring(self):
-        """Start the background monitoring thread"""
-        if self.checker_thread is None:
-            self.checker_thread = LowStockChecker(self.db, self.threshold)
-            self.checker_thread.alerts_found.connect(self.on_alerts_found)
-            self.checker_thread.start()
+        """Start reading new transitions from the alert queue"""
+        if self.alert_queue is None:
+            self.alert_queue = LowStockAlertQueue(self.db)
+        self.queue_timer.start(3000)
+        self.expiry_timer.start(60 * 60 * 1000)
 
     def stop_monitoring(self):
-        """Stop the monitoring thread"""
-        if self.checker_thread:
-            self.checker_thread.stop()
-            self.checker_thread.wait()
-            self.checker_thread = None
+        """Stop reading the alert queue"""
+        self.queue_timer.stop()
+        self.expiry_timer.stop()
 
     def toggle_alerts(self, state):
         """Enable/disable alerts"""
-        self.alerts_enabled = state == Qt.CheckState.Checked
+        self.alerts_enabled = state == Qt.CheckState.Checked.value
         if self.alerts_enabled:
             self.start_monitoring()
         else:
             self.stop_monitoring()
 
-    def update_threshold(self, value):
-        """Update the low stock threshold"""
-        self.threshold = value
-        if self.checker_thread:
-            self.checker_thread.threshold = value
-        self.manual_check()  # Re-check with new threshold
-
     def manual_check(self):
-        """Perform manual low stock check"""
-        low_stock_items = self.check_low_stock_once()
-        if low_stock_items:
-            self.on_alerts_found(low_stock_items)
+        """Reload the full low stock list and skip any queued transitions it already reflects"""
+        self.alert_queue = LowStockAlertQueue(self.db)
+        self.low_items = {item['id']: item for item in self.check_low_stock_once()}
+        self.update_alerts_table(list(self.low_items.values()))
+        self.load_statistics()
+
+    def process_alert_queue(self):
+        """Apply new low stock transitions and toast the products that have just gone low"""
+        try:
+            transitions = self.alert_queue.fetch()
+        except Exception as e:
+            print(f"Low stock alert queue error: {e}")
+            return
+        if not transitions:
+            return
+
+        newly_low = []
+        entered = [product_id for product_id, event, _, _ in transitions if event == 'entered']
+        details = self.fetch_items(entered)
+        for product_id, event, _, _ in transitions:
+            if event == 'cleared':
+                self.low_items.pop(product_id, None)
+            elif product_id in details:
+                if product_id not in self.low_items:
+                    newly_low.append(details[product_id])
+                self.low_items[product_id] = details[product_id]
+
+        self.update_alerts_table(list(self.low_items.values()))
+        self.load_statistics()
+        self.on_alerts_found(newly_low)
 
     def on_alerts_found(self, alerts):
         """Handle found alerts"""
@@ -202,9 +239,6 @@ class LowStockAlertsWidget(QWidget):
                 f"{len(alerts)} products are low in stock: {products_str}"
             )
 
-        # Update the alerts table
-        self.update_alerts_table(alerts)
-
     def update_alerts_table(self, alerts):
         """Update the alerts table with current low stock items"""
         self.alerts_table.setRowCount(len(alerts))
@@ -238,6 +272,51 @@ class LowStockAlertsWidget(QWidget):
             action_btn.clicked.connect(lambda _, pid=item['id']: self.view_product_details(pid))
             self.alerts_table.setCellWidget(row, 5, action_btn)
 
+    def check_expiry(self):
+        """Look for near-expiry batches on a background thread"""
+        if self.expiry_thread and self.expiry_thread.isRunning():
+            return
+        self.expiry_thread = ExpiryChecker(self.db, self.expiry_days_spin.value())
+        self.expiry_thread.finished.connect(self.on_expiry_checked)
+        self.expiry_thread.start()
+
+    def on_expiry_checked(self, success, message):
+        if not success:
+            print(message)
+            return
+        batches = self.expiry_thread.batches
+        if self.expiry_thread.within_days != self.expiry_days_spin.value():
+            # The window changed while this check ran. finished is emitted from run(), so the
+            # thread is still running here; check again once it has returned, and show nothing stale.
+            QTimer.singleShot(0, self.check_expiry)
+            return
+
+        self.expiry_table.setRowCount(len(batches))
+        for row, (_, _, name, batch_number, expiry, days_left, quantity, value) in enumerate(batches):
+            self.expiry_table.setItem(row, 0, create_professional_table_item(name, 'text'))
+            self.expiry_table.setItem(row, 1, create_professional_table_item(batch_number, 'text'))
+            self.expiry_table.setItem(row, 2, create_professional_table_item(expiry, 'text'))
+            days_item = create_professional_table_item(str(days_left), 'text')
+            if days_left < 0:
+                days_item.setBackground(Qt.GlobalColor.red)
+                days_item.setForeground(Qt.GlobalColor.white)
+            self.expiry_table.setItem(row, 3, days_item)
+            self.expiry_table.setItem(row, 4, create_professional_table_item(quantity, 'numeric'))
+            self.expiry_table.setItem(row, 5, create_professional_table_item(value, 'numeric'))
+        total_value = sum(batch[7] for batch in batches)
+        self.expiry_value_label.setText(f"{len(batches)} batches, value at risk Rs. {total_value:,.2f}")
+
+        new_batches = [batch for batch in batches if batch[0] not in self.notified_batches]
+        self.notified_batches.update(batch[0] for batch in new_batches)
+        if new_batches and self.alerts_enabled:
+            names = [f"{batch[2]} ({batch[3]})" for batch in new_batches[:3]]
+            if len(new_batches) > 3:
+                names.append(f"and {len(new_batches) - 3} more")
+            show_warning_notification(
+                "Expiry Alert",
+                f"{len(new_batches)} batches expire within {self.expiry_thread.within_days} days: {', '.join(names)}"
+            )
+
     def view_product_details(self, product_id):
         """View detailed information about a low stock product"""
         conn = self.db.get_connection()
@@ -245,13 +324,12 @@ class LowStockAlertsWidget(QWidget):
 
         cursor.execute("""
             SELECT p.name, p.description, c.name as category,
-                   COALESCE(SUM(pb.quantity), 0) as total_stock,
+                   COALESCE(sl.quantity, 0) as total_stock,
                    p.min_stock_level
             FROM Products p
-            LEFT JOIN ProductBatches pb ON p.id = pb.product_id
+            LEFT JOIN StockLevels sl ON sl.product_id = p.id
             LEFT JOIN Categories c ON p.category_id = c.id
             WHERE p.id = ?
-            GROUP BY p.id, p.name, p.description, c.name, p.min_stock_level
         """, (product_id,))
 
         product = cursor.fetchone()
@@ -271,24 +349,32 @@ class LowStockAlertsWidget(QWidget):
 
     def load_alerts(self):
         """Load current alerts on startup"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM StockAlerts WHERE created_at < datetime('now', '-90 days')")
+        conn.commit()
+        conn.close()
         self.manual_check()
-        self.load_statistics()
 
-    def check_low_stock_once(self):
-        """Check for products below threshold (single check)"""
+    def check_low_stock_once(self, product_ids=None):
+        """Products at or below their own minimum stock level, optionally only the given ones"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
 
-        cursor.execute("""
+        query = """
             SELECT p.id, p.name, c.name as category,
-                   COALESCE(SUM(pb.quantity), 0) as total_stock,
-                   p.min_stock_level
+                   COALESCE(sl.quantity, 0) as total_stock,
+                   COALESCE(p.min_stock_level, 0)
             FROM Products p
-            LEFT JOIN ProductBatches pb ON p.id = pb.product_id
+            LEFT JOIN StockLevels sl ON sl.product_id = p.id
             LEFT JOIN Categories c ON p.category_id = c.id
-            GROUP BY p.id, p.name, c.name, p.min_stock_level
-            HAVING COALESCE(SUM(pb.quantity), 0) <= ?
-        """, (self.threshold,))
+            WHERE COALESCE(sl.quantity, 0) <= COALESCE(p.min_stock_level, 0)
+        """
+        params = []
+        if product_ids is not None:
+            query += f" AND p.id IN ({','.join('?' * len(product_ids))})"
+            params = list(product_ids)
+        cursor.execute(query + " ORDER BY p.name", params)
 
         low_stock_items = []
         for row in cursor.fetchall():
@@ -298,15 +384,19 @@ class LowStockAlertsWidget(QWidget):
                 'name': name,
                 'category': category or 'Uncategorized',
                 'current_stock': stock,
-                'min_level': min_level or 0
+                'min_level': min_level
             })
 
         conn.close()
         return low_stock_items
 
-    def check_low_stock(self):
-        """Check for products below threshold (for thread)"""
-        return self.check_low_stock_once()
+    def fetch_items(self, product_ids):
+        """Current low stock details of the given products, keyed by id"""
+        items = {}
+        for start in range(0, len(product_ids), 500):
+            for item in self.check_low_stock_once(product_ids[start:start + 500]):
+                items[item['id']] = item
+        return items
 
     def load_statistics(self):
         """Load stock statistics"""
@@ -318,12 +408,7 @@ class LowStockAlertsWidget(QWidget):
         total_products = cursor.fetchone()[0]
 
         # Products with stock
-        cursor.execute("""
-            SELECT COUNT(DISTINCT p.id)
-            FROM Products p
-            JOIN ProductBatches pb ON p.id = pb.product_id
-            WHERE pb.quantity > 0
-        """)
+        cursor.execute("SELECT COUNT(*) FROM StockLevels WHERE quantity > 0")
         products_with_stock = cursor.fetchone()[0]
 
         # Total stock value (simplified)
@@ -334,14 +419,7 @@ class LowStockAlertsWidget(QWidget):
         total_value = cursor.fetchone()[0]
 
         # Low stock products
-        cursor.execute("""
-            SELECT COUNT(DISTINCT p.id)
-            FROM Products p
-            LEFT JOIN ProductBatches pb ON p.id = pb.product_id
-            GROUP BY p.id
-            HAVING COALESCE(SUM(pb.quantity), 0) <= ?
-        """, (self.threshold,))
-        low_stock_count = len(cursor.fetchall())
+        low_stock_count = len(self.low_items)
 
         conn.close()
 
@@ -357,4 +435,6 @@ class LowStockAlertsWidget(QWidget):
     def closeEvent(self, event):
         """Clean up on close"""
         self.stop_monitoring()
+        if self.expiry_thread and self.expiry_thread.isRunning():
+            self.expiry_thread.wait()
         event.accept()
\ No newline at end of file
@@ -19,6 +19,9 @@ from accounts_reports import AccountsReports
 from expense_management import ExpenseManagement
 from backup_restore import BackupRestoreWidget
 from low_stock_alerts import LowStockAlertsWidget
+from stock_analytics import StockAnalyticsWidget
+from promotions import PromotionsWidget
+from document_store import DocumentCleanupThread
 from user_management import UserManagement
 
 
@@ -131,6 +134,11 @@ class MainWindow(QMainWindow):
         self.init_ui()
         print("UI initialized")
 
+        # Remove superseded and compress long-unopened bills, invoices and ledgers in the background
+        self.document_cleanup = DocumentCleanupThread(self.db)
+        self.document_cleanup.finished.connect(lambda success, message: print(message))
+        self.document_cleanup.start()
+
     def init_ui(self):
         print("init_ui start")
         self.setWindowTitle('Eagle Traders Management System')
@@ -228,6 +236,8 @@ class MainWindow(QMainWindow):
                 ('🏷️ Categories', self.show_categories),
                 ('🏢 Suppliers', self.show_suppliers),
                 ('📊 Accounts', self.show_accounts),
+                ('📈 Stock Analytics', self.show_stock_analytics),
+                ('🎁 Promotions', self.show_promotions),
                 ('💸 Expenses', self.show_expenses),
                 ('👥 User Management', self.show_user_management),
                 ('💾 Backup & Restore', self.show_backup_restore),
@@ -330,6 +340,16 @@ class MainWindow(QMainWindow):
         backup_restore = BackupRestoreWidget(self.db)
         self.content_stack.addWidget(backup_restore)
         print("backup_restore added")
+
+        # Stock Analytics (only for admin)
+        if self.current_user_role == 'admin':
+            stock_analytics = StockAnalyticsWidget(self.db)
+            self.content_stack.addWidget(stock_analytics)
+            print("stock_analytics added")
+
+            promotions = PromotionsWidget(self.db)
+            self.content_stack.addWidget(promotions)
+            print("promotions added")
         print("create_pages end")
 
     def show_dashboard(self):
@@ -408,6 +428,24 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.warning(self, "Access Denied", "Only administrators can access backup and restore.")
 
+    def show_stock_analytics(self):
+        if self.current_user_role != 'admin':
+            QMessageBox.warning(self, "Access Denied", "Only administrators can access stock analytics.")
+            return
+        for i in range(self.content_stack.count()):
+            if isinstance(self.content_stack.widget(i), StockAnalyticsWidget):
+                self.animate_switch(i)
+                break
+
+    def show_promotions(self):
+        if self.current_user_role != 'admin':
+            QMessageBox.warning(self, "Access Denied", "Only administrators can manage promotions.")
+            return
+        for i in range(self.content_stack.count()):
+            if isinstance(self.content_stack.widget(i), PromotionsWidget):
+                self.animate_switch(i)
+                break
+
     def load_style(self):
         print("load_style start")
         try:
@@ -5,8 +5,8 @@ a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('eagle_traders.db', '.'), ('fonts', 'fonts'), ('style.qss', '.'), ('invoice.html', '.'), ('header.png', '.'), ('C:\\Users\\Cyber Menta CEO\\AppData\\Local\\Python\\pythoncore-3.14-64\\Lib\\site-packages\\barcode\\fonts', 'barcode/fonts')],
-    hiddenimports=['barcode'],
+    datas=[('eagle_traders.db', '.'), ('fonts', 'fonts'), ('style.qss', '.'), ('invoice.html', '.'), ('header.png', '.')],
+    hiddenimports=[],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,251 @@
+"""
+Accounting Period Close for Eagle Traders
+Closes months, snapshots balances and serves the nearest snapshot to reports
+"""
+
+import calendar
+import datetime
+
+
+class PeriodClose:
+    """Month-end close with cumulative snapshots.
+
+    Each closed period stores running totals as at its month end, so any
+    all-time figure is the latest snapshot plus the rows dated after it.
+    """
+
+    # Tables whose dated rows decide where the first period starts
+    DATED_TABLES = ('CustomerLedger', 'GeneralLedger', 'SalesTransactions',
+                    'StockLedger', 'Expenses', 'PayrollTransactions')
+
+    def __init__(self, db):
+        self.db = db
+
+    def latest_period(self, cursor=None):
+        """Return (id, period_start, period_end) of the last closed period, or None"""
+        conn = None
+        if cursor is None:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, period_start, period_end FROM AccountingPeriods
+            ORDER BY period_end DESC LIMIT 1
+        """)
+        period = cursor.fetchone()
+        if conn:
+            conn.close()
+        return period
+
+    def open_from(self, cursor=None):
+        """First date of the open period ('yyyy-MM-dd'), or None if nothing is closed"""
+        period = self.latest_period(cursor)
+        if not period:
+            return None
+        return self._next_day(period[2])
+
+    def get_periods(self):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT ap.id, ap.period_start, ap.period_end, ap.closed_by, ap.closed_at,
+                   (SELECT COUNT(*) FROM CustomerBalanceSnapshots WHERE period_id = ap.id),
+                   (SELECT COUNT(*) FROM StockSnapshots WHERE period_id = ap.id),
+                   (SELECT COALESCE(SUM(amount), 0) FROM ExpenseSnapshots WHERE period_id = ap.id),
+                   (SELECT COALESCE(SUM(amount), 0) FROM PayrollSnapshots WHERE period_id = ap.id)
+            FROM AccountingPeriods ap
+            ORDER BY ap.period_end DESC
+        """)
+        periods = cursor.fetchall()
+        conn.close()
+        return periods
+
+    def next_period(self):
+        """Return (period_start, period_end) of the next month to close, or None if there is no activity"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        latest = self.latest_period(cursor)
+        if latest:
+            start = self._next_day(latest[2])
+        else:
+            firsts = []
+            for table in self.DATED_TABLES:
+                cursor.execute(f"SELECT MIN(date) FROM {table}")
+                first = cursor.fetchone()[0]
+                if first:
+                    firsts.append(str(first)[:10])
+            start = min(firsts)[:8] + "01" if firsts else None
+        conn.close()
+        if not start:
+            return None
+        year, month = int(start[:4]), int(start[5:7])
+        end = f"{year:04d}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+        return start, end
+
+    def close_period(self, closed_by=None):
+        """Close the next open month. Returns the new period id.
+
+        Raises ValueError if there is nothing to close or the month has not ended yet.
+        """
+        period = self.next_period()
+        if not period:
+            raise ValueError("There are no transactions to close.")
+        period_start, period_end = period
+        if period_end >= datetime.date.today().strftime('%Y-%m-%d'):
+            raise ValueError(f"The period ending {period_end} has not finished yet.")
+
+        # Window is [period_start, day after period_end) so DATETIME values on the last day are included
+        window_end = self._next_day(period_end)
+
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            previous = self.latest_period(cursor)
+            previous_id = previous[0] if previous else None
+
+            cursor.execute("INSERT INTO AccountingPeriods (period_start, period_end, closed_by) VALUES (?, ?, ?)",
+                           (period_start, period_end, closed_by))
+            period_id = cursor.lastrowid
+
+            cursor.execute("""
+                INSERT INTO CustomerBalanceSnapshots (period_id, customer_id, total_debit, total_credit, balance)
+                SELECT ?, customer_id, SUM(debit), SUM(credit), SUM(debit) - SUM(credit)
+                FROM (
+                    SELECT customer_id, total_debit AS debit, total_credit AS credit
+                    FROM CustomerBalanceSnapshots WHERE period_id = ?
+                    UNION ALL
+                    SELECT customer_id, COALESCE(debit, 0), COALESCE(credit, 0)
+                    FROM CustomerLedger WHERE date >= ? AND date < ?
+                )
+                GROUP BY customer_id
+            """, (period_id, previous_id, period_start, window_end))
+
+            cursor.execute("""
+                INSERT INTO StockSnapshots (period_id, product_id, quantity, stock_value)
+                SELECT ?, m.product_id, SUM(m.quantity), SUM(m.quantity) * COALESCE(MAX(c.avg_cost), 0)
+                FROM (
+                    SELECT product_id, quantity FROM StockSnapshots WHERE period_id = ?
+                    UNION ALL
+                    SELECT product_id, CASE WHEN movement_type = 'out' THEN -quantity ELSE quantity END
+                    FROM StockLedger WHERE date >= ? AND date < ?
+                ) m
+                LEFT JOIN (
+                    SELECT product_id, SUM(quantity * cost_price) / NULLIF(SUM(quantity), 0) AS avg_cost
+                    FROM ProductBatches GROUP BY product_id
+                ) c ON c.product_id = m.product_id
+                GROUP BY m.product_id
+            """, (period_id, previous_id, period_start, window_end))
+
+            cursor.execute("""
+                INSERT INTO CategorySalesSnapshots (period_id, category_id, revenue)
+                SELECT ?, category_id, SUM(revenue)
+                FROM (
+                    SELECT category_id, revenue FROM CategorySalesSnapshots WHERE period_id = ?
+                    UNION ALL
+                    SELECT p.category_id, si.total_price
+                    FROM SalesTransactions st
+                    JOIN SalesItems si ON si.sale_id = st.id
+                    JOIN Products p ON si.product_id = p.id
+                    WHERE st.date >= ? AND st.date < ? AND p.category_id IS NOT NULL
+                )
+                GROUP BY category_id
+            """, (period_id, previous_id, period_start, window_end))
+
+            cursor.execute("""
+                INSERT INTO ExpenseSnapshots (period_id, category, amount)
+                SELECT ?, category, SUM(amount)
+                FROM (
+                    SELECT category, amount FROM ExpenseSnapshots WHERE period_id = ?
+                    UNION ALL
+                    SELECT category, amount FROM Expenses WHERE date >= ? AND date < ?
+                )
+                GROUP BY category
+            """, (period_id, previous_id, period_start, window_end))
+
+            cursor.execute("""
+                INSERT INTO PayrollSnapshots (period_id, employee_id, amount)
+                SELECT ?, employee_id, SUM(amount)
+                FROM (
+                    SELECT employee_id, amount FROM PayrollSnapshots WHERE period_id = ?
+                    UNION ALL
+                    SELECT employee_id, amount FROM PayrollTransactions WHERE date >= ? AND date < ?
+                )
+                GROUP BY employee_id
+            """, (period_id, previous_id, period_start, window_end))
+
+            conn.commit()
+            return period_id
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # ================= SNAPSHOT READS =================
+    def customer_opening(self, customer_id):
+        """Return (open_from, total_debit, total_credit, balance) brought forward for a customer.
+
+        open_from is None when no period has been closed, in which case the totals are zero.
+        """
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        period = self.latest_period(cursor)
+        if not period:
+            conn.close()
+            return None, 0.0, 0.0, 0.0
+        cursor.execute("""
+            SELECT total_debit, total_credit, balance FROM CustomerBalanceSnapshots
+            WHERE period_id = ? AND customer_id = ?
+        """, (period[0], customer_id))
+        row = cursor.fetchone() or (0.0, 0.0, 0.0)
+        conn.close()
+        return (self._next_day(period[2]),) + tuple(row)
+
+    def category_sales(self):
+        """Sales revenue per category name, all time"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        period = self.latest_period(cursor)
+        open_from = self._next_day(period[2]) if period else ''
+        cursor.execute("""
+            SELECT c.name, SUM(t.revenue)
+            FROM (
+                SELECT category_id, revenue FROM CategorySalesSnapshots WHERE period_id = ?
+                UNION ALL
+                SELECT p.category_id, si.total_price
+                FROM SalesTransactions st
+                JOIN SalesItems si ON si.sale_id = st.id
+                JOIN Products p ON si.product_id = p.id
+                WHERE st.date >= ?
+            ) t
+            JOIN Categories c ON t.category_id = c.id
+            GROUP BY c.id
+        """, (period[0] if period else None, open_from))
+        sales = dict(cursor.fetchall())
+        conn.close()
+        return sales
+
+    def expense_total(self):
+        return self._snapshot_total('ExpenseSnapshots', 'Expenses')
+
+    def payroll_total(self):
+        return self._snapshot_total('PayrollSnapshots', 'PayrollTransactions')
+
+    def _snapshot_total(self, snapshot_table, source_table):
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        period = self.latest_period(cursor)
+        if period:
+            cursor.execute(f"""
+                SELECT (SELECT COALESCE(SUM(amount), 0) FROM {snapshot_table} WHERE period_id = ?)
+                     + (SELECT COALESCE(SUM(amount), 0) FROM {source_table} WHERE date >= ?)
+            """, (period[0], self._next_day(period[2])))
+        else:
+            cursor.execute(f"SELECT COALESCE(SUM(amount), 0) FROM {source_table}")
+        total = cursor.fetchone()[0] or 0
+        conn.close()
+        return total
+
+    @staticmethod
+    def _next_day(date_text):
+        day = datetime.datetime.strptime(str(date_text)[:10], '%Y-%m-%d').date()
+        return (day + datetime.timedelta(days=1)).strftime('%Y-%m-%d')
@@ -0,0 +1,339 @@
+"""
+Product CSV Import for Eagle Traders
+Validates and upserts large product lists in chunks on a background thread
+"""
+
+import csv
+import math
+import os
+import sqlite3
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit,
+    QCheckBox, QProgressBar, QFileDialog, QMessageBox
+)
+from PyQt6.QtCore import QThread, pyqtSignal
+from notification_manager import show_success_notification, show_error_notification
+
+CHUNK_SIZE = 5000
+
+COLUMNS = ['name', 'category', 'supplier', 'type', 'unit_price', 'barcode', 'current_stock', 'min_stock_level']
+
+
+class ProductImportThread(QThread):
+    """Thread for importing products from a CSV file.
+
+    Existing products are matched on barcode first, then on name (case-insensitive),
+    and updated in place; everything else is inserted. A name match whose product already
+    has a different barcode is reported as a conflict rather than re-barcoded. The whole import is one
+    transaction, so cancelling leaves the catalogue untouched.
+    """
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db_path, file_path, create_missing=True):
+        super().__init__()
+        self.db_path = db_path
+        self.file_path = file_path
+        self.create_missing = create_missing
+        self.cancelled = False
+        self.errors = []  # (line number, raw row, message)
+        self.fieldnames = COLUMNS
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        conn = None
+        try:
+            with open(self.file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
+                total = max(sum(1 for _ in csvfile) - 1, 1)
+
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute("SELECT name, id FROM Categories")
+            self.categories = {name.strip().lower(): cid for name, cid in cursor.fetchall()}
+            cursor.execute("SELECT name, id FROM Suppliers")
+            self.suppliers = {name.strip().lower(): sid for name, sid in cursor.fetchall()}
+            cursor.execute("SELECT id, name, barcode FROM Products")
+            self.by_barcode = {}
+            self.by_name = {}
+            self.barcodes = {}  # product id -> barcode
+            for pid, name, barcode in cursor.fetchall():
+                self.remember_product(pid, name, barcode)
+
+            inserted = updated = processed = 0
+            with open(self.file_path, 'r', newline='', encoding='utf-8-sig') as csvfile:
+                reader = csv.DictReader(csvfile)
+                if not reader.fieldnames or 'name' not in [f.strip().lower() for f in reader.fieldnames]:
+                    raise ValueError("The CSV file must have a 'name' column.")
+                self.fieldnames = reader.fieldnames
+                chunk = []
+                for row in reader:
+                    chunk.append((reader.line_num, row))
+                    if len(chunk) >= CHUNK_SIZE:
+                        added, changed = self.import_chunk(cursor, chunk)
+                        inserted += added
+                        updated += changed
+                        processed += len(chunk)
+                        chunk = []
+                        self.progress.emit(min(99, processed * 100 // total))
+                        if self.cancelled:
+                            break
+                if chunk and not self.cancelled:
+                    added, changed = self.import_chunk(cursor, chunk)
+                    inserted += added
+                    updated += changed
+
+            if self.cancelled:
+                conn.rollback()
+                self.finished.emit(False, "Import cancelled. No products were changed.")
+                return
+
+            conn.commit()
+            self.progress.emit(100)
+            message = f"Imported {inserted:,} new and updated {updated:,} existing products."
+            if self.errors:
+                message += f" {len(self.errors):,} rows were skipped."
+            self.finished.emit(True, message)
+
+        except Exception as e:
+            if conn:
+                conn.rollback()
+            self.finished.emit(False, f"Import failed: {str(e)}")
+        finally:
+            if conn:
+                conn.close()
+
+    def remember_product(self, pid, name, barcode):
+        if barcode:
+            self.by_barcode[barcode] = pid
+            self.barcodes[pid] = barcode
+        self.by_name[name.strip().lower()] = pid
+
+    @staticmethod
+    def parse_number(row, column):
+        try:
+            value = float(row.get(column) or 0)
+        except ValueError:
+            value = math.nan
+        if not math.isfinite(value):
+            raise ValueError(f"Invalid {column.replace('_', ' ')}: '{row.get(column)}'")
+        return value
+
+    def lookup_id(self, table, cache, name, cursor):
+        """Return the id for a category/supplier name, creating it if allowed"""
+        if not name:
+            return None
+        key = name.lower()
+        if key not in cache:
+            if not self.create_missing:
+                return None
+            cursor.execute(f"INSERT INTO {table} (name) VALUES (?)", (name,))
+            cache[key] = cursor.lastrowid
+        return cache[key]
+
+    def import_chunk(self, cursor, chunk):
+        inserts = {}  # key -> values, so the last duplicate in the chunk wins
+        updates = {}  # product id -> values
+        for line_num, raw in chunk:
+            row = {(k or '').strip().lower(): (v or '').strip() for k, v in raw.items() if k}
+            try:
+                name = row.get('name', '')
+                if not name:
+                    raise ValueError("Name is required")
+                unit_price = self.parse_number(row, 'unit_price')
+                if unit_price < 0:
+                    raise ValueError("Unit price cannot be negative")
+                current_stock = int(self.parse_number(row, 'current_stock'))
+                min_stock_level = int(self.parse_number(row, 'min_stock_level'))
+                is_import = 1 if row.get('type', 'Home').lower() == 'import' else 0
+                barcode = row.get('barcode') or None
+
+                category_name = row.get('category', '')
+                category_id = self.lookup_id('Categories', self.categories, category_name, cursor)
+                if category_id is None:
+                    raise ValueError(f"Category '{category_name}' not found" if category_name else "Category is required")
+                supplier_id = self.lookup_id('Suppliers', self.suppliers, row.get('supplier', ''), cursor)
+            except ValueError as e:
+                self.errors.append((line_num, raw, str(e)))
+                continue
+
+            product_id = self.by_barcode.get(barcode) if barcode else None
+            if product_id is None:
+                product_id = self.by_name.get(name.lower())
+                if product_id is not None and barcode:
+                    if self.barcodes.get(product_id):
+                        self.errors.append((line_num, raw, f"Barcode conflict: '{name}' already has barcode "
+                                                           f"'{self.barcodes[product_id]}', not '{barcode}'"))
+                        continue
+                    self.remember_product(product_id, name, barcode)
+            if product_id is not None:
+                # Stock is left alone on updates; it only changes through adjustments and sales
+                updates[product_id] = (name, category_id, supplier_id, is_import, unit_price, barcode, min_stock_level, product_id)
+            else:
+                inserts[barcode or name.lower()] = (name, category_id, supplier_id, is_import, unit_price, barcode, current_stock, min_stock_level)
+
+        cursor.executemany("""
+            UPDATE Products SET name = ?, category_id = ?, supplier_id = ?, is_import = ?, unit_price = ?,
+                   barcode = COALESCE(?, barcode), min_stock_level = ?
+            WHERE id = ?
+        """, list(updates.values()))
+
+        if inserts:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Products")
+            last_id = cursor.fetchone()[0]
+            cursor.executemany("""
+                INSERT INTO Products (name, category_id, supplier_id, is_import, unit_price, barcode, min_stock_level)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [values[:6] + values[7:] for values in inserts.values()])
+            # Pick up the new ids so duplicates in later chunks update instead of inserting again
+            cursor.execute("SELECT id, name, barcode FROM Products WHERE id > ? ORDER BY id", (last_id,))
+            new_products = cursor.fetchall()
+            for pid, name, barcode in new_products:
+                self.remember_product(pid, name, barcode)
+            # Opening stock goes through the stock ledger like any other movement
+            cursor.executemany("""
+                INSERT INTO StockLedger (product_id, movement_type, quantity, reason)
+                VALUES (?, ?, ?, 'Opening stock (import)')
+            """, [(pid, 'in' if values[6] > 0 else 'out', abs(values[6]))
+                  for (pid, _, _), values in zip(new_products, inserts.values()) if values[6]])
+
+        return len(inserts), len(updates)
+
+    def write_error_report(self, file_path):
+        with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['line'] + list(self.fieldnames) + ['error'])
+            for line_num, raw, message in self.errors:
+                writer.writerow([line_num] + [raw.get(f, '') for f in self.fieldnames] + [message])
+
+
+class ProductImportDialog(QDialog):
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.import_thread = None
+        self.setWindowTitle("Import Products from CSV")
+        self.setMinimumWidth(500)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Columns: " + ", ".join(COLUMNS) + "\n"
+                                "Rows matching an existing barcode or name update that product."))
+
+        file_layout = QHBoxLayout()
+        self.file_edit = QLineEdit()
+        self.file_edit.setReadOnly(True)
+        file_layout.addWidget(self.file_edit)
+        browse_btn = QPushButton("Browse...")
+        browse_btn.clicked.connect(self.browse_file)
+        file_layout.addWidget(browse_btn)
+        layout.addLayout(file_layout)
+
+        self.create_missing_check = QCheckBox("Create missing categories and suppliers")
+        self.create_missing_check.setChecked(True)
+        layout.addWidget(self.create_missing_check)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setVisible(False)
+        layout.addWidget(self.progress_bar)
+        self.status_label = QLabel("")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+
+        btn_layout = QHBoxLayout()
+        self.errors_btn = QPushButton("Save Error Report")
+        self.errors_btn.setVisible(False)
+        self.errors_btn.clicked.connect(self.save_error_report)
+        btn_layout.addWidget(self.errors_btn)
+        btn_layout.addStretch()
+        self.import_btn = QPushButton("Import")
+        self.import_btn.clicked.connect(self.start_import)
+        btn_layout.addWidget(self.import_btn)
+        self.cancel_btn = QPushButton("Close")
+        self.cancel_btn.clicked.connect(self.cancel_or_close)
+        btn_layout.addWidget(self.cancel_btn)
+        layout.addLayout(btn_layout)
+
+    def browse_file(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Import Products from CSV", "", "CSV Files (*.csv)")
+        if file_path:
+            self.file_edit.setText(file_path)
+
+    def start_import(self):
+        file_path = self.file_edit.text()
+        if not file_path or not os.path.exists(file_path):
+            QMessageBox.warning(self, "Error", "Please select a CSV file.")
+            return
+
+        self.import_btn.setEnabled(False)
+        self.errors_btn.setVisible(False)
+        self.cancel_btn.setText("Cancel")
+        self.progress_bar.setVisible(True)
+        self.progress_bar.setValue(0)
+        self.status_label.setText("Importing...")
+
+        self.import_thread = ProductImportThread(self.db.db_path, file_path, self.create_missing_check.isChecked())
+        self.import_thread.progress.connect(self.progress_bar.setValue)
+        self.import_thread.finished.connect(self.on_import_finished)
+        self.import_thread.start()
+
+    def cancel_or_close(self):
+        if self.import_thread and self.import_thread.isRunning():
+            self.import_thread.cancel()
+            self.status_label.setText("Cancelling...")
+        else:
+            self.accept()
+
+    def on_import_finished(self, success, message):
+        self.import_btn.setEnabled(True)
+        self.cancel_btn.setText("Close")
+        self.progress_bar.setVisible(False)
+        self.status_label.setText(message)
+        self.errors_btn.setVisible(success and bool(self.import_thread.errors))
+        if success:
+            show_success_notification("Import Complete", message)
+        elif not self.import_thread.cancelled:
+            show_error_notification("Import Failed", message)
+
+    def save_error_report(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Save Error Report", "import_errors.csv", "CSV Files (*.csv)")
+        if not file_path:
+            return
+        try:
+            self.import_thread.write_error_report(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to save error report: {str(e)}")
+
+    def reject(self):
+        if self.import_thread and self.import_thread.isRunning():
+            self.import_thread.cancel()
+            self.import_thread.wait()
+        super().reject()
+
+
+if __name__ == '__main__':
+    # Benchmark: import 100k rows into a fresh database
+    import tempfile
+    import time
+    from database import Database
+
+    folder = tempfile.mkdtemp()
+    db = Database(os.path.join(folder, 'import_bench.db'))
+    csv_path = os.path.join(folder, 'products.csv')
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for i in range(100000):
+            writer.writerow([f"Product {i}", f"Category {i % 50}", f"Supplier {i % 20}", 'Home', 100 + i % 900, f"{i:013d}", 10, 2])
+
+    thread = ProductImportThread(db.db_path, csv_path)
+    started = time.perf_counter()
+    thread.run()
+    print(f"First import of 100k rows: {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    thread = ProductImportThread(db.db_path, csv_path)
+    thread.run()
+    print(f"Re-import (all updates): {time.perf_counter() - started:.2f}s")
+    conn = db.get_connection()
+    print("Products:", conn.execute("SELECT COUNT(*) FROM Products").fetchone()[0])
+    conn.close()
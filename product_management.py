@@ -2,13 +2,29 @@ from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox,
     QRadioButton, QButtonGroup, QPushButton, QTableWidget, QTableWidgetItem,
     QGroupBox, QFormLayout, QMessageBox, QSpinBox, QDoubleSpinBox, QScrollArea, QHeaderView,
-    QDialog, QDialogButtonBox, QFileDialog
+    QDialog, QDialogButtonBox, QFileDialog, QTableView, QStyledItemDelegate, QApplication
 )
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QAbstractTableModel, QModelIndex, QEvent
+from PyQt6.QtGui import QColor, QKeySequence
 from PyQt6.QtWidgets import QSizePolicy
 from database import Database
-from ui_factory import setup_professional_table, create_professional_table_item, ensure_table_visibility
+from data_export import CHUNK_SIZE
+from product_import import ProductImportDialog
+from ui_factory import UITheme, setup_professional_table, create_professional_table_item
 import csv
+import numpy as np
+
+
+def selling_price(cost, packing, others, carriage, profit_percent, is_import):
+    """Selling price from costs and profit margin.
+
+    Home: (cost + packing + others + carriage) plus profit.
+    Import: (cost + carriage) plus profit.
+    Plain arithmetic, so the same formula works on scalars or element-wise on NumPy arrays.
+    """
+    total_cost = cost + carriage + (1 - is_import) * (packing + others)
+    return total_cost * (1 + profit_percent / 100)
+
 
 class ProductManagement(QWidget):
     def __init__(self, db):
@@ -266,24 +282,11 @@ class ProductManagement(QWidget):
         self.calculate_price()
 
     def calculate_price(self):
-        cost = self.cost_spin.value()
-        packing = self.packing_spin.value()
-        others = self.others_spin.value()
-        carriage = self.carriage_spin.value()
-        profit_percent = self.profit_spin.value()
-
-        if self.home_radio.isChecked():
-            # Home: Total cost = Cost + Packing + Others + Carriage
-            total_cost = cost + packing + others + carriage
-            # Selling price = total_cost + (total_cost * profit_percent / 100)
-            selling_price = total_cost * (1 + profit_percent / 100)
-        else:
-            # Import: Total cost = Cost + Carriage
-            total_cost = cost + carriage
-            # Selling price = total_cost + (total_cost * profit_percent / 100)
-            selling_price = total_cost * (1 + profit_percent / 100)
-
-        self.selling_price_edit.setText(f"{selling_price:.2f}")
+        price = selling_price(
+            self.cost_spin.value(), self.packing_spin.value(), self.others_spin.value(),
+            self.carriage_spin.value(), self.profit_spin.value(), 0 if self.home_radio.isChecked() else 1
+        )
+        self.selling_price_edit.setText(f"{price:.2f}")
 
     def add_product(self):
         name = self.name_edit.text().strip()
@@ -316,9 +319,10 @@ class ProductManagement(QWidget):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT p.id, p.name, c.name, CASE WHEN p.is_import THEN 'Import' ELSE 'Home' END, p.unit_price, p.current_stock, p.min_stock_level
+            SELECT p.id, p.name, c.name, CASE WHEN p.is_import THEN 'Import' ELSE 'Home' END, p.unit_price, COALESCE(sl.quantity, 0), p.min_stock_level
             FROM Products p
             LEFT JOIN Categories c ON p.category_id = c.id
+            LEFT JOIN StockLevels sl ON sl.product_id = p.id
         """)
         products = cursor.fetchall()
         conn.close()
@@ -448,48 +452,9 @@ class ProductManagement(QWidget):
         self.load_products()
 
     def import_from_csv(self):
-        file_path, _ = QFileDialog.getOpenFileName(self, "Import Products from CSV", "", "CSV Files (*.csv)")
-        if not file_path:
-            return
-        try:
-            with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.DictReader(csvfile)
-                conn = self.db.get_connection()
-                cursor = conn.cursor()
-                added = 0
-                for row in reader:
-                    name = row.get('name', '').strip()
-                    category_name = row.get('category', '').strip()
-                    supplier_name = row.get('supplier', '').strip()
-                    is_import_str = row.get('type', 'Home').strip().lower()
-                    is_import = 1 if is_import_str == 'import' else 0
-                    unit_price = float(row.get('unit_price', 0))
-                    current_stock = int(row.get('current_stock', 0))
-                    min_stock_level = int(row.get('min_stock_level', 0))
-                    barcode = row.get('barcode', '').strip()
-
-                    # Get category_id
-                    cursor.execute("SELECT id FROM Categories WHERE name = ?", (category_name,))
-                    cat_result = cursor.fetchone()
-                    category_id = cat_result[0] if cat_result else None
-
-                    # Get supplier_id
-                    cursor.execute("SELECT id FROM Suppliers WHERE name = ?", (supplier_name,))
-                    sup_result = cursor.fetchone()
-                    supplier_id = sup_result[0] if sup_result else None
-
-                    if name and category_id is not None:
-                        cursor.execute("""
-                            INSERT INTO Products (name, category_id, supplier_id, is_import, unit_price, barcode, current_stock, min_stock_level)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (name, category_id, supplier_id, is_import, unit_price, barcode, current_stock, min_stock_level))
-                        added += 1
-                conn.commit()
-                conn.close()
-                QMessageBox.information(self, "Success", f"Imported {added} products successfully.")
-                self.load_products()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Failed to import: {str(e)}")
+        dialog = ProductImportDialog(self.db, self)
+        dialog.exec()
+        self.load_products()
 
     def export_to_csv(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "Export Products to CSV", "products.csv", "CSV Files (*.csv)")
@@ -500,40 +465,199 @@ class ProductManagement(QWidget):
             cursor = conn.cursor()
             cursor.execute("""
                 SELECT p.name, c.name as category, s.name as supplier, CASE WHEN p.is_import THEN 'Import' ELSE 'Home' END as type,
-                       p.unit_price, p.barcode, p.current_stock, p.min_stock_level
+                       p.unit_price, p.barcode, COALESCE(sl.quantity, 0), p.min_stock_level
                 FROM Products p
                 LEFT JOIN Categories c ON p.category_id = c.id
                 LEFT JOIN Suppliers s ON p.supplier_id = s.id
+                LEFT JOIN StockLevels sl ON sl.product_id = p.id
             """)
-            products = cursor.fetchall()
-            conn.close()
-
             with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['name', 'category', 'supplier', 'type', 'unit_price', 'barcode', 'current_stock', 'min_stock_level']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                for prod in products:
-                    writer.writerow({
-                        'name': prod[0],
-                        'category': prod[1] or '',
-                        'supplier': prod[2] or '',
-                        'type': prod[3],
-                        'unit_price': prod[4],
-                        'barcode': prod[5] or '',
-                        'current_stock': prod[6],
-                        'min_stock_level': prod[7]
-                    })
+                writer = csv.writer(csvfile)
+                writer.writerow(['name', 'category', 'supplier', 'type', 'unit_price', 'barcode', 'current_stock', 'min_stock_level'])
+                # Stream in chunks instead of loading the whole catalogue
+                while True:
+                    products = cursor.fetchmany(CHUNK_SIZE)
+                    if not products:
+                        break
+                    writer.writerows([
+                        [prod[0], prod[1] or '', prod[2] or '', prod[3], prod[4], prod[5] or '', prod[6], prod[7]]
+                        for prod in products
+                    ])
+            conn.close()
             QMessageBox.information(self, "Success", "Products exported successfully.")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to export: {str(e)}")
 
 
+class BulkProductModel(QAbstractTableModel):
+    """Rows of [name, type, cost, packing, others/carriage, profit %] for BulkAddDialog.
+
+    Selling prices are recalculated for the whole grid at once, and there is always
+    one empty row at the bottom to type into.
+    """
+    HEADERS = ["Name", "Type", "Cost Price", "Packing", "Others/Carriage", "Profit (%)", "Selling Price", "Status"]
+    PRICE_COL = 6
+    STATUS_COL = 7
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = [self.empty_row()]
+        self.prices = np.zeros(1)
+        self.errors = {}  # row -> message
+
+    @staticmethod
+    def empty_row():
+        return ["", "Home", 0.0, 0.0, 0.0, 0.0]
+
+    def rowCount(self, parent=QModelIndex()):
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        flags = Qt.ItemFlag.ItemIsEnabled | Qt.ItemFlag.ItemIsSelectable
+        if index.column() < self.PRICE_COL:
+            flags |= Qt.ItemFlag.ItemIsEditable
+        return flags
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        row, col = index.row(), index.column()
+        if role in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.EditRole):
+            if col == self.PRICE_COL:
+                return f"{self.prices[row]:.2f}" if self.rows[row][0] else ""
+            if col == self.STATUS_COL:
+                return self.errors.get(row, "")
+            value = self.rows[row][col]
+            if role == Qt.ItemDataRole.DisplayRole and isinstance(value, float):
+                return f"{value:.2f}"
+            return value
+        if role == Qt.ItemDataRole.BackgroundRole and row in self.errors:
+            return QColor(255, 100, 100)
+        if role == Qt.ItemDataRole.TextAlignmentRole and 2 <= col <= self.PRICE_COL:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def setData(self, index, value, role=Qt.ItemDataRole.EditRole):
+        if role != Qt.ItemDataRole.EditRole or not index.isValid():
+            return False
+        self.set_cell(index.row(), index.column(), value)
+        self.errors.pop(index.row(), None)
+        self.after_edit()
+        return True
+
+    def set_cell(self, row, col, value):
+        """Store a value, coercing pasted text. Raises ValueError for bad numbers."""
+        if col == 0:
+            self.rows[row][0] = str(value).strip()
+        elif col == 1:
+            self.rows[row][1] = "Import" if str(value).strip().lower() == "import" else "Home"
+        elif 2 <= col <= 5:
+            text = str(value).replace(",", "").replace("%", "").strip()
+            try:
+                self.rows[row][col] = float(text) if text else 0.0
+            except ValueError:
+                self.rows[row][col] = 0.0
+                raise ValueError(f"Invalid {self.HEADERS[col]}: '{value}'")
+
+    def paste(self, start_row, start_col, text):
+        """Paste tab separated text (as copied from a spreadsheet) starting at a cell"""
+        lines = [line for line in text.splitlines() if line.strip()]
+        if not lines:
+            return
+        self.beginResetModel()
+        for offset, line in enumerate(lines):
+            row = start_row + offset
+            while row >= len(self.rows):
+                self.rows.append(self.empty_row())
+            self.errors.pop(row, None)
+            for col_offset, value in enumerate(line.split("\t")):
+                col = start_col + col_offset
+                if col >= self.PRICE_COL:
+                    break
+                try:
+                    self.set_cell(row, col, value)
+                except ValueError as e:
+                    self.errors[row] = str(e)
+        self.ensure_trailing_row()
+        self.recalculate()
+        self.endResetModel()
+
+    def remove_rows(self, rows):
+        self.beginResetModel()
+        for row in sorted(rows, reverse=True):
+            if 0 <= row < len(self.rows):
+                del self.rows[row]
+        self.errors = {}
+        self.ensure_trailing_row()
+        self.recalculate()
+        self.endResetModel()
+
+    def ensure_trailing_row(self):
+        if not self.rows or self.rows[-1][0]:
+            self.rows.append(self.empty_row())
+
+    def after_edit(self):
+        if self.rows[-1][0]:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows))
+            self.rows.append(self.empty_row())
+            self.endInsertRows()
+        self.recalculate()
+        self.dataChanged.emit(self.index(0, self.PRICE_COL), self.index(len(self.rows) - 1, self.STATUS_COL))
+
+    def recalculate(self):
+        columns = np.array([row[2:6] for row in self.rows], dtype=float).reshape(-1, 4)
+        is_import = np.array([row[1] == "Import" for row in self.rows], dtype=float)
+        cost, packing, others_carriage, profit = columns.T
+        self.prices = selling_price(cost, packing, 0, others_carriage, profit, is_import)
+
+
+class BulkProductDelegate(QStyledItemDelegate):
+    """Creates an editor only for the cell being edited"""
+
+    def createEditor(self, parent, option, index):
+        col = index.column()
+        if col == 1:
+            editor = QComboBox(parent)
+            editor.addItems(["Home", "Import"])
+            return editor
+        if 2 <= col <= 5:
+            editor = QDoubleSpinBox(parent)
+            editor.setMaximum(1000 if col == 5 else 1000000)
+            if col == 5:
+                editor.setSuffix(" %")
+            return editor
+        return super().createEditor(parent, option, index)
+
+    def setEditorData(self, editor, index):
+        value = index.model().rows[index.row()][index.column()]
+        if isinstance(editor, QComboBox):
+            editor.setCurrentText(value)
+        elif isinstance(editor, QDoubleSpinBox):
+            editor.setValue(value)
+        else:
+            super().setEditorData(editor, index)
+
+    def setModelData(self, editor, model, index):
+        if isinstance(editor, QComboBox):
+            model.setData(index, editor.currentText())
+        elif isinstance(editor, QDoubleSpinBox):
+            model.setData(index, editor.value())
+        else:
+            super().setModelData(editor, model, index)
+
+
 class BulkAddDialog(QDialog):
     def __init__(self, db, parent=None):
         super().__init__(parent)
         self.db = db
         self.setWindowTitle("Bulk Add Products")
-        self.setGeometry(200, 200, 800, 600)
+        self.setGeometry(200, 200, 900, 600)
         self.init_ui()
 
     def init_ui(self):
@@ -555,26 +679,30 @@ class BulkAddDialog(QDialog):
         sup_layout.addWidget(self.supplier_combo)
         layout.addLayout(sup_layout)
 
-        # Products table
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)
-        self.table.setHorizontalHeaderLabels(["Name", "Type", "Cost Price", "Packing", "Others/Carriage", "Profit (%)"])
-        header = self.table.horizontalHeader()
-        header.setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
-        ensure_table_visibility(self.table)
-        self.table.verticalHeader().setDefaultSectionSize(50)
+        hint = QLabel("Tip: copy rows from a spreadsheet (Name, Type, Cost, Packing, Others/Carriage, Profit %) and press Ctrl+V.")
+        hint.setStyleSheet("color: #cccccc;")
+        layout.addWidget(hint)
+
+        # Products grid
+        self.model = BulkProductModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setItemDelegate(BulkProductDelegate(self.table))
+        self.table.setEditTriggers(QTableView.EditTrigger.AllEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        self.table.horizontalHeader().setSectionResizeMode(BulkProductModel.STATUS_COL, QHeaderView.ResizeMode.ResizeToContents)
+        self.table.setStyleSheet(UITheme.TABLE_STYLE)
+        self.table.verticalHeader().setDefaultSectionSize(35)
+        self.table.installEventFilter(self)
         layout.addWidget(self.table)
 
-        # Add first row by default
-        self.add_row()
-
         # Buttons
         btn_layout = QHBoxLayout()
-        add_row_btn = QPushButton("Add Row")
-        add_row_btn.clicked.connect(self.add_row)
-        btn_layout.addWidget(add_row_btn)
+        paste_btn = QPushButton("Paste Rows")
+        paste_btn.clicked.connect(self.paste_rows)
+        btn_layout.addWidget(paste_btn)
 
-        remove_row_btn = QPushButton("Remove Selected Row")
+        remove_row_btn = QPushButton("Remove Selected Rows")
         remove_row_btn.clicked.connect(self.remove_row)
         btn_layout.addWidget(remove_row_btn)
 
@@ -588,6 +716,12 @@ class BulkAddDialog(QDialog):
 
         layout.addLayout(btn_layout)
 
+    def eventFilter(self, obj, event):
+        if obj is self.table and event.type() == QEvent.Type.KeyPress and event.matches(QKeySequence.StandardKey.Paste):
+            self.paste_rows()
+            return True
+        return super().eventFilter(obj, event)
+
     def load_categories(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
@@ -610,92 +744,74 @@ class BulkAddDialog(QDialog):
         for sup_id, name in suppliers:
             self.supplier_combo.addItem(name, sup_id)
 
-    def add_row(self):
-        row = self.table.rowCount()
-        self.table.insertRow(row)
-        # Name edit
-        name_edit = QLineEdit()
-        name_edit.setFixedHeight(35)
-        name_edit.textChanged.connect(lambda: self.on_name_changed(row))
-        self.table.setCellWidget(row, 0, name_edit)
-        # Add combo for type
-        type_combo = QComboBox()
-        type_combo.setFixedHeight(35)
-        type_combo.addItems(["Home", "Import"])
-        self.table.setCellWidget(row, 1, type_combo)
-        # Add spin boxes for costs
-        for col in [2, 3, 4]:
-            spin = QDoubleSpinBox()
-            spin.setMaximum(1000000)
-            spin.setFixedHeight(35)
-            self.table.setCellWidget(row, col, spin)
-        # Profit spin box with percentage
-        profit_spin = QDoubleSpinBox()
-        profit_spin.setMaximum(1000)  # Max 1000%
-        profit_spin.setSuffix(" %")
-        profit_spin.setFixedHeight(35)
-        self.table.setCellWidget(row, 5, profit_spin)
+    def paste_rows(self):
+        index = self.table.currentIndex()
+        row = index.row() if index.isValid() else self.model.rowCount() - 1
+        col = index.column() if index.isValid() and index.column() < BulkProductModel.PRICE_COL else 0
+        self.model.paste(row, col, QApplication.clipboard().text())
 
     def remove_row(self):
-        current_row = self.table.currentRow()
-        if current_row >= 0:
-            self.table.removeRow(current_row)
-
-    def on_name_changed(self, row):
-        name_edit = self.table.cellWidget(row, 0)
-        if name_edit and name_edit.text().strip() and row == self.table.rowCount() - 1:
-            self.add_row()
+        rows = {index.row() for index in self.table.selectionModel().selectedIndexes()}
+        if not rows and self.table.currentIndex().isValid():
+            rows = {self.table.currentIndex().row()}
+        self.model.remove_rows(rows)
 
     def save_products(self):
         category_id = self.category_combo.currentData()
         supplier_id = self.supplier_combo.currentData()
-
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        added = 0
-        for row in range(self.table.rowCount()):
-            name_edit = self.table.cellWidget(row, 0)
-            if not name_edit:
+        model = self.model
+        model.recalculate()
+
+        # Validate every row first so one bad line doesn't block the rest
+        errors = {row: msg for row, msg in model.errors.items() if model.rows[row][0]}
+        seen = {}
+        valid_rows = []
+        for row, values in enumerate(model.rows):
+            name = values[0]
+            if not name or row in errors:
                 continue
-            name = name_edit.text().strip()
-            if not name:
+            if name.lower() in seen:
+                errors[row] = f"Name repeats row {seen[name.lower()] + 1} of this list"
                 continue
+            seen[name.lower()] = row
+            if model.prices[row] <= 0:
+                errors[row] = "Selling price must be greater than zero"
+                continue
+            valid_rows.append(row)
 
-            type_combo = self.table.cellWidget(row, 1)
-            is_import = 1 if type_combo.currentText() == "Import" else 0
-
-            cost_spin = self.table.cellWidget(row, 2)
-            cost = cost_spin.value()
-
-            packing_spin = self.table.cellWidget(row, 3)
-            packing = packing_spin.value()
-
-            others_carriage_spin = self.table.cellWidget(row, 4)
-            others_carriage = others_carriage_spin.value()
-
-            profit_spin = self.table.cellWidget(row, 5)
-            profit_percent = profit_spin.value()
+        if not valid_rows:
+            model.beginResetModel()
+            model.errors = errors
+            model.endResetModel()
+            QMessageBox.warning(self, "Error", "No valid products to save." if not errors else f"{len(errors)} rows have errors. See the Status column.")
+            return
 
-            if is_import:
-                total_cost = cost + others_carriage
-                unit_price = total_cost * (1 + profit_percent / 100)
-            else:
-                total_cost = cost + packing + others_carriage
-                unit_price = total_cost * (1 + profit_percent / 100)
+        try:
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO Products (name, category_id, supplier_id, is_import, unit_price, current_stock, min_stock_level)
+                VALUES (?, ?, ?, ?, ?, 0, 0)
+            """, [(model.rows[r][0], category_id, supplier_id, 1 if model.rows[r][1] == "Import" else 0, round(float(model.prices[r]), 2))
+                  for r in valid_rows])
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to add products: {str(e)}")
+            return
 
-            try:
-                cursor.execute("""
-                    INSERT INTO Products (name, category_id, supplier_id, is_import, unit_price, current_stock, min_stock_level)
-                    VALUES (?, ?, ?, ?, ?, 0, 0)
-                """, (name, category_id, supplier_id, is_import, unit_price))
-                added += 1
-            except Exception as e:
-                QMessageBox.critical(self, "Error", f"Failed to add product {name}: {str(e)}")
-                conn.rollback()
-                conn.close()
-                return
+        if not errors:
+            QMessageBox.information(self, "Success", f"Added {len(valid_rows)} products successfully.")
+            self.accept()
+            return
 
-        conn.commit()
-        conn.close()
-        QMessageBox.information(self, "Success", f"Added {added} products successfully.")
-        self.accept()
\ No newline at end of file
+        # Keep only the rows that failed, with their reasons, so they can be fixed and saved again
+        model.beginResetModel()
+        failed = sorted(errors)
+        model.rows = [model.rows[r] for r in failed]
+        model.errors = {i: errors[r] for i, r in enumerate(failed)}
+        model.ensure_trailing_row()
+        model.recalculate()
+        model.endResetModel()
+        QMessageBox.warning(self, "Partially Saved",
+                            f"Added {len(valid_rows)} products. {len(failed)} rows have errors and were kept for correction.")
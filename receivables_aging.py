@@ -0,0 +1,96 @@
+"""
+Receivables Aging for Eagle Traders
+Buckets each customer's unpaid debits by age, matching credits to the oldest debits first
+"""
+
+import csv
+import datetime
+
+
+class ReceivablesAging:
+    BUCKETS = ["0-30", "31-60", "61-90", "90+"]
+
+    def __init__(self, db):
+        self.db = db
+
+    def compute(self, as_of=None):
+        """Return rows of (customer_id, name, phone, 0-30, 31-60, 61-90, 90+, total_due) as of a 'yyyy-MM-dd' date.
+
+        Credits are matched to the oldest debits first, so whatever is still due is made up
+        of the newest debits. The amount due from debits newer than a bucket boundary is
+        therefore MIN(due, debits since the boundary), which needs one grouped pass over the
+        covering (customer_id, date, debit, credit) index instead of a running sum per row.
+        """
+        as_of_day = datetime.datetime.strptime(as_of, '%Y-%m-%d').date() if as_of else datetime.date.today()
+        params = {'end': (as_of_day + datetime.timedelta(days=1)).strftime('%Y-%m-%d')}
+        for days in (30, 60, 90):
+            params[f'd{days}'] = (as_of_day - datetime.timedelta(days=days)).strftime('%Y-%m-%d')
+
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.id, c.name, c.phone,
+                   MIN(a.due, a.recent_30),
+                   MIN(a.due, a.recent_60) - MIN(a.due, a.recent_30),
+                   MIN(a.due, a.recent_90) - MIN(a.due, a.recent_60),
+                   a.due - MIN(a.due, a.recent_90),
+                   a.due
+            FROM (
+                SELECT customer_id,
+                       SUM(COALESCE(debit, 0)) - SUM(COALESCE(credit, 0)) AS due,
+                       SUM(CASE WHEN date >= :d30 THEN debit ELSE 0 END) AS recent_30,
+                       SUM(CASE WHEN date >= :d60 THEN debit ELSE 0 END) AS recent_60,
+                       SUM(CASE WHEN date >= :d90 THEN debit ELSE 0 END) AS recent_90
+                FROM CustomerLedger
+                WHERE date < :end
+                GROUP BY customer_id
+            ) a
+            JOIN Customers c ON c.id = a.customer_id
+            WHERE a.due > 0.005
+            ORDER BY a.due DESC
+        """, params)
+        rows = cursor.fetchall()
+        conn.close()
+        return rows
+
+    def export_to_csv(self, file_path, rows, as_of):
+        with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['as_of', as_of])
+            writer.writerow(['customer', 'phone'] + self.BUCKETS + ['total_due'])
+            for row in rows:
+                writer.writerow([row[1], row[2] or ''] + [f"{value:.2f}" for value in row[3:]])
+            writer.writerow(['Total', ''] + [f"{sum(row[i] for row in rows):.2f}" for i in range(3, 8)])
+
+
+if __name__ == '__main__':
+    # Benchmark: 5k customers, 1M ledger rows
+    import os
+    import random
+    import tempfile
+    import time
+    from database import Database
+
+    path = os.path.join(tempfile.mkdtemp(), 'aging_bench.db')
+    db = Database(path)
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO Customers (id, name) VALUES (?, ?)",
+                       [(i, f"Customer {i}") for i in range(1, 5001)])
+    start_day = datetime.date.today() - datetime.timedelta(days=365)
+    entries = []
+    for _ in range(1000000):
+        day = (start_day + datetime.timedelta(days=random.randint(0, 365))).strftime('%Y-%m-%d')
+        if random.random() < 0.6:
+            entries.append((random.randint(1, 5000), day, 'Sale', random.randint(100, 5000), 0, 0))
+        else:
+            entries.append((random.randint(1, 5000), day, 'Payment', 0, random.randint(100, 4000), 0))
+    cursor.executemany("INSERT INTO CustomerLedger (customer_id, date, description, debit, credit, balance) VALUES (?, ?, ?, ?, ?, ?)", entries)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    aging = ReceivablesAging(db)
+    started = time.perf_counter()
+    rows = aging.compute()
+    print(f"Aged {len(rows)} customers over 1M ledger rows in {time.perf_counter() - started:.3f}s")
@@ -0,0 +1,398 @@
+"""
+Sales Cube for Eagle Traders
+Sales line items held as NumPy columns for in-memory group-by, pivot and filter queries
+"""
+
+import datetime
+
+import numpy as np
+from PyQt6.QtCore import Qt, QThread, pyqtSignal, QAbstractTableModel, QModelIndex
+from demand_forecast import JULIAN_DAY_OFFSET
+
+# Julian day number (as stored by CAST(julianday(...) AS INTEGER)) of 1970-01-01
+UNIX_EPOCH_DAY = datetime.date(1970, 1, 1).toordinal() + JULIAN_DAY_OFFSET
+
+
+class SalesCube:
+    """Sales fact table as columns, loaded once and extended with new sales on refresh().
+
+    Line items keep only sale_id, product_id, quantity, revenue and discount; the day and
+    customer of a sale and the category of a product are looked up through small arrays
+    indexed by id at query time, so editing a product's category needs no reload.
+    Sales and line items are append-only in this app; a shrinking table (a restored
+    backup) triggers a full reload.
+    """
+    DIMENSIONS = ['day', 'month', 'year', 'weekday', 'product', 'category', 'customer']
+    MEASURES = ['revenue', 'quantity', 'discount', 'lines']
+    CHUNK_SIZE = 500000
+    WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+    def __init__(self, db):
+        self.db = db
+        self.reset()
+
+    def reset(self):
+        self.size = 0
+        self.last_item_id = 0
+        self.last_sale_id = 0
+        self.sale = np.zeros(0, dtype=np.int32)
+        self.product = np.zeros(0, dtype=np.int32)
+        self.quantity = np.zeros(0, dtype=np.int32)
+        self.revenue = np.zeros(0, dtype=np.int64)  # paisa
+        self.discount = np.zeros(0, dtype=np.int32)  # paisa below list price
+        # Indexed by sale id; day 0 marks a missing or cancelled sale
+        self.sale_day = np.zeros(1, dtype=np.int32)
+        self.sale_customer = np.zeros(1, dtype=np.int32)
+        # Indexed by product id
+        self.product_category = np.zeros(1, dtype=np.int32)
+        self.product_names = {}
+        self.category_names = {}
+        self.customer_names = {}
+
+    def refresh(self):
+        """Load sales and line items added since the last refresh; return the number of new line items"""
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            # One read transaction, so sales and their items come from the same snapshot
+            cursor.execute("BEGIN")
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM SalesItems")
+            if cursor.fetchone()[0] < self.last_item_id:
+                self.reset()
+            added = self._load_items(cursor)
+            self._load_sales(cursor)
+
+            cursor.execute("SELECT id, name, COALESCE(category_id, 0) FROM Products")
+            products = cursor.fetchall()
+            categories = np.zeros(max((p[0] for p in products), default=0) + 1, dtype=np.int32)
+            for product_id, name, category_id in products:
+                categories[product_id] = category_id
+            self.product_names = {p[0]: p[1] for p in products}
+            self.product_category = categories
+            cursor.execute("SELECT id, name FROM Categories")
+            self.category_names = dict(cursor.fetchall())
+            cursor.execute("SELECT id, name FROM Customers")
+            self.customer_names = dict(cursor.fetchall())
+        finally:
+            conn.close()
+        return added
+
+    def _load_items(self, cursor):
+        """Append line items in id order, a chunk at a time as space separated lists parsed by NumPy"""
+        added = 0
+        while True:
+            # Money as integer paisa: cheaper for SQLite to print than REAL and exact to sum
+            cursor.execute("""
+                SELECT COUNT(*), MAX(id), group_concat(sale_id, ' '), group_concat(product_id, ' '),
+                       group_concat(quantity, ' '), group_concat(CAST(round(total_price * 100) AS INTEGER), ' '),
+                       group_concat(CAST(round(quantity * unit_price * 100) AS INTEGER), ' ')
+                FROM (SELECT * FROM SalesItems WHERE id > ? ORDER BY id LIMIT ?)
+            """, (self.last_item_id, self.CHUNK_SIZE))
+            count, last_id, sales, products, quantities, revenues, gross = cursor.fetchone()
+            if not count:
+                return added
+            revenue = np.fromstring(revenues, dtype=np.int64, sep=' ')
+            self._append({
+                'sale': np.fromstring(sales, dtype=np.int32, sep=' '),
+                'product': np.fromstring(products, dtype=np.int32, sep=' '),
+                'quantity': np.fromstring(quantities, dtype=np.int32, sep=' '),
+                'revenue': revenue,
+                'discount': (np.fromstring(gross, dtype=np.int64, sep=' ') - revenue).astype(np.int32),
+            }, count)
+            self.last_item_id = last_id
+            added += count
+
+    def _append(self, chunk, count):
+        """Write a chunk past the end, growing the columns geometrically so appends stay amortised O(1)"""
+        needed = self.size + count
+        if needed > len(self.sale):
+            capacity = max(needed, len(self.sale) * 3 // 2, 1024)
+            for name in chunk:
+                column = np.zeros(capacity, dtype=getattr(self, name).dtype)
+                column[:self.size] = getattr(self, name)[:self.size]
+                setattr(self, name, column)
+        for name, values in chunk.items():
+            getattr(self, name)[self.size:needed] = values
+        # Readers only look below size, so publish it after the data is in place
+        self.size = needed
+
+    def _load_sales(self, cursor):
+        while True:
+            cursor.execute("""
+                SELECT COUNT(*), MAX(id), group_concat(id, ' '),
+                       group_concat(CASE WHEN status = 'cancelled' THEN 0
+                                         ELSE CAST(julianday(date(date)) AS INTEGER) END, ' '),
+                       group_concat(COALESCE(customer_id, 0), ' ')
+                FROM (SELECT * FROM SalesTransactions WHERE id > ? ORDER BY id LIMIT ?)
+            """, (self.last_sale_id, self.CHUNK_SIZE))
+            count, last_id, ids, days, customers = cursor.fetchone()
+            if not count:
+                return
+            ids = np.fromstring(ids, dtype=np.int64, sep=' ')
+            if last_id >= len(self.sale_day):
+                capacity = max(last_id + 1, len(self.sale_day) * 3 // 2)
+                self.sale_day = np.concatenate([self.sale_day, np.zeros(capacity - len(self.sale_day), dtype=np.int32)])
+                self.sale_customer = np.concatenate([self.sale_customer, np.zeros(capacity - len(self.sale_customer), dtype=np.int32)])
+            self.sale_day[ids] = np.fromstring(days, dtype=np.int32, sep=' ')
+            self.sale_customer[ids] = np.fromstring(customers, dtype=np.int32, sep=' ')
+            self.last_sale_id = last_id
+
+    def _keys(self, dimension, sale, product, day):
+        """Integer key per line item for a dimension"""
+        if dimension == 'product':
+            return product
+        if dimension == 'category':
+            # Products deleted since, with ids past the newest product, count as Uncategorised (0)
+            known = product < len(self.product_category)
+            return np.where(known, self.product_category.take(product, mode='clip'), 0)
+        if dimension == 'customer':
+            return self.sale_customer[sale]
+        if dimension == 'day':
+            return day
+        # Derive the calendar keys once per distinct day, then look them up per line item
+        first = int(day.min()) if len(day) else 0
+        days = np.arange(first, int(day.max()) + 1 if len(day) else 1)
+        if dimension == 'weekday':
+            table = (days + 1) % 7  # Julian day 0 fell on a Monday, and CAST drops the half day
+        else:
+            table = (days - UNIX_EPOCH_DAY).astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+            if dimension == 'year':
+                table //= 12
+        return table[day - first]
+
+    def _label(self, dimension, key):
+        key = int(key)
+        if dimension == 'product':
+            return self.product_names.get(key, f"#{key}")
+        if dimension == 'category':
+            return self.category_names.get(key, "Uncategorised")
+        if dimension == 'customer':
+            return self.customer_names.get(key, "Walk-in" if key == 0 else f"#{key}")
+        if dimension == 'day':
+            return datetime.date.fromordinal(key - JULIAN_DAY_OFFSET).isoformat()
+        if dimension == 'weekday':
+            return self.WEEKDAYS[key]
+        if dimension == 'month':
+            return f"{1970 + key // 12}-{key % 12 + 1:02d}"
+        return str(1970 + key)
+
+    def pivot(self, rows, columns=None, measure='revenue', date_from=None, date_to=None, filters=None, max_columns=40):
+        """Aggregate measure by rows x columns over the line items matching the filters.
+
+        date_from/date_to are datetime.date bounds (inclusive); filters maps a dimension to the
+        keys to keep, e.g. {'category': [3]}. Columns beyond max_columns, smallest first, are
+        folded into "Other". Returns (row_labels, column_labels, matrix, row_totals).
+        """
+        size = self.size
+        sale = self.sale[:size]
+        product = self.product[:size]
+        day = self.sale_day[sale]
+        mask = day > 0
+        if date_from:
+            mask &= day >= date_from.toordinal() + JULIAN_DAY_OFFSET
+        if date_to:
+            mask &= day <= date_to.toordinal() + JULIAN_DAY_OFFSET
+        for dimension, keep in (filters or {}).items():
+            mask &= np.isin(self._keys(dimension, sale, product, day), np.asarray(list(keep)))
+        sale, product, day = sale[mask], product[mask], day[mask]
+        # bincount works in float64 whatever the weights, so scale paisa to rupees on the result
+        weights = None if measure == 'lines' else getattr(self, measure)[:size][mask]
+        scale = 0.01 if measure in ('revenue', 'discount') else 1
+
+        # Every dimension key is a small integer, so group with bincount over key - min instead of sorting
+        row_index, row_first, row_span = self._offsets(self._keys(rows, sale, product, day))
+        if columns:
+            column_index, column_first, column_span = self._offsets(self._keys(columns, sale, product, day))
+        else:
+            column_index, column_first, column_span = 0, 0, 1
+
+        if row_span * column_span <= 4_000_000:
+            # Small grid: one pass for line counts and one for the measure, folded afterwards
+            cells = row_index * column_span + column_index
+            counts = np.bincount(cells, minlength=row_span * column_span).reshape(row_span, column_span)
+            matrix = counts if weights is None else \
+                np.bincount(cells, weights, minlength=row_span * column_span).reshape(row_span, column_span)
+            row_counts, column_counts = counts.sum(axis=1), counts.sum(axis=0)
+            column_totals = matrix.sum(axis=0)
+        else:
+            # Large grid (e.g. customer x product): fold the columns before building it
+            matrix = None
+            row_counts = np.bincount(row_index, minlength=row_span)
+            column_counts = np.bincount(column_index, minlength=column_span)
+            column_totals = np.bincount(column_index, weights, minlength=column_span)
+
+        present = np.flatnonzero(column_counts)
+        kept = present
+        if len(present) > max_columns:
+            kept = np.sort(present[np.argsort(-np.abs(column_totals[present]), kind='stable')[:max_columns - 1]])
+        folded = np.setdiff1d(present, kept)
+        width = len(kept) + (1 if len(folded) else 0)
+        if matrix is None:
+            lookup = np.full(column_span, len(kept), dtype=np.int64)
+            lookup[kept] = np.arange(len(kept))
+            matrix = np.bincount(row_index * width + lookup[column_index], weights,
+                                 minlength=row_span * width).reshape(row_span, width)
+        elif len(folded):
+            matrix = np.column_stack([matrix[:, kept], matrix[:, folded].sum(axis=1)])
+        else:
+            matrix = matrix[:, kept]
+
+        rows_present = np.flatnonzero(row_counts)
+        matrix = matrix[rows_present] * scale
+        if columns:
+            column_labels = [self._label(columns, key + column_first) for key in kept] + (["Other"] if len(folded) else [])
+        else:
+            column_labels = ["Total"]
+        row_labels = [self._label(rows, key + row_first) for key in rows_present]
+        return row_labels, column_labels, matrix, matrix.sum(axis=1)
+
+    @staticmethod
+    def _offsets(keys):
+        """Keys shifted to start at zero, with the shift and the span they cover"""
+        if not len(keys):
+            return keys.astype(np.int64), 0, 0
+        first = int(keys.min())
+        return keys.astype(np.int64) - first, first, int(keys.max()) - first + 1
+
+
+class SalesCubeThread(QThread):
+    """Thread for loading new sales into the cube"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, cube):
+        super().__init__()
+        self.cube = cube
+
+    def run(self):
+        try:
+            added = self.cube.refresh()
+            self.finished.emit(True, f"{added} line items loaded")
+        except Exception as e:
+            self.finished.emit(False, f"Failed to load sales cube: {str(e)}")
+
+
+class PivotModel(QAbstractTableModel):
+    """Read-only pivot result with a row total column, sortable through an index array"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.row_header = ""
+        self.row_labels = []
+        self.column_labels = []
+        self.values = np.zeros((0, 0))
+        self.rows = np.zeros(0, dtype=np.int64)
+        self.decimals = 2
+
+    def set_result(self, row_header, result, decimals=2):
+        row_labels, column_labels, matrix, totals = result
+        self.beginResetModel()
+        self.row_header = row_header
+        self.row_labels = row_labels
+        # Only show a separate total when there is more than one column to add up
+        self.column_labels = column_labels + (["Total"] if len(column_labels) > 1 else [])
+        self.values = np.column_stack([matrix, totals]) if len(column_labels) > 1 else matrix
+        self.rows = np.arange(len(row_labels))
+        self.decimals = decimals
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.column_labels) + 1 if self.row_labels else 0
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.row_header if section == 0 else self.column_labels[section - 1]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        i = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            if index.column() == 0:
+                return self.row_labels[i]
+            return f"{self.values[i, index.column() - 1]:,.{self.decimals}f}"
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() > 0:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if not len(self.rows):
+            return
+        if column == 0:
+            # Labels come in key order (dates, months, ids), so keep that order for date dimensions
+            ranked = np.arange(len(self.row_labels)) if self.row_header in ('Day', 'Month', 'Year', 'Weekday') \
+                else np.argsort(np.array([label.lower() for label in self.row_labels]), kind='stable')
+        else:
+            ranked = np.argsort(self.values[:, column - 1], kind='stable')
+        if order == Qt.SortOrder.DescendingOrder:
+            ranked = ranked[::-1]
+        self.layoutAboutToBeChanged.emit()
+        self.rows = ranked
+        self.layoutChanged.emit()
+
+    def to_rows(self):
+        """Header and displayed rows, for export"""
+        rows = [[self.row_header] + self.column_labels]
+        for i in self.rows:
+            rows.append([self.row_labels[i]] + [round(float(v), self.decimals) for v in self.values[i]])
+        return rows
+
+
+if __name__ == '__main__':
+    # Benchmark: python sales_cube.py [line_items], 10M by default
+    import os
+    import sys
+    import tempfile
+    import time
+    from database import Database
+
+    items = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    sales = items // 5
+    rng = np.random.default_rng(7)
+    db = Database(os.path.join(tempfile.mkdtemp(), 'cube_bench.db'))
+    conn = db.get_connection()
+    conn.executemany("INSERT INTO Categories (id, name) VALUES (?, ?)", [(i, f"Category {i}") for i in range(1, 51)])
+    conn.executemany("INSERT INTO Products (id, name, category_id, unit_price) VALUES (?, ?, ?, 100)",
+                     [(i, f"Product {i}", i % 50 + 1) for i in range(1, 20001)])
+    conn.executemany("INSERT INTO Customers (id, name) VALUES (?, ?)", [(i, f"Customer {i}") for i in range(1, 5001)])
+    start = datetime.date.today() - datetime.timedelta(days=730)
+    sale_days = np.sort(rng.integers(0, 730, sales))
+    conn.executemany(
+        "INSERT INTO SalesTransactions (id, customer_id, date, total_amount, status) VALUES (?, ?, ?, 0, 'completed')",
+        ((i + 1, int(c) or None, (start + datetime.timedelta(days=int(d))).isoformat() + " 12:00:00")
+         for i, (d, c) in enumerate(zip(sale_days, rng.integers(0, 5001, sales)))))
+    # Bulk load without the rollup triggers; the cube reads SalesItems directly
+    conn.execute("DROP TRIGGER IF EXISTS trg_product_daily_sales_insert")
+    conn.executemany(
+        "INSERT INTO SalesItems (sale_id, product_id, quantity, unit_price, total_price) VALUES (?, ?, ?, ?, ?)",
+        ((int(s), int(p), int(q), 100.0, float(q) * 100.0 * (1 - d))
+         for s, p, q, d in zip(np.sort(rng.integers(1, sales + 1, items)), rng.integers(1, 20001, items),
+                               rng.integers(1, 10, items), rng.choice([0, 0, 0, 0.05, 0.1], items))))
+    conn.commit()
+    conn.close()
+
+    cube = SalesCube(db)
+    started = time.perf_counter()
+    cube.refresh()
+    print(f"Loaded {cube.size:,} line items in {time.perf_counter() - started:.2f}s")
+    for rows, columns, measure in [('category', 'month', 'revenue'), ('customer', 'product', 'quantity'),
+                                   ('product', None, 'discount'), ('day', 'category', 'lines')]:
+        started = time.perf_counter()
+        result = cube.pivot(rows, columns, measure)
+        print(f"{measure} by {rows} x {columns or '-'}: {len(result[0])} x {len(result[1])} "
+              f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+    started = time.perf_counter()
+    cube.pivot('product', 'month', filters={'category': [3, 4]}, date_from=datetime.date.today() - datetime.timedelta(days=90))
+    print(f"Filtered pivot in {(time.perf_counter() - started) * 1000:.0f}ms")
+    conn = db.get_connection()
+    conn.execute("INSERT INTO SalesTransactions (id, date, total_amount, status) VALUES (?, datetime('now'), 0, 'completed')", (sales + 1,))
+    conn.executemany("INSERT INTO SalesItems (sale_id, product_id, quantity, unit_price, total_price) VALUES (?, 1, 1, 100, 100)",
+                     [(sales + 1,)] * 100)
+    conn.commit()
+    conn.close()
+    started = time.perf_counter()
+    added = cube.refresh()
+    print(f"Appended {added} new line items in {(time.perf_counter() - started) * 1000:.0f}ms")
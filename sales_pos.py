@@ -1,71 +1,204 @@
 from PyQt6.QtWidgets import (
-    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox,
+    QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox,
     QPushButton, QTableWidget, QTableWidgetItem, QGroupBox, QFormLayout,
-    QMessageBox, QSpinBox, QDoubleSpinBox, QListWidget, QListWidgetItem, QHeaderView, QInputDialog, QScrollArea, QSizePolicy, QDialog, QDialogButtonBox, QCompleter
+    QMessageBox, QSpinBox, QDoubleSpinBox, QListWidget, QListWidgetItem, QHeaderView, QInputDialog, QScrollArea, QSizePolicy, QDialog, QDialogButtonBox, QCompleter, QTabBar
 )
 from PyQt6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QTimer, QMarginsF, QUrl
 from PyQt6.QtGui import QColor, QTextDocument, QFontDatabase, QPageSize, QPageLayout, QDesktopServices
 from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
 from database import Database
+from customer_segments import CustomerSegments, CustomerSegmentThread
+from customer_identity import CustomerDirectory
+from customer_picker import CustomerPicker
+from scanner_input import ScannerWedge, ScanMetrics, parse_scan
+from held_carts import CartJournal
+from promotions import PromotionEngine
+from escpos_receipt import ReceiptPrinterSettings, ReceiptPrinterDialog, ReceiptPrintThread, RasterCache, sale_receipt
+from notification_manager import show_error_notification, show_warning_notification
+from document_store import DocumentStore
+from stock import record_stock_movement, take_from_batches
 from ui_factory import setup_professional_table, create_professional_table_item
+import collections
 import datetime
 import os
 import sys
+import time
 
 class SalesPOS(QWidget):
     def __init__(self, db):
         super().__init__()
         self.db = db
-        self.cart = []  # list of [product_id, name, qty, unit_price, discount_percent, total]
+        self.cart = []  # list of [product_id, name, qty, unit_price, discount_percent, total]; items of the current cart
+        self.carts = []  # held carts of this terminal, dicts from CartJournal
+        self.current_cart = None
+        self.journal = CartJournal(db)
+        self.promotions = PromotionEngine(db)
+        self.line_promos = []  # (saving, promotion name) per cart row, as last drawn
+        self.buyer_segment = None
+        self.receipt_settings = ReceiptPrinterSettings(db)
+        self.receipt_cache = RasterCache()  # Logo and Urdu lines, rastered once
+        self.receipt_threads = []
+        self.documents = DocumentStore(db)
+        self.journal_timer = QTimer(self)
+        self.journal_timer.setSingleShot(True)
+        self.journal_timer.setInterval(300)
+        self.journal_timer.timeout.connect(self.flush_journal)
         self.all_products = []  # list of (id, name, barcode, unit_price)
+        self.products_by_code = {}  # product and custom barcodes -> product id
+        self.segments = CustomerSegments(db)
+        self.customers = CustomerDirectory(db)
+        self.segment_thread = None
+        # Scans wait here while a dialog is open, so none are lost
+        self.scan_queue = collections.deque()  # (text, time.perf_counter() on arrival)
+        self.scan_metrics = ScanMetrics()
+        self.scanner = ScannerWedge(self)
+        self.scanner.scanned.connect(self.enqueue_scan)
+        self.scan_timer = QTimer(self)
+        self.scan_timer.setInterval(100)
+        self.scan_timer.timeout.connect(self.drain_scans)
+        self.notice_timer = QTimer(self)
+        self.notice_timer.setSingleShot(True)
+        self.notice_timer.timeout.connect(lambda: self.scan_notice.setVisible(False))
         self.load_all_products()
         self.init_ui()
+        self.restore_carts()
+        self.refresh_segments()
+
+    def showEvent(self, event):
+        # Listen for scanner bursts anywhere in the app only while the POS is on screen
+        self.scanner.install()
+        # Pick up promotions edited since the POS was last shown
+        self.promotions.load()
+        self.update_total()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self.scanner.uninstall()
+        self.flush_journal()
+        super().hideEvent(event)
+
+    def restore_carts(self):
+        """Reopen the carts this terminal had open, e.g. after a crash mid-sale"""
+        self.carts = self.journal.load() or [self.journal.create("Cart 1")]
+        for cart in self.carts:
+            self.cart_tabs.addTab(self.cart_tab_text(cart))
+        self.switch_cart(0)
+        restored = sum(1 for cart in self.carts if cart['items'])
+        if restored:
+            self.show_scan_notice(f"Restored {restored} held cart(s).")
+
+    def cart_tab_text(self, cart):
+        name = cart['buyer_name'] or cart['label']
+        return f"{name} ({len(cart['items'])})" if cart['items'] else name
+
+    def journal_cart(self):
+        """Note a change to the current cart; it is written to the journal shortly after the last change"""
+        if self.current_cart is None:
+            return
+        self.current_cart['buyer_name'] = self.buyer_name_edit.currentText().strip()
+        self.current_cart['buyer_contact'] = self.buyer_contact_edit.text().strip()
+        self.cart_tabs.setTabText(self.carts.index(self.current_cart), self.cart_tab_text(self.current_cart))
+        self.journal.mark(self.current_cart)
+        self.journal_timer.start()
+
+    def flush_journal(self):
+        if not self.journal.flush():
+            self.journal_timer.start()
+
+    def switch_cart(self, index):
+        if not 0 <= index < len(self.carts) or self.carts[index] is self.current_cart:
+            return
+        self.current_cart = None  # Loading the buyer fields below must not journal into either cart
+        cart = self.carts[index]
+        self.cart = cart['items']
+        self.buyer_name_edit.setCurrentText(cart['buyer_name'])
+        self.buyer_contact_edit.setText(cart['buyer_contact'])
+        self.current_cart = cart
+        self.cart_tabs.setCurrentIndex(index)
+        self.update_cart_table()
+        self.update_total()
+
+    def park_cart(self):
+        """Hold the current cart and start a new one for the next customer"""
+        number = max((int(c['label'].split()[-1]) for c in self.carts if c['label'].split()[-1].isdigit()), default=0) + 1
+        try:
+            cart = self.journal.create(f"Cart {number}")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to hold cart: {str(e)}")
+            return
+        self.carts.append(cart)
+        self.cart_tabs.addTab(self.cart_tab_text(cart))
+        self.switch_cart(len(self.carts) - 1)
+        self.barcode_edit.setFocus()
+
+    def close_current_cart(self):
+        """Drop the current cart after checkout or on discard; the last cart is emptied instead"""
+        cart = self.current_cart
+        if len(self.carts) == 1:
+            cart['items'].clear()
+            self.buyer_name_edit.setCurrentText("")
+            self.buyer_contact_edit.clear()
+            self.update_cart_table()
+            self.update_total()
+            self.journal_cart()
+            return
+        index = self.carts.index(cart)
+        self.journal.discard(cart['id'])
+        self.current_cart = None
+        del self.carts[index]
+        self.cart_tabs.removeTab(index)
+        self.switch_cart(min(index, len(self.carts) - 1))
+
+    def discard_cart(self):
+        if not self.cart and not self.buyer_name_edit.currentText().strip():
+            self.close_current_cart()
+            return
+        reply = QMessageBox.question(self, "Discard Cart", "Discard this cart and its items?",
+                                     QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply == QMessageBox.StandardButton.Yes:
+            self.close_current_cart()
 
     def load_all_products(self):
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT id, name, barcode, unit_price FROM Products ORDER BY name")
         self.all_products = cursor.fetchall()
+        cursor.execute("SELECT code, product_id FROM CustomBarcodes WHERE product_id IS NOT NULL")
+        self.products_by_code = dict(cursor.fetchall())
+        # Product barcodes win over custom codes
+        self.products_by_code.update((str(code), prod_id) for prod_id, _, code, _ in self.all_products if code)
         conn.close()
 
     def load_customers_for_sales(self):
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, name FROM Customers ORDER BY name")
-        customers = cursor.fetchall()
-        conn.close()
-        self.buyer_name_edit.clear()
-        self.buyer_name_edit.addItem("", None)  # Empty
-        for cid, name in customers:
-            self.buyer_name_edit.addItem(name, cid)
-        # Completer
-        # customer_names = [name for cid, name in customers]
-        # completer = QCompleter(customer_names)
-        # completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        # completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        # self.buyer_name_edit.setCompleter(completer)
+        self.buyer_name_edit.refresh(self.segment_filter.currentData())
 
     def on_buyer_changed(self):
         name = self.buyer_name_edit.currentText().strip()
         if not name:
             self.buyer_contact_edit.clear()
+            self.buyer_segment_label.clear()
             self.customer_history_table.setRowCount(0)
+            self.set_buyer_segment(None)
             return
         # Find customer
         conn = self.db.get_connection()
         cursor = conn.cursor()
-        cursor.execute("SELECT id, phone FROM Customers WHERE name = ?", (name,))
-        customer = cursor.fetchone()
-        if customer:
-            cid, phone = customer
+        cid = self.customers.find(cursor, name)
+        if cid:
+            cursor.execute("SELECT phone FROM Customers WHERE id = ?", (cid,))
+            phone = cursor.fetchone()[0]
             self.buyer_contact_edit.setText(phone or "")
+            scores = self.segments.get(cid)
+            self.buyer_segment_label.setText(
+                f"{scores['segment']} (R{scores['r_score']} F{scores['f_score']} M{scores['m_score']})" if scores else "")
+            self.set_buyer_segment(scores['segment'] if scores else None)
             # Load history
             cursor.execute("""
                 SELECT date, total_amount, status
                 FROM SalesTransactions
-                WHERE buyer_name = ?
+                WHERE customer_id = ?
                 ORDER BY date DESC
-            """, (name,))
+            """, (cid,))
             history = cursor.fetchall()
             self.customer_history_table.setRowCount(len(history))
             for r, (date, total, status) in enumerate(history):
@@ -74,9 +207,35 @@ class SalesPOS(QWidget):
                 self.customer_history_table.setItem(r, 2, QTableWidgetItem(status))
         else:
             self.buyer_contact_edit.clear()
+            similar = self.customers.suggest(name, limit=3)
+            self.buyer_segment_label.setText(
+                "New customer · similar: " + ", ".join(s.name for s in similar) if similar else "New customer")
             self.customer_history_table.setRowCount(0)
+            self.set_buyer_segment(None)
         conn.close()
 
+    def set_buyer_segment(self, segment):
+        # Segment prices follow the buyer
+        if segment != self.buyer_segment:
+            self.buyer_segment = segment
+            self.update_total()
+
+    def refresh_segments(self):
+        """Fold new sales into the customer segments in the background"""
+        if self.segment_thread and self.segment_thread.isRunning():
+            return
+        self.segment_thread = CustomerSegmentThread(self.db)
+        self.segment_thread.finished.connect(self.on_segments_refreshed)
+        self.segment_thread.start()
+
+    def on_segments_refreshed(self, success, message):
+        if not success:
+            print(message)
+            return
+        # Refilter the picker unless a buyer is already being entered
+        if self.segment_filter.currentData() and not self.buyer_name_edit.currentText().strip():
+            self.load_customers_for_sales()
+
     def refresh_products(self):
         self.load_all_products()
         self.filter_products()
@@ -112,11 +271,19 @@ class SalesPOS(QWidget):
         barcode_layout = QHBoxLayout()
         barcode_layout.addWidget(QLabel("Barcode:"))
         self.barcode_edit = QLineEdit()
-        self.barcode_edit.setPlaceholderText("Scan or enter barcode...")
+        self.barcode_edit.setPlaceholderText("Scan or enter barcode (3*code for three)...")
         self.barcode_edit.returnPressed.connect(self.add_by_barcode)
         barcode_layout.addWidget(self.barcode_edit)
+        self.scan_stats_label = QLabel("")
+        self.scan_stats_label.setStyleSheet("color: gray;")
+        barcode_layout.addWidget(self.scan_stats_label)
         select_layout.addLayout(barcode_layout)
 
+        # Scan results show here instead of in dialogs, so the next scan is never blocked
+        self.scan_notice = QLabel("")
+        self.scan_notice.setVisible(False)
+        select_layout.addWidget(self.scan_notice)
+
         # Product list
         self.product_list = QListWidget()
         self.product_list.setMinimumHeight(150)
@@ -148,9 +315,24 @@ class SalesPOS(QWidget):
 
         layout.addWidget(select_group)
 
+        # Held carts: one tab per customer being served at this terminal
+        carts_layout = QHBoxLayout()
+        self.cart_tabs = QTabBar()
+        self.cart_tabs.setExpanding(False)
+        self.cart_tabs.currentChanged.connect(self.switch_cart)
+        carts_layout.addWidget(self.cart_tabs)
+        carts_layout.addStretch()
+        park_btn = QPushButton("Hold && New Cart")
+        park_btn.clicked.connect(self.park_cart)
+        carts_layout.addWidget(park_btn)
+        discard_btn = QPushButton("Discard Cart")
+        discard_btn.clicked.connect(self.discard_cart)
+        carts_layout.addWidget(discard_btn)
+        layout.addLayout(carts_layout)
+
         # Cart table
         self.cart_table = QTableWidget()
-        setup_professional_table(self.cart_table, ["Product", "Qty", "Unit Price", "Discount %", "Total", "Remove"], ['text', 'numeric', 'numeric', 'numeric', 'numeric', 'action'])
+        setup_professional_table(self.cart_table, ["Product", "Qty", "Unit Price", "Discount %", "Promotion", "Total", "Remove"], ['text', 'numeric', 'numeric', 'numeric', 'text', 'numeric', 'action'])
         self.cart_table.setMouseTracking(True)
         self.cart_table.mouseMoveEvent = self.table_mouse_move
         self.cart_table.setMinimumHeight(200)
@@ -160,23 +342,29 @@ class SalesPOS(QWidget):
         # Buyer details
         buyer_group = QGroupBox("Buyer Details")
         buyer_layout = QHBoxLayout(buyer_group)
+        buyer_layout.addWidget(QLabel("Segment:"))
+        self.segment_filter = QComboBox()
+        self.segment_filter.addItem("All Customers", None)
+        for segment in CustomerSegments.SEGMENTS:
+            self.segment_filter.addItem(segment, segment)
+        self.segment_filter.currentIndexChanged.connect(self.load_customers_for_sales)
+        buyer_layout.addWidget(self.segment_filter)
         buyer_layout.addWidget(QLabel("Buyer Name:"))
-        self.buyer_name_edit = QComboBox()
-        self.buyer_name_edit.setEditable(True)
+        # Any name can be typed; a new buyer becomes a customer at checkout
+        self.buyer_name_edit = CustomerPicker(self.db, "")
         self.buyer_name_edit.setMinimumWidth(250)
         buyer_layout.addWidget(self.buyer_name_edit)
-        self.load_customers_for_sales()
-        # Remove completer to allow free input
-        # completer = QCompleter(customer_names)
-        # completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
-        # completer.setFilterMode(Qt.MatchFlag.MatchContains)
-        # self.buyer_name_edit.setCompleter(completer)
         self.buyer_name_edit.currentTextChanged.connect(self.on_buyer_changed)
+        self.buyer_name_edit.currentTextChanged.connect(self.journal_cart)
         buyer_layout.addWidget(QLabel("Contact:"))
         self.buyer_contact_edit = QLineEdit()
         self.buyer_contact_edit.setPlaceholderText("Enter contact info")
         self.buyer_contact_edit.setMinimumWidth(200)
+        self.buyer_contact_edit.textChanged.connect(self.journal_cart)
         buyer_layout.addWidget(self.buyer_contact_edit)
+        self.buyer_segment_label = QLabel("")
+        self.buyer_segment_label.setStyleSheet("color: #ffc107; font-weight: bold;")
+        buyer_layout.addWidget(self.buyer_segment_label)
         layout.addWidget(buyer_group)
 
         # Customer history
@@ -201,6 +389,10 @@ class SalesPOS(QWidget):
         return_btn.clicked.connect(self.process_return)
         total_layout.addWidget(return_btn)
 
+        receipt_btn = QPushButton("Receipt Printer...")
+        receipt_btn.clicked.connect(lambda: ReceiptPrinterDialog(self.db, self.receipt_cache, self).exec())
+        total_layout.addWidget(receipt_btn)
+
         checkout_btn = QPushButton("Checkout & Print Bill")
         checkout_btn.clicked.connect(self.checkout)
         total_layout.addWidget(checkout_btn)
@@ -235,31 +427,65 @@ class SalesPOS(QWidget):
         barcode = self.barcode_edit.text().strip()
         if not barcode:
             return
-
-        # Find product by barcode
-        for prod_id, name, code, price in self.all_products:
-            if str(code) == barcode:
-                self.add_product_to_cart(prod_id, 1)
-                self.barcode_edit.clear()
-                return
-
-        QMessageBox.warning(self, "Not Found", f"Product with barcode '{barcode}' not found.")
         self.barcode_edit.clear()
+        self.enqueue_scan(barcode, from_scanner=False)
+
+    def enqueue_scan(self, text, from_scanner=True):
+        # A quantity typed into the barcode field ("3*") applies to the next scan
+        prefix = self.barcode_edit.text().strip()
+        if from_scanner and prefix.endswith('*'):
+            text = prefix + text
+            self.barcode_edit.clear()
+        self.scan_queue.append((text, time.perf_counter()))
+        self.drain_scans()
+
+    def drain_scans(self):
+        """Add queued scans to the cart, unless a dialog is open; then retry shortly"""
+        if QApplication.activeModalWidget() is not None:
+            self.scan_timer.start()
+            return
+        self.scan_timer.stop()
+        while self.scan_queue:
+            text, received_at = self.scan_queue.popleft()
+            qty, code = parse_scan(text)
+            prod_id = self.products_by_code.get(code)
+            if prod_id is None:
+                QApplication.beep()
+                self.show_scan_notice(f"Product with barcode '{code}' not found.", error=True)
+                continue
+            name = self.add_product_to_cart(prod_id, qty)
+            if name is None:
+                # Deleted since the barcode map was built
+                QApplication.beep()
+                self.show_scan_notice(f"Product with barcode '{code}' no longer exists.", error=True)
+                continue
+            self.scan_metrics.record(received_at)
+            self.show_scan_notice(f"Added {qty} x {name}")
+        median, p95 = self.scan_metrics.latency_ms()
+        self.scan_stats_label.setText(
+            f"{self.scan_metrics.scans_per_minute()} scans/min | scan-to-row {median:.0f} ms (p95 {p95:.0f} ms)")
+
+    def show_scan_notice(self, message, error=False):
+        color = "#dc3545" if error else "#28a745"
+        self.scan_notice.setStyleSheet(f"color: {color}; font-weight: bold;")
+        self.scan_notice.setText(message)
+        self.scan_notice.setVisible(True)
+        self.notice_timer.start(5000 if error else 2500)
 
     def add_selected_to_cart(self):
         selected_items = self.product_list.selectedItems()
         if not selected_items:
-            QMessageBox.warning(self, "No Selection", "Please select products from the list.")
+            self.show_scan_notice("Please select products from the list.", error=True)
             return
 
         qty = self.qty_spin.value()
         added = 0
         for item in selected_items:
             prod_id = item.data(Qt.ItemDataRole.UserRole)
-            self.add_product_to_cart(prod_id, qty)
-            added += 1
+            if self.add_product_to_cart(prod_id, qty) is not None:
+                added += 1
 
-        QMessageBox.information(self, "Added", f"Added {added} product(s) to cart.")
+        self.show_scan_notice(f"Added {added} product(s) to cart.")
         self.product_list.clearSelection()
 
     def add_to_cart(self):
@@ -273,6 +499,7 @@ class SalesPOS(QWidget):
         self.add_product_to_cart(prod_id, qty)
 
     def add_product_to_cart(self, prod_id, qty):
+        """Add qty of a product to the current cart; returns its name, or None if it no longer exists"""
         conn = self.db.get_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT name, unit_price FROM Products WHERE id = ?", (prod_id,))
@@ -284,40 +511,68 @@ class SalesPOS(QWidget):
 
         name, unit_price = product
 
-        # Update if already in cart
-        for item in self.cart:
+        # Update if already in cart; only the touched row is redrawn
+        for row, item in enumerate(self.cart):
             if item[0] == prod_id:
                 item[2] += qty
                 item[5] = item[2] * item[3] * (1 - item[4] / 100)
+                self.cart_table.setItem(row, 1, create_professional_table_item(item[2], 'numeric'))
+                self.cart_table.setItem(row, 5, create_professional_table_item(item[5], 'numeric'))
                 break
         else:
             total = qty * unit_price
             self.cart.append([prod_id, name, qty, unit_price, 0.0, total])
+            row = len(self.cart) - 1
+            self.cart_table.setRowCount(len(self.cart))
+            self.set_cart_row(row)
 
-        self.update_cart_table()
+        self.cart_table.scrollToItem(self.cart_table.item(row, 0))
         self.update_total()
+        self.journal_cart()
+        return name
 
     def update_cart_table(self):
         self.cart_table.setRowCount(len(self.cart))
-        for row, item in enumerate(self.cart):
-            _, name, qty, price, discount, total = item
-            self.cart_table.setItem(row, 0, create_professional_table_item(name, 'text'))
-            self.cart_table.setItem(row, 1, create_professional_table_item(qty, 'numeric'))
-            self.cart_table.setItem(row, 2, create_professional_table_item(price, 'numeric'))
-
-            discount_spin = QDoubleSpinBox()
-            discount_spin.setRange(0, 100)
-            discount_spin.setValue(discount)
-            discount_spin.setSuffix(" %")
-            discount_spin.setFixedHeight(35)
-            discount_spin.valueChanged.connect(lambda value, r=row: self.update_discount(r, value))
-            self.cart_table.setCellWidget(row, 3, discount_spin)
-
-            self.cart_table.setItem(row, 4, create_professional_table_item(total, 'numeric'))
-
-            remove_btn = QPushButton("Remove")
-            remove_btn.clicked.connect(lambda _, r=row: self.remove_from_cart(r))
-            self.cart_table.setCellWidget(row, 5, remove_btn)
+        for row in range(len(self.cart)):
+            self.set_cart_row(row)
+
+    def set_cart_row(self, row):
+        _, name, qty, price, discount, total = self.cart[row]
+        self.cart_table.setItem(row, 0, create_professional_table_item(name, 'text'))
+        self.cart_table.setItem(row, 1, create_professional_table_item(qty, 'numeric'))
+        self.cart_table.setItem(row, 2, create_professional_table_item(price, 'numeric'))
+
+        discount_spin = QDoubleSpinBox()
+        discount_spin.setRange(0, 100)
+        discount_spin.setValue(discount)
+        discount_spin.setSuffix(" %")
+        discount_spin.setFixedHeight(35)
+        discount_spin.valueChanged.connect(lambda value, r=row: self.update_discount(r, value))
+        self.cart_table.setCellWidget(row, 3, discount_spin)
+
+        saving, promotion = self.line_promos[row] if row < len(self.line_promos) else (0.0, None)
+        self.cart_table.setItem(row, 4, create_professional_table_item(self.promotion_text(saving, promotion), 'text'))
+        self.cart_table.setItem(row, 5, create_professional_table_item(total, 'numeric'))
+
+        remove_btn = QPushButton("Remove")
+        remove_btn.clicked.connect(lambda _, r=row: self.remove_from_cart(r))
+        self.cart_table.setCellWidget(row, 6, remove_btn)
+
+    def promotion_text(self, saving, promotion):
+        return f"-{saving:.2f} ({promotion})" if promotion else ""
+
+    def apply_promotions(self):
+        """Price every line with its best promotion, then the manual discount; redraw only lines that changed"""
+        results = self.promotions.evaluate(self.cart, self.buyer_segment)
+        for row, (item, result) in enumerate(zip(self.cart, results)):
+            saving = result[0]
+            total = round((item[2] * item[3] - saving) * (1 - item[4] / 100), 2)
+            previous = self.line_promos[row] if row < len(self.line_promos) else None
+            if result != previous or total != item[5]:
+                item[5] = total
+                self.cart_table.setItem(row, 4, create_professional_table_item(self.promotion_text(*result), 'text'))
+                self.cart_table.setItem(row, 5, create_professional_table_item(total, 'numeric'))
+        self.line_promos = list(results)
 
     def update_discount(self, row, value):
         if 0 <= row < len(self.cart):
@@ -325,14 +580,17 @@ class SalesPOS(QWidget):
             self.cart[row][5] = self.cart[row][2] * self.cart[row][3] * (1 - value / 100)
             self.update_cart_table()
             self.update_total()
+            self.journal_cart()
 
     def remove_from_cart(self, row):
         if 0 <= row < len(self.cart):
             del self.cart[row]
             self.update_cart_table()
             self.update_total()
+            self.journal_cart()
 
     def update_total(self):
+        self.apply_promotions()
         total = sum(item[5] for item in self.cart)
         self.total_label.setText(f"Total: Rs. {total:.2f}")
 
@@ -374,13 +632,23 @@ class SalesPOS(QWidget):
         cursor = conn.cursor()
 
         # Check if customer exists, else create
-        cursor.execute("SELECT id FROM Customers WHERE name = ?", (buyer_name,))
-        customer = cursor.fetchone()
-        if customer:
-            customer_id = customer[0]
-        else:
-            cursor.execute("INSERT INTO Customers (name, phone) VALUES (?, ?)", (buyer_name, buyer_contact))
-            customer_id = cursor.lastrowid
+        customer_id = self.customers.find(cursor, buyer_name)
+        if not customer_id:
+            match = self.customers.best_match(buyer_name, buyer_contact)
+            reply = QMessageBox.StandardButton.No
+            if match:
+                reply = QMessageBox.question(
+                    self, "Existing Customer?",
+                    f"'{buyer_name}' is not a customer yet. Is this {match.name}"
+                    f"{f' ({match.phone})' if match.phone else ''}?\n\nYes uses that customer, No adds a new one.",
+                    QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No | QMessageBox.StandardButton.Cancel)
+                if reply == QMessageBox.StandardButton.Cancel:
+                    conn.close()
+                    return
+            if reply == QMessageBox.StandardButton.Yes:
+                customer_id = match.id
+            else:
+                customer_id = self.customers.create(cursor, buyer_name, buyer_contact)
 
         total = sum(item[5] for item in self.cart)
 
@@ -388,6 +656,7 @@ class SalesPOS(QWidget):
         payment_dialog = PaymentDialog(total, self)
         result = payment_dialog.exec()
         if result != 1:  # QDialog.Accepted is 1
+            conn.close()
             return
 
         amount_received = payment_dialog.get_amount_received()
@@ -406,28 +675,19 @@ class SalesPOS(QWidget):
             )
             sale_id = cursor.lastrowid
 
+            short = []  # (name, quantity) sold beyond what the product's batches hold
             for item in self.cart:
                 prod_id, name, qty, price, discount, item_total = item
-                cursor.execute(
-                    "INSERT INTO SalesItems (sale_id, product_id, quantity, unit_price, total_price, discount_percent) VALUES (?, ?, ?, ?, ?, ?)",
-                    (sale_id, prod_id, qty, price, item_total, discount)
-                )
 
-                # Reduce stock
+                # Reduce stock, split across batches earliest expiry first; the line keeps the first batch
+                batch_id, shortfall = take_from_batches(cursor, prod_id, qty, 'sale', sale_id)
+                if shortfall:
+                    short.append((name, shortfall))
+
                 cursor.execute(
-                    "SELECT id, quantity FROM ProductBatches WHERE product_id = ? AND quantity > 0 ORDER BY expiry_month, expiry_year LIMIT 1",
-                    (prod_id,)
+                    "INSERT INTO SalesItems (sale_id, product_id, batch_id, quantity, unit_price, total_price, discount_percent) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (sale_id, prod_id, batch_id, qty, price, item_total, discount)
                 )
-                batch = cursor.fetchone()
-                if batch:
-                    batch_id, batch_qty = batch
-                    new_qty = batch_qty - qty
-                    if new_qty >= 0:
-                        cursor.execute("UPDATE ProductBatches SET quantity = ? WHERE id = ?", (new_qty, batch_id))
-                        cursor.execute(
-                            "INSERT INTO StockLedger (product_id, batch_id, movement_type, quantity, reason, reference_id) VALUES (?, ?, 'out', ?, 'sale', ?)",
-                            (prod_id, batch_id, qty, sale_id)
-                        )
 
             # Update General Ledger
             current_date = datetime.datetime.now().strftime('%Y-%m-%d')
@@ -451,28 +711,65 @@ class SalesPOS(QWidget):
                 (customer_id, current_date, description, total, amount_received, new_cust_balance)
             )
 
+            # The sold cart leaves the journal in the same transaction, so a crash can't restore it
+            self.journal.settle(cursor, self.current_cart['id'])
             conn.commit()
-            QMessageBox.information(self, "Success", "Sale completed successfully.")
-            self.generate_bill(sale_id, self.cart, total, buyer_name, buyer_contact, amount_received, change, balance_due)
-            self.cart.clear()
-            self.update_cart_table()
-            self.update_total()
 
         except Exception as e:
             conn.rollback()
             QMessageBox.critical(self, "Error", f"Failed to complete sale: {str(e)}")
+            return
         finally:
             conn.close()
 
-    def generate_bill(self, sale_id, items, total, buyer_name, buyer_contact, amount_received, change, balance_due):
-        # Create customer folder and subfolders
-        customer_folder = f"customers/{buyer_name.replace(' ', '_').replace('/', '_')}"
-        sales_folder = os.path.join(customer_folder, "sales")
-        ledger_folder = os.path.join(customer_folder, "ledger")
-        os.makedirs(sales_folder, exist_ok=True)
-        os.makedirs(ledger_folder, exist_ok=True)
+        # The sale is committed from here on; a receipt or bill failure must not report it as failed
+        items = [list(item) for item in self.cart]
+        self.close_current_cart()
+        self.refresh_segments()
+        if short:
+            show_warning_notification(
+                "Batches",
+                "Sold beyond batch stock, check Stock Audit: " + ", ".join(f"{name} ({qty})" for name, qty in short)
+            )
+        receipt_settings = self.receipt_settings.load()
+        self.print_receipt(receipt_settings, sale_id, items, total, buyer_name, amount_received, change, balance_due)
+        QMessageBox.information(self, "Success", "Sale completed successfully.")
+        try:
+            self.generate_bill(sale_id, items, total, buyer_name, buyer_contact, amount_received, change, balance_due,
+                               open_pdf=receipt_settings['output'] == 'none' or receipt_settings['open_pdf'])
+        except Exception as e:
+            show_error_notification("Bill", f"Sale #{sale_id} was saved but its bill failed: {str(e)}")
 
-        filename = f"{sales_folder}/bill_{sale_id}.pdf"
+    def print_receipt(self, settings, sale_id, items, total, buyer_name, amount_received, change, balance_due):
+        """Send the thermal receipt straight after the sale commits; the PDF invoice follows"""
+        if settings['output'] == 'none':
+            return
+        sale = {'sale_id': sale_id, 'date': datetime.datetime.now().strftime('%Y-%m-%d %H:%M'),
+                'buyer_name': buyer_name, 'items': items, 'total': total,
+                'amount_received': amount_received, 'change': change, 'balance_due': balance_due}
+        try:
+            data = sale_receipt(settings, sale, self.receipt_cache)
+        except Exception as e:
+            show_error_notification("Receipt", f"Failed to format receipt: {str(e)}")
+            return
+        thread = ReceiptPrintThread(settings['output'], settings['target'], data)
+        thread.finished.connect(lambda success, message: self.on_receipt_printed(thread, success, message))
+        self.receipt_threads.append(thread)
+        thread.start()
+
+    def on_receipt_printed(self, thread, success, message):
+        self.receipt_threads.remove(thread)
+        if not success:
+            show_error_notification("Receipt", message)
+
+    def generate_bill(self, sale_id, items, total, buyer_name, buyer_contact, amount_received, change, balance_due, open_pdf=True):
+        stored = self.documents.prepare('bill', sale_id, [items, total, buyer_name, buyer_contact,
+                                                          amount_received, change, balance_due])
+        filename = stored.path
+        if stored.cached:
+            if open_pdf:
+                QDesktopServices.openUrl(QUrl.fromLocalFile(filename))
+            return
 
         # Load Urdu font
         font_id = QFontDatabase.addApplicationFont("fonts/NotoNastaliqUrdu-VariableFont_wght.ttf")
@@ -535,7 +832,9 @@ class SalesPOS(QWidget):
         printer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
 
         document.print(printer)
-        QDesktopServices.openUrl(QUrl.fromLocalFile(filename))
+        self.documents.register(stored)
+        if open_pdf:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(filename))
 
 
     def process_return(self):
@@ -610,6 +909,7 @@ class ReturnDialog(QDialog):
     def __init__(self, db, parent=None):
         super().__init__(parent)
         self.db = db
+        self.documents = DocumentStore(db)
         self.return_items = []
         self.selected_sale = None
         self.init_ui()
@@ -732,6 +1032,8 @@ class ReturnDialog(QDialog):
         self.return_items = []
         for r, item in enumerate(items):
             name, qty, price, total, item_id = item
+            # Refund what was actually charged: total_price is after any promotion, unit_price is the list price
+            price = total / qty if qty else price
             self.return_table.setItem(r, 0, create_professional_table_item(name, 'text'))
             self.return_table.setItem(r, 1, create_professional_table_item(qty, 'numeric'))
             self.return_table.setItem(r, 2, create_professional_table_item(0, 'numeric'))  # Return qty
@@ -744,6 +1046,7 @@ class ReturnDialog(QDialog):
                 'sold_qty': qty,
                 'return_qty': 0,
                 'unit_price': price,
+                'line_total': total,
                 'total': 0.0
             })
 
@@ -757,7 +1060,11 @@ class ReturnDialog(QDialog):
     def update_return_qty(self, row, qty):
         if row < len(self.return_items):
             self.return_items[row]['return_qty'] = qty
-            self.return_items[row]['total'] = qty * self.return_items[row]['unit_price']
+            item = self.return_items[row]
+            if qty == item['sold_qty']:
+                item['total'] = item['line_total']  # A whole line refunds exactly what it cost
+            else:
+                item['total'] = round(qty * item['unit_price'], 2)
             self.return_table.item(row, 4).setText(f"{self.return_items[row]['total']:.2f}")
 
             # Update total
@@ -812,11 +1119,11 @@ class ReturnDialog(QDialog):
                 """, (return_id, item['return_qty'], item['unit_price'], item['item_id']))
 
                 # Add back to inventory
-                cur.execute("""
-                    UPDATE ProductBatches
-                    SET quantity = quantity + ?
-                    WHERE id = (SELECT batch_id FROM SalesItems WHERE id = ?)
-                """, (item['return_qty'], item['item_id']))
+                cur.execute("SELECT product_id, batch_id FROM SalesItems WHERE id = ?", (item['item_id'],))
+                product_id, batch_id = cur.fetchone()
+                if batch_id:
+                    cur.execute("UPDATE ProductBatches SET quantity = quantity + ? WHERE id = ?", (item['return_qty'], batch_id))
+                record_stock_movement(cur, product_id, item['return_qty'], 'return', return_id, batch_id)
 
             # Update customer ledger (credit for return)
             cur.execute("SELECT customer_id FROM SalesTransactions WHERE id = ?", (self.selected_sale,))
@@ -855,14 +1162,12 @@ class ReturnDialog(QDialog):
         """, (return_id,))
         customer_name = cur.fetchone()
         conn.close()
-        if customer_name:
-            customer_name = customer_name[0]
-            customer_folder = f"customers/{customer_name.replace(' ', '_').replace('/', '_')}"
-            refunds_folder = os.path.join(customer_folder, "refunds")
-            os.makedirs(refunds_folder, exist_ok=True)
-            filename = f"{refunds_folder}/return_receipt_{return_id}.pdf"
-        else:
-            filename = f"return_receipt_{return_id}.pdf"
+        customer_name = customer_name[0] if customer_name else None
+        stored = self.documents.prepare('return_receipt', return_id, [items, total, reason, customer_name])
+        filename = stored.path
+        if stored.cached:
+            QDesktopServices.openUrl(QUrl.fromLocalFile(filename))
+            return
 
         # Load Urdu font
         font_id = QFontDatabase.addApplicationFont("fonts/NotoNastaliqUrdu-VariableFont_wght.ttf")
@@ -1053,4 +1358,5 @@ class ReturnDialog(QDialog):
         printer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
 
         document.print(printer)
+        self.documents.register(stored)
         QDesktopServices.openUrl(QUrl.fromLocalFile(filename))
@@ -0,0 +1,136 @@
+"""
+Scanner Input for Eagle Traders
+Recognises keyboard-wedge barcode scanner bursts by inter-key timing, whichever widget has focus
+"""
+
+import collections
+import re
+import time
+
+from PyQt6.QtCore import QObject, QEvent, QTimer, Qt, pyqtSignal
+from PyQt6.QtGui import QKeyEvent
+from PyQt6.QtWidgets import QApplication, QWidget
+
+# A scanner types a whole code with a few ms between keys; people rarely manage 40 ms between four in a row
+SCAN_KEY_INTERVAL_MS = 40
+MIN_SCAN_LENGTH = 4
+QUANTITY_PREFIX = re.compile(r'^\s*(\d{1,4})\s*\*\s*(.*)$')
+
+
+def parse_scan(text):
+    """(quantity, code) for a scan or typed entry; '3*<code>' means three of the product"""
+    match = QUANTITY_PREFIX.match(text)
+    if match:
+        return max(int(match.group(1)), 1), match.group(2).strip()
+    return 1, text.strip()
+
+
+class ScannerWedge(QObject):
+    """Application-wide key filter that turns scanner bursts into `scanned` signals.
+
+    Printable keys are held back for up to SCAN_KEY_INTERVAL_MS. If the next key arrives
+    within that time the burst keeps growing; once it ends (on Enter/Tab or a pause) with at
+    least MIN_SCAN_LENGTH keys, it is emitted as one scan and the keys never reach the focused
+    widget. Anything shorter was typed by a person and is replayed to the widget it was meant
+    for, so normal typing is only delayed by the interval.
+    """
+    scanned = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.buffer = []  # (target widget, key, modifiers, text)
+        self.last_key_ms = None
+        self.replaying = False
+        self.installed = False
+        self.burst_timer = QTimer(self)
+        self.burst_timer.setSingleShot(True)
+        self.burst_timer.setInterval(SCAN_KEY_INTERVAL_MS)
+        self.burst_timer.timeout.connect(self.end_burst)
+
+    def install(self):
+        if not self.installed:
+            QApplication.instance().installEventFilter(self)
+            self.installed = True
+
+    def uninstall(self):
+        if self.installed:
+            QApplication.instance().removeEventFilter(self)
+            self.installed = False
+            self.end_burst()
+
+    def eventFilter(self, obj, event):
+        if self.replaying or event.type() != QEvent.Type.KeyPress or not isinstance(obj, QWidget):
+            return False
+        # Only the first delivery of a key; ignored keys propagate to parents and come through again
+        if obj is not (QApplication.focusWidget() or obj.window()):
+            return False
+
+        key = event.key()
+        text = event.text()
+        # Event timestamps come from the window system, so keys queued behind a busy GUI keep their real spacing
+        now = event.timestamp() or int(time.monotonic() * 1000)
+        in_burst = self.buffer and now - self.last_key_ms <= SCAN_KEY_INTERVAL_MS
+
+        if key in (Qt.Key.Key_Return, Qt.Key.Key_Enter, Qt.Key.Key_Tab) and in_burst:
+            if self.end_burst():
+                return True
+            return False
+
+        plain = not (event.modifiers() & (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.AltModifier))
+        if text and text.isprintable() and plain:
+            if self.buffer and not in_burst:
+                self.end_burst()
+            self.buffer.append((obj, key, event.modifiers(), text))
+            self.last_key_ms = now
+            self.burst_timer.start()
+            return True
+
+        # Any other key ends whatever was being held back, in order
+        self.end_burst()
+        return False
+
+    def end_burst(self):
+        """Emit the held keys as a scan, or replay them if they were typed; return True for a scan"""
+        self.burst_timer.stop()
+        buffer, self.buffer = self.buffer, []
+        if len(buffer) >= MIN_SCAN_LENGTH:
+            self.scanned.emit("".join(text for _, _, _, text in buffer))
+            return True
+        self.replaying = True
+        try:
+            for target, key, modifiers, text in buffer:
+                QApplication.sendEvent(target, QKeyEvent(QEvent.Type.KeyPress, key, modifiers, text))
+                QApplication.sendEvent(target, QKeyEvent(QEvent.Type.KeyRelease, key, modifiers, text))
+        except RuntimeError:
+            pass  # Target widget was deleted while its keys were held
+        finally:
+            self.replaying = False
+        return False
+
+
+class ScanMetrics:
+    """Scans per minute over the last minute and scan-to-cart-row latency"""
+    WINDOW_SECONDS = 60
+
+    def __init__(self, history=500):
+        self.scan_times = collections.deque()
+        self.latencies = collections.deque(maxlen=history)
+
+    def record(self, received_at):
+        """Record a scan that reached the cart; received_at is its time.perf_counter() on arrival"""
+        now = time.perf_counter()
+        self.scan_times.append(now)
+        self.latencies.append((now - received_at) * 1000)
+
+    def scans_per_minute(self):
+        cutoff = time.perf_counter() - self.WINDOW_SECONDS
+        while self.scan_times and self.scan_times[0] < cutoff:
+            self.scan_times.popleft()
+        return len(self.scan_times)
+
+    def latency_ms(self):
+        """(median, 95th percentile) scan-to-row latency in ms"""
+        if not self.latencies:
+            return 0.0, 0.0
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2], ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
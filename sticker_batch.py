@@ -0,0 +1,407 @@
+"""
+Sticker Batch for Eagle Traders
+Many stickers in one print job or PDF, laid out on A4 sheets or a continuous roll
+"""
+
+import numpy as np
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QLineEdit, QCompleter,
+    QTableWidget, QSpinBox, QMessageBox, QFileDialog, QInputDialog, QProgressBar
+)
+from PyQt6.QtGui import QImage, QPainter, QPageSize, QPageLayout
+from PyQt6.QtCore import Qt, QThread, QRect, QSizeF, QMarginsF, QStringListModel, pyqtSignal
+from PyQt6.QtPrintSupport import QPrinter, QPrintDialog
+from barcode_symbology import BarcodeCache, paint_sticker
+from notification_manager import show_success_notification, show_error_notification, show_warning_notification
+from ui_factory import setup_professional_table, create_professional_table_item
+
+# Sticker sizes (BarcodeConfigurations width/height and the sticker spin boxes) are preview pixels at 96 dpi
+SCREEN_DPI = 96
+A4_MM = (210, 297)
+SHEET_MARGIN_MM = 8
+GAP_MM = 2
+# Pages are rendered at no more than this, then drawn onto the printer at whole-number scale where possible
+MAX_RENDER_DPI = 300
+
+
+class StickerLayout:
+    """Positions of stickers on A4 sheets (a grid within the margins) or a roll (one sticker per page)"""
+
+    def __init__(self, width, height, dpi, roll=False):
+        self.dpi = dpi
+        self.roll = roll
+        self.sticker_width = round(width * dpi / SCREEN_DPI)
+        self.sticker_height = round(height * dpi / SCREEN_DPI)
+        if roll:
+            self.page_mm = (width * 25.4 / SCREEN_DPI, height * 25.4 / SCREEN_DPI)
+            self.columns = self.rows = 1
+            self.margin = self.gap = 0
+        else:
+            self.page_mm = A4_MM
+            self.margin = self.mm(SHEET_MARGIN_MM)
+            self.gap = self.mm(GAP_MM)
+            usable_width = self.mm(A4_MM[0]) - 2 * self.margin + self.gap
+            usable_height = self.mm(A4_MM[1]) - 2 * self.margin + self.gap
+            self.columns = usable_width // (self.sticker_width + self.gap)
+            self.rows = usable_height // (self.sticker_height + self.gap)
+            if not self.columns or not self.rows:
+                raise ValueError("Sticker is larger than an A4 sheet")
+        self.per_page = self.columns * self.rows
+        self.page_width = self.mm(self.page_mm[0]) if not roll else self.sticker_width
+        self.page_height = self.mm(self.page_mm[1]) if not roll else self.sticker_height
+
+    def mm(self, millimetres):
+        return round(millimetres * self.dpi / 25.4)
+
+    def sticker_rect(self, slot):
+        """Device-pixel rect of the slot-th sticker on its page"""
+        row, column = divmod(slot, self.columns)
+        return QRect(self.margin + column * (self.sticker_width + self.gap),
+                     self.margin + row * (self.sticker_height + self.gap),
+                     self.sticker_width, self.sticker_height)
+
+    def pages(self, count):
+        return -(-count // self.per_page)
+
+
+def to_monochrome(image):
+    """1-bit copy of a Grayscale8 page; printers and the PDF writer take it ~20x faster and smaller than greyscale"""
+    width, height = image.width(), image.height()
+    pixels = np.frombuffer(image.constBits().asarray(image.sizeInBytes()), dtype=np.uint8)
+    pixels = pixels.reshape(height, image.bytesPerLine())[:, :width]
+    bits = np.packbits(pixels >= 128, axis=1)
+    mono = QImage(bits.tobytes(), width, height, bits.shape[1], QImage.Format.Format_Mono)
+    mono.setColorTable([0xff000000, 0xffffffff])
+    return mono.copy()
+
+
+def sticker_sequence(items):
+    """Expand (title, data, caption, quantity) items into one entry per sticker"""
+    for title, data, caption, quantity in items:
+        for _ in range(quantity):
+            yield title, data, caption
+
+
+class StickerBatchThread(QThread):
+    """Renders sticker pages to 1-bit images one at a time; the GUI thread sends each to the printer as it arrives"""
+    page_ready = pyqtSignal(int, QImage)
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, items, layout):
+        super().__init__()
+        self.items = items
+        self.layout = layout
+        self.cache = BarcodeCache()
+        self.unscannable = set()
+
+    def run(self):
+        try:
+            stickers = list(sticker_sequence(self.items))
+            layout = self.layout
+            for page in range(layout.pages(len(stickers))):
+                image = QImage(layout.page_width, layout.page_height, QImage.Format.Format_Grayscale8)
+                image.fill(Qt.GlobalColor.white)
+                painter = QPainter(image)
+                for slot, (title, data, caption) in enumerate(stickers[page * layout.per_page:(page + 1) * layout.per_page]):
+                    if paint_sticker(painter, layout.sticker_rect(slot), title, data, caption, cache=self.cache) < 1:
+                        self.unscannable.add(data)
+                painter.end()
+                self.page_ready.emit(page, to_monochrome(image))
+            self.finished.emit(True, f"{len(stickers)} stickers on {layout.pages(len(stickers))} pages")
+        except Exception as e:
+            self.finished.emit(False, f"Failed to render stickers: {str(e)}")
+
+
+class StickerBatchDialog(QDialog):
+    """Pick products or a received delivery with quantities, then print all stickers as one job or PDF"""
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.batch_thread = None
+        self.printer = None
+        self.painter = None
+        self.setWindowTitle("Batch Sticker Printing")
+        self.resize(850, 600)
+
+        layout = QVBoxLayout(self)
+
+        add_layout = QHBoxLayout()
+        add_layout.addWidget(QLabel("Add Product:"))
+        self.product_edit = QLineEdit()
+        self.product_edit.setPlaceholderText("Type a product name and press Enter")
+        self.product_model = QStringListModel()
+        completer = QCompleter(self.product_model, self)
+        completer.setCaseSensitivity(Qt.CaseSensitivity.CaseInsensitive)
+        completer.setFilterMode(Qt.MatchFlag.MatchContains)
+        self.product_edit.setCompleter(completer)
+        self.product_edit.textEdited.connect(self.suggest_products)
+        self.product_edit.returnPressed.connect(self.add_typed_product)
+        add_layout.addWidget(self.product_edit)
+        delivery_btn = QPushButton("Add Received Delivery")
+        delivery_btn.clicked.connect(self.add_delivery)
+        add_layout.addWidget(delivery_btn)
+        layout.addLayout(add_layout)
+
+        self.table = QTableWidget()
+        setup_professional_table(self.table, ["Product", "Code", "Expiry", "Quantity", "Remove"],
+                                 ['text', 'text', 'text', 'numeric', 'action'])
+        layout.addWidget(self.table)
+
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(QLabel("Sticker Size:"))
+        self.size_combo = QComboBox()
+        self.size_combo.addItem("Default (300 x 150)", (300, 150))
+        conn = self.db.get_connection()
+        for name, width, height in conn.execute(
+                "SELECT name, width, height FROM BarcodeConfigurations WHERE width > 0 AND height > 0 ORDER BY name"):
+            self.size_combo.addItem(f"{name} ({width} x {height})", (width, height))
+        conn.close()
+        options_layout.addWidget(self.size_combo)
+        options_layout.addWidget(QLabel("Layout:"))
+        self.layout_combo = QComboBox()
+        self.layout_combo.addItems(["A4 Sheets", "Continuous Roll"])
+        self.layout_combo.currentIndexChanged.connect(self.update_summary)
+        self.size_combo.currentIndexChanged.connect(self.update_summary)
+        options_layout.addWidget(self.layout_combo)
+        options_layout.addStretch()
+        layout.addLayout(options_layout)
+
+        self.summary_label = QLabel("")
+        layout.addWidget(self.summary_label)
+        self.progress = QProgressBar()
+        self.progress.setVisible(False)
+        layout.addWidget(self.progress)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        self.print_btn = QPushButton("Print...")
+        self.print_btn.clicked.connect(lambda: self.start_job(pdf=False))
+        btn_layout.addWidget(self.print_btn)
+        self.pdf_btn = QPushButton("Save PDF...")
+        self.pdf_btn.clicked.connect(lambda: self.start_job(pdf=True))
+        btn_layout.addWidget(self.pdf_btn)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+        self.update_summary()
+
+    def suggest_products(self, text):
+        if len(text.strip()) < 2:
+            return
+        conn = self.db.get_connection()
+        rows = conn.execute("SELECT name FROM Products WHERE name LIKE ? ORDER BY name LIMIT 20",
+                            (f"%{text.strip()}%",)).fetchall()
+        conn.close()
+        self.product_model.setStringList([row[0] for row in rows])
+
+    def add_typed_product(self):
+        name = self.product_edit.text().strip()
+        if not name:
+            return
+        conn = self.db.get_connection()
+        row = conn.execute("SELECT id, name, barcode FROM Products WHERE name = ?", (name,)).fetchone()
+        conn.close()
+        if not row:
+            QMessageBox.warning(self, "Error", f"Product '{name}' not found.")
+            return
+        self.add_row(*row, expiry="", quantity=1)
+        self.product_edit.clear()
+
+    def add_delivery(self):
+        """Add every batch received on one purchase date, one sticker per unit received"""
+        conn = self.db.get_connection()
+        dates = [row[0] for row in conn.execute(
+            "SELECT DISTINCT purchase_date FROM ProductBatches WHERE purchase_date IS NOT NULL "
+            "ORDER BY purchase_date DESC LIMIT 60")]
+        if not dates:
+            conn.close()
+            QMessageBox.warning(self, "Error", "No received batches found.")
+            return
+        date, ok = QInputDialog.getItem(self, "Add Received Delivery", "Received on:", dates, 0, False)
+        if not ok:
+            conn.close()
+            return
+        batches = conn.execute("""
+            SELECT p.id, p.name, p.barcode, pb.expiry_month, pb.expiry_year, pb.quantity
+            FROM ProductBatches pb JOIN Products p ON p.id = pb.product_id
+            WHERE pb.purchase_date = ? AND pb.quantity > 0
+            ORDER BY p.name
+        """, (date,)).fetchall()
+        conn.close()
+        self.add_rows([(product_id, name, barcode, f"{month:02d}/{year}" if month and year else "", quantity)
+                       for product_id, name, barcode, month, year, quantity in batches])
+
+    def add_row(self, product_id, name, barcode, expiry, quantity):
+        self.add_rows([(product_id, name, barcode, expiry, quantity)])
+
+    def add_rows(self, rows):
+        """Append (product_id, name, barcode, expiry, quantity) job lines"""
+        self.table.setUpdatesEnabled(False)
+        for product_id, name, barcode, expiry, quantity in rows:
+            self.insert_row(product_id, name, barcode, expiry, quantity)
+        self.table.setUpdatesEnabled(True)
+        self.update_summary()
+
+    def insert_row(self, product_id, name, barcode, expiry, quantity):
+        # Same fallback code as a single sticker from the Generate tab
+        code = barcode or f"{name}-{product_id:06d}"
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        self.table.setItem(row, 0, create_professional_table_item(name, 'text'))
+        self.table.setItem(row, 1, create_professional_table_item(code, 'text'))
+        self.table.setItem(row, 2, create_professional_table_item(expiry, 'text'))
+        spin = QSpinBox()
+        spin.setRange(0, 10000)
+        spin.setValue(quantity)
+        spin.valueChanged.connect(self.update_summary)
+        self.table.setCellWidget(row, 3, spin)
+        remove_btn = QPushButton("Remove")
+        remove_btn.clicked.connect(lambda: self.remove_row(self.table.indexAt(remove_btn.pos()).row()))
+        self.table.setCellWidget(row, 4, remove_btn)
+
+    def remove_row(self, row):
+        if row >= 0:
+            self.table.removeRow(row)
+            self.update_summary()
+
+    def items(self):
+        """(title, data, caption, quantity) per job line"""
+        items = []
+        for row in range(self.table.rowCount()):
+            name = self.table.item(row, 0).text()
+            code = self.table.item(row, 1).text()
+            expiry = self.table.item(row, 2).text()
+            quantity = self.table.cellWidget(row, 3).value()
+            if quantity:
+                title = f"{name} | Expiry: {expiry}" if expiry else name
+                items.append((title, code, f"Code: {code}", quantity))
+        return items
+
+    def make_layout(self, dpi):
+        width, height = self.size_combo.currentData()
+        return StickerLayout(width, height, dpi, roll=self.layout_combo.currentIndex() == 1)
+
+    def update_summary(self):
+        count = sum(item[3] for item in self.items())
+        try:
+            layout = self.make_layout(MAX_RENDER_DPI)
+        except ValueError as e:
+            self.summary_label.setText(str(e))
+            return
+        per_page = "one per label" if layout.roll else f"{layout.per_page} per A4 sheet"
+        self.summary_label.setText(f"{count} stickers, {per_page}, {layout.pages(count)} pages")
+
+    def start_job(self, pdf):
+        if self.batch_thread and self.batch_thread.isRunning():
+            return
+        items = self.items()
+        if not items:
+            QMessageBox.warning(self, "Error", "Add products with a quantity to print.")
+            return
+
+        printer = QPrinter(QPrinter.PrinterMode.HighResolution)
+        if pdf:
+            file_path, _ = QFileDialog.getSaveFileName(self, "Save Stickers", "stickers.pdf", "PDF Files (*.pdf)")
+            if not file_path:
+                return
+            printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
+            printer.setOutputFileName(file_path)
+            printer.setResolution(MAX_RENDER_DPI)
+        try:
+            layout = self.make_layout(MAX_RENDER_DPI)
+        except ValueError as e:
+            QMessageBox.warning(self, "Error", str(e))
+            return
+        printer.setFullPage(True)
+        printer.setPageLayout(QPageLayout(QPageSize(QSizeF(*layout.page_mm), QPageSize.Unit.Millimeter),
+                                          QPageLayout.Orientation.Portrait, QMarginsF(0, 0, 0, 0)))
+        if not pdf and QPrintDialog(printer, self).exec() != QPrintDialog.DialogCode.Accepted:
+            return
+        # Render at the printer's resolution when it is lower (e.g. a 203 dpi thermal printer)
+        dpi = min(printer.resolution(), MAX_RENDER_DPI)
+        if dpi != MAX_RENDER_DPI:
+            layout = self.make_layout(dpi)
+
+        self.printer = printer
+        self.painter = QPainter(printer)
+        self.print_btn.setEnabled(False)
+        self.pdf_btn.setEnabled(False)
+        self.progress.setRange(0, layout.pages(sum(item[3] for item in items)))
+        self.progress.setValue(0)
+        self.progress.setVisible(True)
+        self.batch_thread = StickerBatchThread(items, layout)
+        self.batch_thread.page_ready.connect(self.on_page_ready)
+        self.batch_thread.finished.connect(self.on_job_finished)
+        self.batch_thread.start()
+
+    def on_page_ready(self, page, image):
+        if page:
+            self.printer.newPage()
+        scale = self.printer.resolution() / self.batch_thread.layout.dpi
+        self.painter.drawImage(QRect(0, 0, round(image.width() * scale), round(image.height() * scale)), image)
+        self.progress.setValue(page + 1)
+
+    def on_job_finished(self, success, message):
+        self.painter.end()
+        self.painter = None
+        self.print_btn.setEnabled(True)
+        self.pdf_btn.setEnabled(True)
+        self.progress.setVisible(False)
+        if not success:
+            show_error_notification("Batch Stickers", message)
+            return
+        cache = self.batch_thread.cache
+        show_success_notification("Batch Stickers", f"{message} sent as one job ({cache.hits} repeated barcodes reused)")
+        if self.batch_thread.unscannable:
+            QMessageBox.warning(self, "Error", "These codes are too long for the sticker width and may not scan:\n"
+                                + "\n".join(sorted(self.batch_thread.unscannable)[:10]))
+
+    def reject(self):
+        # The open print job is finished by on_job_finished; closing mid-job would leave it half sent
+        if self.batch_thread and self.batch_thread.isRunning():
+            show_warning_notification("Batch Stickers", "Wait for the current job to finish")
+            return
+        super().reject()
+
+
+if __name__ == '__main__':
+    # Benchmark: python sticker_batch.py -- a 400-SKU delivery, 3 stickers each, to one PDF
+    import os
+    import sys
+    import tempfile
+    import time
+    from PyQt6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    items = [(f"Product {i} | Expiry: 06/2027", f"PRD-{i:06d}", f"Code: PRD-{i:06d}", 3) for i in range(400)]
+    for roll in (False, True):
+        layout = StickerLayout(300, 150, MAX_RENDER_DPI, roll=roll)
+        printer = QPrinter(QPrinter.PrinterMode.HighResolution)
+        printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
+        printer.setOutputFileName(os.path.join(tempfile.mkdtemp(), 'stickers.pdf'))
+        printer.setResolution(MAX_RENDER_DPI)
+        printer.setFullPage(True)
+        printer.setPageLayout(QPageLayout(QPageSize(QSizeF(*layout.page_mm), QPageSize.Unit.Millimeter),
+                                          QPageLayout.Orientation.Portrait, QMarginsF(0, 0, 0, 0)))
+        painter = QPainter(printer)
+        thread = StickerBatchThread(items, layout)
+
+        def on_page(page, image):
+            if page:
+                printer.newPage()
+            painter.drawImage(0, 0, image)
+
+        thread.page_ready.connect(on_page)
+        started = time.perf_counter()
+        thread.start()
+        while thread.isRunning():
+            app.processEvents()
+        app.processEvents()
+        painter.end()
+        elapsed = time.perf_counter() - started
+        print(f"{'Roll' if roll else 'A4'}: 1200 stickers on {layout.pages(1200)} pages in {elapsed:.2f}s "
+              f"({1200 / elapsed:,.0f}/s), barcode cache {thread.cache.hits} hits / {thread.cache.misses} misses, "
+              f"PDF {os.path.getsize(printer.outputFileName()) / 1e6:.1f} MB")
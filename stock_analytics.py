@@ -0,0 +1,315 @@
+"""
+Stock Analytics for Eagle Traders
+ABC classes, turnover, days of cover and dead stock for the whole catalogue
+"""
+
+import datetime
+
+import numpy as np
+from PyQt6.QtWidgets import (
+    QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QComboBox, QTableView, QHeaderView
+)
+from PyQt6.QtCore import Qt, QThread, pyqtSignal, QAbstractTableModel, QModelIndex
+from PyQt6.QtGui import QColor
+from demand_forecast import JULIAN_DAY_OFFSET
+from ui_factory import UITheme
+
+
+class StockAnalytics:
+    """Per-product analytics computed as NumPy columns.
+
+    ABC: products sorted by revenue over the window; A covers the first 80% of revenue,
+    B the next 15%, C the rest. Turnover is units sold over the window divided by stock
+    on hand, days of cover is stock on hand divided by average daily sales, and dead
+    stock is stock that has not sold for DEAD_STOCK_DAYS.
+    """
+    DEAD_STOCK_DAYS = 180
+    A_SHARE = 0.80
+    B_SHARE = 0.95
+
+    def __init__(self, db):
+        self.db = db
+
+    def compute(self, window_days=365, today=None):
+        """Return a dict of equal-length columns, one entry per product"""
+        today = today or datetime.date.today()
+        today_day = today.toordinal() + JULIAN_DAY_OFFSET
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        # One pass over the daily sales rollup, joined to stock and batch cost per product
+        cursor.execute("""
+            SELECT p.id, p.name, COALESCE(c.name, ''), COALESCE(sl.quantity, 0),
+                   COALESCE(b.avg_cost, p.unit_price, 0),
+                   COALESCE(s.units, 0), COALESCE(s.revenue, 0), COALESCE(s.last_day, 0)
+            FROM Products p
+            LEFT JOIN Categories c ON c.id = p.category_id
+            LEFT JOIN StockLevels sl ON sl.product_id = p.id
+            LEFT JOIN (
+                SELECT product_id, SUM(quantity * cost_price) / NULLIF(SUM(quantity), 0) AS avg_cost
+                FROM ProductBatches GROUP BY product_id
+            ) b ON b.product_id = p.id
+            LEFT JOIN (
+                SELECT product_id,
+                       SUM(CASE WHEN day >= :since THEN quantity ELSE 0 END) AS units,
+                       SUM(CASE WHEN day >= :since THEN revenue ELSE 0 END) AS revenue,
+                       MAX(day) AS last_day
+                FROM ProductDailySales
+                WHERE quantity > 0
+                GROUP BY product_id
+            ) s ON s.product_id = p.id
+            ORDER BY p.id
+        """, {'since': today_day - window_days + 1})
+        rows = cursor.fetchall()
+        conn.close()
+
+        columns = list(zip(*rows)) if rows else [()] * 8
+        ids = np.array(columns[0], dtype=np.int64)
+        stock = np.array(columns[3], dtype=np.float64)
+        unit_cost = np.array(columns[4], dtype=np.float64)
+        units = np.array(columns[5], dtype=np.float64)
+        revenue = np.array(columns[6], dtype=np.float64)
+        last_day = np.array(columns[7], dtype=np.int64)
+
+        # Cumulative revenue share in descending revenue order decides the class
+        order = np.argsort(-revenue, kind='stable')
+        total = revenue.sum()
+        cumulative = np.empty_like(revenue)
+        cumulative[order] = np.cumsum(revenue[order]) / total if total > 0 else 1.0
+        # A product belongs to A if the share before it is still under 80%, so the top seller is always A
+        share_before = cumulative - (revenue / total if total > 0 else 0)
+        abc = np.where(share_before < self.A_SHARE, 'A', np.where(share_before < self.B_SHARE, 'B', 'C'))
+        abc[revenue <= 0] = 'C'
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            turnover = np.where(stock > 0, units / stock, np.nan)
+            days_cover = np.where(units > 0, np.maximum(stock, 0) / (units / window_days), np.nan)
+        days_since_sold = np.where(last_day > 0, today_day - last_day, -1)
+        dead = (stock > 0) & ((last_day == 0) | (days_since_sold >= self.DEAD_STOCK_DAYS))
+
+        return {
+            'id': ids, 'name': list(columns[1]), 'category': list(columns[2]),
+            'abc': abc, 'revenue': revenue, 'share': cumulative, 'units': units,
+            'stock': stock, 'stock_value': np.maximum(stock, 0) * unit_cost,
+            'turnover': turnover, 'days_cover': days_cover,
+            'last_day': last_day, 'days_since_sold': days_since_sold, 'dead': dead,
+        }
+
+
+class AnalyticsThread(QThread):
+    """Thread for recomputing the analytics"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db, data_version):
+        super().__init__()
+        self.analytics = StockAnalytics(db)
+        self.data_version = data_version
+        self.result = None
+
+    def run(self):
+        try:
+            self.result = self.analytics.compute()
+            self.finished.emit(True, f"{len(self.result['id'])} products analysed")
+        except Exception as e:
+            self.finished.emit(False, f"Failed to compute stock analytics: {str(e)}")
+
+
+class AnalyticsModel(QAbstractTableModel):
+    """Read-only view over the analytics columns, sorted and filtered through an index array"""
+    HEADERS = ["Product", "Category", "Class", "Revenue (12m)", "Cum. Share", "Units Sold (12m)",
+               "Stock", "Stock Value", "Turnover", "Days of Cover", "Last Sold"]
+    SORT_KEYS = ['name', 'category', 'abc', 'revenue', 'share', 'units',
+                 'stock', 'stock_value', 'turnover', 'days_cover', 'last_day']
+    CLASS_COLORS = {'A': QColor(40, 167, 69), 'B': QColor(255, 193, 7), 'C': QColor(108, 117, 125)}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.columns = None
+        self.rows = np.zeros(0, dtype=np.int64)
+
+    def set_columns(self, columns, rows):
+        self.beginResetModel()
+        self.columns = columns
+        self.rows = rows
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        i = self.rows[index.row()]
+        key = self.SORT_KEYS[index.column()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            value = self.columns[key][i]
+            if key in ('name', 'category', 'abc'):
+                return str(value)
+            if key == 'share':
+                return f"{value * 100:.1f}%"
+            if key in ('turnover', 'days_cover'):
+                return "-" if np.isnan(value) else f"{value:,.1f}"
+            if key == 'last_day':
+                return (datetime.date.fromordinal(int(value) - JULIAN_DAY_OFFSET).strftime('%Y-%m-%d')
+                        if value > 0 else "Never")
+            if key in ('units', 'stock'):
+                return f"{value:,.0f}"
+            return f"{value:,.2f}"
+        if role == Qt.ItemDataRole.ForegroundRole:
+            if key == 'abc':
+                return self.CLASS_COLORS[self.columns['abc'][i]]
+            if key == 'last_day' and self.columns['dead'][i]:
+                return QColor(220, 53, 69)
+        if role == Qt.ItemDataRole.TextAlignmentRole and index.column() >= 3:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        if self.columns is None:
+            return
+        values = self.columns[self.SORT_KEYS[column]]
+        if isinstance(values, list):
+            values = np.array([str(v).lower() for v in values])
+        values = values[self.rows]
+        if values.dtype.kind == 'f':
+            values = np.where(np.isnan(values), -np.inf, values)
+        ranked = np.argsort(values, kind='stable')
+        if order == Qt.SortOrder.DescendingOrder:
+            ranked = ranked[::-1]
+        self.layoutAboutToBeChanged.emit()
+        self.rows = self.rows[ranked]
+        self.layoutChanged.emit()
+
+
+class StockAnalyticsWidget(QWidget):
+    """Analytics page. Results are cached against SQLite's data_version and recomputed in the background."""
+
+    FILTERS = ["All Products", "Class A", "Class B", "Class C", "Dead Stock"]
+
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+        self.analytics_thread = None
+        self.result = None
+        self.result_version = None
+        # data_version only changes for commits made by other connections, so watch from a dedicated one
+        self.version_conn = self.db.get_connection()
+        self.init_ui()
+
+    def init_ui(self):
+        layout = QVBoxLayout(self)
+
+        title_layout = QHBoxLayout()
+        title = QLabel("Stock Analytics")
+        title.setStyleSheet("font-size: 18pt; font-weight: bold; margin-bottom: 10px;")
+        title_layout.addWidget(title)
+        title_layout.addStretch()
+        title_layout.addWidget(QLabel("Show:"))
+        self.filter_combo = QComboBox()
+        self.filter_combo.addItems(self.FILTERS)
+        self.filter_combo.currentIndexChanged.connect(self.apply_filter)
+        title_layout.addWidget(self.filter_combo)
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.clicked.connect(self.refresh_analytics)
+        title_layout.addWidget(refresh_btn)
+        layout.addLayout(title_layout)
+
+        self.summary_label = QLabel("Open this page to calculate analytics.")
+        self.summary_label.setWordWrap(True)
+        layout.addWidget(self.summary_label)
+
+        self.model = AnalyticsModel(self)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.setAlternatingRowColors(True)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Interactive)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.setStyleSheet(UITheme.TABLE_STYLE)
+        layout.addWidget(self.table)
+
+    def data_version(self):
+        return self.version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh_analytics(self):
+        """Recompute in the background unless nothing has been written since the cached result"""
+        version = self.data_version()
+        if self.result is not None and version == self.result_version:
+            return
+        if self.analytics_thread and self.analytics_thread.isRunning():
+            return
+        self.summary_label.setText("Calculating analytics...")
+        self.analytics_thread = AnalyticsThread(self.db, version)
+        self.analytics_thread.finished.connect(self.on_analytics_computed)
+        self.analytics_thread.start()
+
+    def on_analytics_computed(self, success, message):
+        if not success:
+            self.summary_label.setText(message)
+            return
+        self.result = self.analytics_thread.result
+        self.result_version = self.analytics_thread.data_version
+        self.apply_filter()
+        # Data may have changed again while this ran
+        if self.isVisible():
+            self.refresh_analytics()
+
+    def apply_filter(self):
+        if self.result is None:
+            return
+        columns = self.result
+        choice = self.filter_combo.currentIndex()
+        if choice in (1, 2, 3):
+            rows = np.flatnonzero(columns['abc'] == "ABC"[choice - 1])
+        elif choice == 4:
+            rows = np.flatnonzero(columns['dead'])
+        else:
+            rows = np.arange(len(columns['id']))
+        self.model.set_columns(columns, rows)
+        header = self.table.horizontalHeader()
+        self.model.sort(header.sortIndicatorSection() if header.sortIndicatorSection() >= 0 else 3,
+                        header.sortIndicatorOrder() if header.sortIndicatorSection() >= 0 else Qt.SortOrder.DescendingOrder)
+
+        counts = {cls: int((columns['abc'] == cls).sum()) for cls in "ABC"}
+        total_revenue = columns['revenue'].sum()
+        a_revenue = columns['revenue'][columns['abc'] == 'A'].sum()
+        dead_value = columns['stock_value'][columns['dead']].sum()
+        self.summary_label.setText(
+            f"Class A: {counts['A']} products ({a_revenue / total_revenue * 100 if total_revenue else 0:.1f}% of revenue)   "
+            f"B: {counts['B']}   C: {counts['C']}   "
+            f"Dead stock (unsold {StockAnalytics.DEAD_STOCK_DAYS}+ days): {int(columns['dead'].sum())} products, "
+            f"Rs. {dead_value:,.2f} at cost"
+        )
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh_analytics()
+
+    def closeEvent(self, event):
+        if self.analytics_thread and self.analytics_thread.isRunning():
+            self.analytics_thread.wait()
+        self.version_conn.close()
+        event.accept()
+
+
+if __name__ == '__main__':
+    # Benchmark against a database path: python stock_analytics.py <database>
+    import sys
+    import time
+    from database import Database
+
+    db = Database(sys.argv[1]) if len(sys.argv) > 1 else Database()
+    started = time.perf_counter()
+    result = StockAnalytics(db).compute()
+    print(f"Analysed {len(result['id'])} products in {time.perf_counter() - started:.2f}s: "
+          f"A={int((result['abc'] == 'A').sum())} B={int((result['abc'] == 'B').sum())} "
+          f"C={int((result['abc'] == 'C').sum())} dead={int(result['dead'].sum())}")
@@ -0,0 +1,201 @@
+"""
+Stock Audit for Eagle Traders
+Ledger audit with corrections, stock checkpoints and as-of-date stock positions
+"""
+
+from PyQt6.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QTableWidget, QMessageBox,
+    QDateEdit, QCheckBox
+)
+from PyQt6.QtCore import QDate, QThread, pyqtSignal
+from notification_manager import show_success_notification, show_error_notification
+from stock import StockService
+from ui_factory import setup_professional_table, create_professional_table_item
+
+
+class StockAuditThread(QThread):
+    """Thread for auditing stock levels against the ledger and batches"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db):
+        super().__init__()
+        self.service = StockService(db)
+        self.findings = []
+
+    def run(self):
+        try:
+            self.findings = self.service.audit()
+            self.finished.emit(True, f"{len(self.findings)} products out of step")
+        except Exception as e:
+            self.finished.emit(False, f"Stock audit failed: {str(e)}")
+
+
+class StockCheckpointThread(QThread):
+    """Thread for writing any missing monthly stock checkpoints"""
+    finished = pyqtSignal(bool, str)
+
+    def __init__(self, db):
+        super().__init__()
+        self.service = StockService(db)
+
+    def run(self):
+        try:
+            written = self.service.write_checkpoints()
+            self.finished.emit(True, f"{written} stock checkpoints written")
+        except Exception as e:
+            self.finished.emit(False, f"Stock checkpoint failed: {str(e)}")
+
+
+class StockAuditDialog(QDialog):
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.audit_thread = None
+        self.setWindowTitle("Stock Audit")
+        self.resize(900, 550)
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("Compares stored stock levels with a replay of the stock ledger, and each batch with the\n"
+                                "ledger rows posted to it. Unbatched stock below zero means stock went out beyond its batches.\n"
+                                "The first divergent entry is the ledger row from which the replay stops agreeing."))
+
+        self.table = QTableWidget()
+        setup_professional_table(self.table, ["Product ID", "Product", "Stored", "Ledger", "Batches", "Batch Ledger", "Unbatched",
+                                          "First Divergent Entry"])
+        layout.addWidget(self.table)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        btn_layout = QHBoxLayout()
+        self.audit_btn = QPushButton("Run Audit")
+        self.audit_btn.clicked.connect(self.run_audit)
+        btn_layout.addWidget(self.audit_btn)
+        self.fix_btn = QPushButton("Post Corrections")
+        self.fix_btn.setEnabled(False)
+        self.fix_btn.clicked.connect(self.post_corrections)
+        btn_layout.addWidget(self.fix_btn)
+        btn_layout.addStretch()
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+        self.run_audit()
+
+    def run_audit(self):
+        if self.audit_thread and self.audit_thread.isRunning():
+            return
+        self.audit_btn.setEnabled(False)
+        self.fix_btn.setEnabled(False)
+        self.status_label.setText("Auditing stock...")
+        self.audit_thread = StockAuditThread(self.db)
+        self.audit_thread.finished.connect(self.on_audit_finished)
+        self.audit_thread.start()
+
+    def on_audit_finished(self, success, message):
+        self.audit_btn.setEnabled(True)
+        if not success:
+            self.status_label.setText(message)
+            show_error_notification("Stock Audit", message)
+            return
+
+        findings = self.audit_thread.findings
+        self.table.setRowCount(len(findings))
+        for row, (product_id, name, stored, ledger, batches, batch_ledger, unbatched, entry) in enumerate(findings):
+            values = [product_id, name, stored, ledger] + ["-" if value is None else value
+                                                           for value in (batches, batch_ledger, unbatched)] + [entry or "-"]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, create_professional_table_item(str(value)))
+        self.fix_btn.setEnabled(bool(findings))
+        self.status_label.setText("Stock levels, batches and the stock ledger agree." if not findings else message)
+
+    def post_corrections(self):
+        findings = self.audit_thread.findings
+        reply = QMessageBox.question(
+            self, "Post Corrections",
+            "Post adjustment entries so each batch's ledger rows match its count, "
+            "then rebuild stored stock levels from the ledger?\n\nUnbatched stock is left as it is.",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No)
+        if reply != QMessageBox.StandardButton.Yes:
+            return
+        try:
+            posted = self.audit_thread.service.post_corrections(findings)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to post corrections: {str(e)}")
+            return
+        show_success_notification("Stock Audit", f"Posted {posted} adjustments and rebuilt stock levels")
+        self.run_audit()
+
+    def reject(self):
+        if self.audit_thread and self.audit_thread.isRunning():
+            self.audit_thread.wait()
+        super().reject()
+
+
+class StockAsOfDialog(QDialog):
+    """Stock on hand at the end of a chosen day, per product or per batch"""
+
+    def __init__(self, db, parent=None):
+        super().__init__(parent)
+        self.db = db
+        self.service = StockService(db)
+        self.setWindowTitle("Stock As Of Date")
+        self.resize(800, 550)
+
+        layout = QVBoxLayout(self)
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("On hand at end of:"))
+        self.date_edit = QDateEdit()
+        self.date_edit.setCalendarPopup(True)
+        self.date_edit.setDate(QDate.currentDate())
+        filter_layout.addWidget(self.date_edit)
+        self.by_batch_check = QCheckBox("By batch")
+        filter_layout.addWidget(self.by_batch_check)
+        load_btn = QPushButton("Load")
+        load_btn.clicked.connect(self.load_position)
+        filter_layout.addWidget(load_btn)
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
+
+        self.table = QTableWidget()
+        setup_professional_table(self.table, ["Product ID", "Product", "Batch", "Quantity"], ['id', 'text', 'text', 'numeric'])
+        layout.addWidget(self.table)
+
+        self.status_label = QLabel("")
+        layout.addWidget(self.status_label)
+
+        self.load_position()
+
+    def load_position(self):
+        date = self.date_edit.date().toString("yyyy-MM-dd")
+        by_batch = self.by_batch_check.isChecked()
+        try:
+            position = self.service.as_of(date, by_batch=by_batch)
+            conn = self.db.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name FROM Products")
+            names = dict(cursor.fetchall())
+            cursor.execute("SELECT id, batch_number FROM ProductBatches")
+            batch_numbers = dict(cursor.fetchall())
+            conn.close()
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to load stock position: {str(e)}")
+            return
+
+        rows = []
+        for key, quantity in position.items():
+            product_id, batch_id = key if by_batch else (key, None)
+            batch = (batch_numbers.get(batch_id) or "-") if batch_id is not None else "-"
+            rows.append((product_id, names.get(product_id, f"#{product_id}"), batch, quantity))
+        rows.sort(key=lambda row: (row[1].lower(), row[2]))
+
+        self.table.setSortingEnabled(False)
+        self.table.setRowCount(len(rows))
+        for row, (product_id, name, batch, quantity) in enumerate(rows):
+            self.table.setItem(row, 0, create_professional_table_item(product_id, 'id'))
+            self.table.setItem(row, 1, create_professional_table_item(name, 'text'))
+            self.table.setItem(row, 2, create_professional_table_item(batch, 'text'))
+            self.table.setItem(row, 3, create_professional_table_item(quantity, 'numeric'))
+        self.table.setSortingEnabled(True)
+        self.status_label.setText(f"{len(rows)} lines, total {sum(row[3] for row in rows)} units")
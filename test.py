@@ -1,4 +1,14 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+from PyQt6.QtWidgets import QApplication, QMessageBox
+from database import Database
+import sales_pos
+from inventory_management import StockLedgerDialog
+from stock import StockService, record_stock_movement, take_from_batches
 from product_management import ProductManagement  # But it's a widget, hard to test
 
 # For math logic, create a separate function
@@ -16,5 +26,127 @@ class TestPricing(unittest.TestCase):
     def test_import_pricing(self):
         self.assertEqual(calculate_import_price(100, 15, 20), 135)
 
+class TestCheckout(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        self.db = Database(os.path.join(tempfile.mkdtemp(), 'test.db'))
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO Products (name, unit_price) VALUES ('Widget', 100)")
+        self.product_id = cursor.lastrowid
+        conn.commit()
+        conn.close()
+
+    def test_sold_cart_leaves_journal(self):
+        pos = sales_pos.SalesPOS(self.db)
+        pos.cart.append([self.product_id, 'Widget', 2, 100.0, 0, 200.0])
+        pos.buyer_name_edit.setCurrentText("Test Buyer")
+        pos.journal.mark(pos.current_cart)
+        pos.journal.flush()
+        cart_id = pos.current_cart['id']
+
+        payment = mock.Mock()
+        payment.return_value.exec.return_value = 1
+        payment.return_value.get_amount_received.return_value = 200.0
+        # Stop right after the commit, as a crash would, before the cart is cleared on screen
+        with mock.patch.object(sales_pos, 'PaymentDialog', payment), \
+                mock.patch.object(QMessageBox, 'information'), \
+                mock.patch.object(pos, 'generate_bill'), \
+                mock.patch.object(pos, 'close_current_cart'):
+            pos.checkout()
+
+        conn = self.db.get_connection()
+        row = conn.execute("SELECT buyer_name, items FROM HeldCarts WHERE id = ?", (cart_id,)).fetchone()
+        sales = conn.execute("SELECT COUNT(*) FROM SalesTransactions").fetchone()[0]
+        conn.close()
+        self.assertEqual(sales, 1)
+        self.assertEqual(row, ('', '[]'))
+
+    def test_return_refunds_promoted_price(self):
+        # Three for the price of two: listed at 100 each, charged 200 for the line
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO SalesTransactions (buyer_name, total_amount, status) VALUES ('Test Buyer', 200, 'completed')")
+        sale_id = cursor.lastrowid
+        cursor.execute("""
+            INSERT INTO SalesItems (sale_id, product_id, quantity, unit_price, total_price, discount_percent)
+            VALUES (?, ?, 3, 100, 200, 0)
+        """, (sale_id, self.product_id))
+        conn.commit()
+        conn.close()
+
+        dialog = sales_pos.ReturnDialog(self.db)
+        dialog.load_sale_items(sale_id)
+        dialog.update_return_qty(0, 1)
+        self.assertAlmostEqual(dialog.return_items[0]['total'], 66.67)
+        dialog.update_return_qty(0, 3)
+        self.assertEqual(dialog.return_items[0]['total'], 200)
+
+class TestStockAudit(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        # One batch of 5, received against the batch
+        self.db = Database(os.path.join(tempfile.mkdtemp(), 'test.db'))
+        self.service = StockService(self.db)
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO Products (name, unit_price) VALUES ('Syrup', 100)")
+        self.product_id = cursor.lastrowid
+        cursor.execute("""
+            INSERT INTO ProductBatches (product_id, batch_number, quantity, expiry_month, expiry_year)
+            VALUES (?, 'B1', 5, 1, 2031)
+        """, (self.product_id,))
+        self.batch_id = cursor.lastrowid
+        record_stock_movement(cursor, self.product_id, 5, 'Received', batch_id=self.batch_id)
+        conn.commit()
+        conn.close()
+
+    def post(self, post):
+        conn = self.db.get_connection()
+        post(conn.cursor())
+        conn.commit()
+        conn.close()
+
+    def test_unbatched_adjustment_is_not_a_discrepancy(self):
+        self.post(lambda cursor: record_stock_movement(cursor, self.product_id, 10, 'Manual adjustment'))
+        self.assertEqual(self.service.audit(), [])
+        self.assertEqual(self.service.on_hand(self.product_id), 15)
+
+    def test_oversale_is_reported_not_corrected(self):
+        self.post(lambda cursor: take_from_batches(cursor, self.product_id, 7, 'sale', 1))
+        findings = self.service.audit()
+        self.assertEqual([finding[:7] for finding in findings], [(self.product_id, 'Syrup', -2, -2, 0, 0, -2)])
+        self.assertEqual(self.service.post_corrections(findings), 0)
+        self.assertEqual(self.service.on_hand(self.product_id), -2)
+
+    def test_batch_count_is_corrected_on_its_batch(self):
+        self.post(lambda cursor: cursor.execute("UPDATE ProductBatches SET quantity = 8 WHERE id = ?", (self.batch_id,)))
+        self.post(lambda cursor: record_stock_movement(cursor, self.product_id, 10, 'Manual adjustment'))
+        findings = self.service.audit()
+        self.assertEqual([finding[:7] for finding in findings], [(self.product_id, 'Syrup', 15, 15, 8, 5, 10)])
+        self.assertEqual(self.service.post_corrections(findings), 1)
+        self.assertEqual(self.service.audit(), [])
+        self.assertEqual(self.service.on_hand(self.product_id), 18)
+
+    def test_ledger_viewer_counts_negative_adjustment_as_out(self):
+        self.post(lambda cursor: cursor.execute("""
+            INSERT INTO StockLedger (product_id, movement_type, quantity, reason) VALUES (?, 'adjustment', -3, 'Count')
+        """, (self.product_id,)))
+        dialog = StockLedgerDialog(self.db)
+        dialog.PAGE_SIZE = 1  # Every row on its own page, so the totals also carry across pages
+        dialog.from_date.setDate(dialog.from_date.date().addYears(-1))
+        dialog.product_edit.setText('Syrup')
+        dialog.reload()
+        dialog.next_page()
+        totals = [dialog.ledger_table.item(0, column).text() for column in (6, 7, 8)]
+        self.assertEqual([float(total.replace(',', '')) for total in totals], [5, 3, 2])
+        self.assertEqual(self.service.on_hand(self.product_id), 2)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file